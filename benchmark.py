@@ -0,0 +1,286 @@
+"""
+benchmark of the server pipeline on synthetic market data (no Source 1 / Source 2 calls)
+
+usage: python benchmark.py --tickers 50 --bars 2000 --sessions 20 --output benchmark.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime as dt
+import numpy as np
+import pandas as pd
+import server
+import client
+
+
+class synthetic_source1:
+    """
+    stand-in for the Source 1 http session: answers every query with a synthetic intraday csv for the ticker
+
+    # bars are every "sampling" minutes from 4:00 to 20:00 on weekdays, the latest on top like Source 1. Prices are
+    # random walks, reproducible for a given seed and ticker
+
+    :param bars: number of bars per ticker
+    :param sampling: minutes between bars
+    :param seed: random seed
+    """
+
+    class response:
+        def __init__(self, content):
+            self.content = content
+
+    def __init__(self, bars, sampling=5, seed=0):
+        self.bars = bars
+        self.sampling = sampling
+        self.seed = seed
+        self.times = self.trading_times()
+        self.contents = {}  # ticker: csv bytes, generated once
+
+    def trading_times(self):
+        """
+        :return: time strings of the bars, latest first
+        """
+
+        times = []
+        day = pd.Timestamp('2023-01-02')
+        while len(times) < self.bars:
+            if day.weekday() < 5:
+                times += list(pd.date_range(day + pd.Timedelta(hours=4), day + pd.Timedelta(hours=20),
+                                            freq='{}min'.format(self.sampling)))
+            day += pd.Timedelta(days=1)
+
+        return pd.DatetimeIndex(times[:self.bars][::-1]).strftime('%Y-%m-%d %H:%M:%S')
+
+    def csv(self, ticker):
+        """
+        :return: Source 1 csv content of one ticker
+        """
+
+        if ticker not in self.contents:
+            rng = np.random.default_rng([self.seed, sum(map(ord, ticker))])
+            close = 100 + np.cumsum(rng.normal(0, 0.3, self.bars))
+            df = pd.DataFrame({'time': self.times, 'open': close, 'high': close, 'low': close, 'close': close,
+                               'volume': 1000})
+            self.contents[ticker] = df.to_csv(index=False, float_format='%.4f').encode()
+
+        return self.contents[ticker]
+
+    def get(self, url):
+        ticker = url.split('symbol=')[1].split('&')[0]
+
+        return self.response(self.csv(ticker))
+
+
+class benchmark:
+    """
+    time every stage of the server pipeline and run a load test against the tcp server
+
+    :param tickers: number of synthetic tickers
+    :param bars: number of bars per ticker
+    :param repeat: runs of each stage (the best and the median are recorded)
+    """
+
+    def __init__(self, tickers, bars, repeat=3, seed=0):
+        self.tickers = ['T{:04d}'.format(i) for i in range(tickers)]
+        self.bars = bars
+        self.repeat = repeat
+        self.source1 = synthetic_source1(bars, seed=seed)
+        self.stages = {}
+
+    def time_stage(self, name, function):
+        """
+        run one stage "repeat" times and record its timings
+
+        :return: result of the last run
+        """
+
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+        self.stages[name] = {'best': min(timings), 'median': float(np.median(timings))}
+        print('{:<24} best {:.4f}s  median {:.4f}s'.format(name, min(timings), np.median(timings)))
+
+        return result
+
+    def make_database(self):
+        """
+        :return: database reading Source 1 from the synthetic source
+        """
+
+        db = server.database(list(self.tickers), 5, fetch_workers=8)
+        db.session = self.source1
+
+        return db
+
+    def run_stages(self, queries=1000):
+        """
+        time fetch_price_historical (parsing/merging), momentum_strategy, calc_pnl, combine_df, query_data and the
+        csv save
+        """
+
+        # csv contents are generated once, outside the timings
+        for ticker in self.tickers:
+            self.source1.csv(ticker)
+
+        def fetch():
+            db = self.make_database()
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.fetch_price_historical()
+            return db
+        db = self.time_stage('fetch_price_historical', fetch)
+        df_price_raw = db.get_price(True)
+
+        strategy = server.trading_strategy()
+        df_signal, df_price = self.time_stage('momentum_strategy', lambda: strategy.momentum_strategy(df_price_raw))
+        df_pnl = self.time_stage('calc_pnl', lambda: strategy.calc_pnl(df_signal, df_price))
+
+        # same preparation as genReport.generate_report
+        df_price_report = df_price.loc[df_pnl.index].round(2)
+        df_signal_report = df_signal.loc[df_pnl.index]
+        df_pnl_report = df_pnl.round(2)
+        df_report = self.time_stage('combine_df', lambda: server.genReport.combine_df(
+            df_pnl_report, df_signal_report, df_price_report))
+
+        report = server.genReport()
+        report_times, report_offsets = report.index_report(df_report)
+        rng = np.random.default_rng(0)
+        query_times = pd.to_datetime(rng.choice(df_report['datetime'].values, queries))
+
+        def query():
+            for query_time in query_times:
+                report.query_data(df_report, query_time, report_times, report_offsets)
+        self.time_stage('query_data x{}'.format(queries), query)
+
+        with tempfile.TemporaryDirectory() as directory:
+            writer = server.report_writer(directory)
+            self.time_stage('csv save', lambda: writer.save(df_report))
+
+        self.stages['report rows'] = len(df_report)
+
+    def start_server(self, port, mode):
+        """
+        start the tcp server (thread or asyncio mode) on the synthetic price database
+        """
+
+        comm = server.communication()
+        comm.server_parser.port = port
+        comm.server_parser.max_connections = 10000
+        comm.server_parser.idle_timeout = 0
+        comm.server_parser.workers = 8
+        comm.controller = server.controller(list(self.tickers), 5, ready_timeout=60)
+        comm.controller.database.session = self.source1
+        comm.subscription_hub = server.subscription_hub(comm.controller.report_store, comm.client_parser)
+        comm.controller.database.listeners.append(comm.subscription_hub)
+        comm.controller.update_price()
+        comm.controller.ensure_report()
+
+        target = comm.build_tcp_async if mode == 'asyncio' else comm.build_tcp
+        threading.Thread(target=target, daemon=True).start()
+
+        # wait for the server socket
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                return comm
+            except OSError:
+                time.sleep(0.05)
+
+    @staticmethod
+    def session(port, commands, latencies, errors):
+        """
+        one client.py-style session (frame protocol): send each command and wait for its reply
+        """
+
+        try:
+            session = client.communication()
+            session.sock = socket.create_connection(('127.0.0.1', port))
+            for command in commands:
+                start = time.perf_counter()
+                session.send_request(command)
+                reply = session.read_reply()
+                latencies.append(time.perf_counter() - start)
+                if 'error' in reply:
+                    errors.append(reply['error'])
+            session.sock.close()
+        except Exception as e:
+            errors.append(str(e))
+
+    def run_load(self, port, mode, sessions, requests_per_session):
+        """
+        drive concurrent sessions against the server and record throughput and latency percentiles
+        """
+
+        with contextlib.redirect_stdout(io.StringIO()):  # the server prints every client input
+            self.start_server(port, mode)
+
+            commands = ['data', 'data 2023-01-05-12:00'] * (requests_per_session // 2) + ['data'] * (
+                requests_per_session % 2)
+            latencies, errors = [], []
+            threads = [threading.Thread(target=self.session, args=(port, commands, latencies, errors))
+                       for _ in range(sessions)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        latencies = np.array(latencies) * 1000
+        load = {'mode': mode, 'sessions': sessions, 'requests': len(latencies), 'errors': len(errors),
+                'seconds': elapsed, 'throughput': len(latencies) / elapsed if elapsed else 0}
+        for name, q in (('p50_ms', 50), ('p90_ms', 90), ('p99_ms', 99), ('max_ms', 100)):
+            load[name] = float(np.percentile(latencies, q)) if len(latencies) else None
+        print('load test ({} mode): {} requests from {} sessions in {:.2f}s, {:.0f} req/s, p50 {:.2f}ms, '
+              'p99 {:.2f}ms, {} errors'.format(mode, load['requests'], sessions, elapsed, load['throughput'],
+                                               load['p50_ms'] or 0, load['p99_ms'] or 0, load['errors']))
+
+        return load
+
+    @staticmethod
+    def git_commit():
+        """
+        :return: current git commit of the repository (None outside a git checkout)
+        """
+
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except Exception:
+            return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickers', type=int, default=50)  # number of synthetic tickers
+    parser.add_argument('--bars', type=int, default=2000)  # bars per ticker
+    parser.add_argument('--repeat', type=int, default=3)  # runs of each stage
+    parser.add_argument('--queries', type=int, default=1000)  # as-of queries timed
+    parser.add_argument('--sessions', type=int, default=20)  # concurrent client sessions of the load test, 0 to skip
+    parser.add_argument('--requests', type=int, default=50)  # requests per session
+    parser.add_argument('--mode', type=str, default='thread', choices=['thread', 'asyncio'])  # server mode
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='benchmark.json')
+    args = parser.parse_args()
+
+    bench = benchmark(args.tickers, args.bars, args.repeat, args.seed)
+    bench.run_stages(args.queries)
+    load = bench.run_load(args.port, args.mode, args.sessions, args.requests) if args.sessions else None
+
+    result = {'commit': bench.git_commit(), 'time': dt.now().isoformat(timespec='seconds'),
+              'tickers': args.tickers, 'bars': args.bars, 'repeat': args.repeat, 'stages': bench.stages,
+              'load': load}
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print('results saved to {}'.format(args.output))
@@ -3,18 +3,33 @@ import sys
 import argparse
 import json
 import re
+import struct
+import threading
+import queue
 
 class communication:
     """
     get client input, send request to server and receive results from server
+
+    # frame protocol (default): each request/reply is a 4-byte big-endian length followed by a json payload.
+    # Requests carry an id, so several commands separated by ';' on one line are sent at once (pipelined) and
+    # their replies are matched by id. After 'subscribe <tickers>' the server also pushes the report rows of every
+    # new bar, these frames have no id and are printed as they arrive. The original line protocol is available
+    # with --protocol line
     """
 
+    frame_header = struct.Struct('>I')
+
     def __init__(self):
         self.server = None
         self.parser = argparse.ArgumentParser()
         self.args = None
         self.server_address = None
         self.sock = None
+        self.protocol = None
+        self.next_id = 0
+        self.buffer = bytearray()  # bytes received and not yet decoded
+        self.replies = queue.Queue()  # replies received by the reader thread
 
     def get_arguments(self):
         """
@@ -22,8 +37,10 @@ class communication:
         """
 
         self.parser.add_argument('--server', type=str, default='127.0.0.1:8000')
+        self.parser.add_argument('--protocol', type=str, default='frame', choices=['frame', 'line'])
         self.args = self.parser.parse_args()
         self.server = self.args.server.split(':')
+        self.protocol = self.args.protocol
 
     def build_tcp(self):
         """
@@ -50,11 +67,116 @@ class communication:
             print("failed to connect with server")
             sys.exit(1)
 
-        self.tcp_interaction()
+        if self.protocol == 'line':
+            self.tcp_interaction()
+        else:
+            self.tcp_interaction_frame()
+
+    def send_request(self, command):
+        """
+        send one command to the server as a frame
+
+        :return: id of the request
+        """
+
+        self.next_id += 1
+        body = json.dumps({'id': self.next_id, 'cmd': command}).encode()
+        self.sock.sendall(self.frame_header.pack(len(body)) + body)
+
+        return self.next_id
+
+    def read_reply(self):
+        """
+        receive the next reply frame from the server
+        """
+
+        while True:
+            if len(self.buffer) >= self.frame_header.size:
+                (length,) = self.frame_header.unpack_from(self.buffer)
+                end = self.frame_header.size + length
+                if len(self.buffer) >= end:
+                    reply = json.loads(bytes(self.buffer[self.frame_header.size:end]).decode())
+                    del self.buffer[:end]
+                    return reply
+
+            bdata = self.sock.recv(65536)
+            if not bdata:
+                raise Exception('connection closed by server')
+            self.buffer += bdata
+
+    def receive_frames(self):
+        """
+        reader thread: print pushed frames right away and hand the replies to the interaction loop
+        """
+
+        try:
+            while True:
+                frame = self.read_reply()
+                if 'push' in frame:
+                    self.print_push(frame)
+                else:
+                    self.replies.put(frame)
+        except Exception as e:  # connection closed
+            self.replies.put(e)
+
+    @staticmethod
+    def print_push(push):
+        """
+        print the report rows pushed for a new bar
+        """
+
+        print('[{}]'.format(push['datetime']))
+        for i in push['rows']:
+            print(i)
+
+    @staticmethod
+    def print_reply(reply):
+        """
+        print the result (or error) of one reply
+        """
+
+        if 'error' in reply:
+            print(reply['error'])
+        elif isinstance(reply['result'], list):
+            for i in reply['result']:  # print result received from server
+                print(i)
+        else:
+            print(reply['result'])
+
+    def tcp_interaction_frame(self):
+        """
+        interact with server using the frame protocol
+        """
+
+        threading.Thread(target=self.receive_frames, daemon=True).start()
+
+        while True:  # client can continuously send inputs
+            try:
+                message = input()  # store client input
+
+                # send every command of the line without waiting for replies
+                commands = [command.strip() for command in message.split(';') if command.strip()]
+                request_ids = [self.send_request(command) for command in commands]
+
+                # collect the replies (in any order) and print them in the order of the commands
+                replies = {}
+                while len(replies) < len(request_ids):
+                    reply = self.replies.get()
+                    if isinstance(reply, Exception):
+                        raise reply
+                    replies[reply['id']] = reply
+                for request_id in request_ids:
+                    self.print_reply(replies[request_id])
+
+            except Exception as e:
+                print(e)
+                sys.exit(1)
+            except KeyboardInterrupt:
+                sys.exit(0)
 
     def tcp_interaction(self):
         """
-        interact with server
+        interact with server using the line protocol
         """
 
         while True:  # client can continuously send inputs
@@ -3,12 +3,24 @@
 """
 
 import socket  # establish connection between two processes
+import asyncio  # single event loop server mode
 import time
 import argparse  # parse cmd arguments
 import threading  # multi-threading
 import re
+import struct  # binary frame header
 import sys
-import csv
+import io
+import sqlite3  # persistent price cache
+import hashlib  # consistent hashing of tickers onto shards
+import subprocess  # worker server processes of the coordinator
+import atexit
+import signal  # stop the coordinator's workers on SIGTERM
+from collections import deque, OrderedDict
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+import multiprocessing
+from multiprocessing import shared_memory  # sharded strategy computation
 import pandas as pd
 import numpy as np
 from datetime import datetime as dt
@@ -17,7 +29,206 @@ import json  # encode/decode
 import requests  # v2.28.2
 import finnhub  # v2.4.15
 
-lock = threading.Lock()
+class histogram:
+    """
+    latency histogram with fixed log-scale buckets (1 microsecond to ~2 minutes, doubling)
+
+    # recording is one bisect and a few additions, percentiles are estimated from the buckets (upper bound of the
+    # bucket the percentile falls in, capped at the max observed)
+    """
+
+    bounds = [1e-6 * 2 ** i for i in range(28)]  # seconds, upper bounds of the buckets; one more for the overflow
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect_left(self.bounds, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        """
+        :param q: percentile in [0, 100]
+        :return: estimated value in seconds (0 if nothing recorded)
+        """
+
+        with self.lock:
+            counts, count, largest = list(self.counts), self.count, self.max
+        if not count:
+            return 0.0
+        rank, cumulative = q / 100 * count, 0
+        for i, n in enumerate(counts):
+            cumulative += n
+            if cumulative >= rank and n:
+                return min(self.bounds[i], largest) if i < len(self.bounds) else largest
+
+        return largest
+
+class metrics_registry:
+    """
+    per stage latency histograms of the server hot paths, exposed by the "stats" command and as a Prometheus text
+    file
+
+    usage: with metrics.time('stage'): ...  (a no-op when disabled)
+    """
+
+    class stage_timer:
+        __slots__ = ('histogram', 'start')
+
+        def __init__(self, histogram):
+            self.histogram = histogram
+
+        def __enter__(self):
+            self.start = time.perf_counter()
+            return self
+
+        def __exit__(self, *exc):
+            self.histogram.observe(time.perf_counter() - self.start)
+
+    class no_timer:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = threading.Lock()  # guards the stage dict
+        self.disabled_timer = self.no_timer()
+
+    def histogram(self, stage):
+        """
+        :return: histogram of the stage (created on first use)
+        """
+
+        hist = self.histograms.get(stage)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(stage, histogram())
+
+        return hist
+
+    def time(self, stage):
+        """
+        :return: context manager recording the time spent in its block
+        """
+
+        if not self.enabled:
+            return self.disabled_timer
+
+        return self.stage_timer(self.histogram(stage))
+
+    def observe(self, stage, seconds):
+        if self.enabled:
+            self.histogram(stage).observe(seconds)
+
+    def summary(self):
+        """
+        :return: lines "stage: count, p50, p99, max, total" for the stats command
+        """
+
+        with self.lock:  # stages created meanwhile by other threads would change the dict during the iteration
+            histograms = sorted(self.histograms.items())
+        lines = []
+        for stage, hist in histograms:
+            lines.append('{}: count {}, p50 {:.3f}ms, p99 {:.3f}ms, max {:.3f}ms, total {:.3f}s'.format(
+                stage, hist.count, hist.percentile(50) * 1000, hist.percentile(99) * 1000, hist.max * 1000, hist.sum))
+        if not lines:
+            lines.append('no stats recorded' if self.enabled else 'instrumentation is off')
+
+        return lines
+
+    def prometheus_text(self):
+        """
+        :return: all histograms in the Prometheus text exposition format
+        """
+
+        lines = ['# HELP server_stage_seconds time spent in each server stage',
+                 '# TYPE server_stage_seconds histogram']
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        for stage, hist in histograms:
+            with hist.lock:
+                counts, count, total = list(hist.counts), hist.count, hist.sum
+            cumulative = 0
+            for bound, n in zip(hist.bounds, counts):
+                cumulative += n
+                lines.append('server_stage_seconds_bucket{{stage="{}",le="{:g}"}} {}'.format(stage, bound, cumulative))
+            lines.append('server_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(stage, count))
+            lines.append('server_stage_seconds_sum{{stage="{}"}} {}'.format(stage, total))
+            lines.append('server_stage_seconds_count{{stage="{}"}} {}'.format(stage, count))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        write the Prometheus text to a file (replaced atomically, so a scraper never reads a partial file)
+        """
+
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(path + '.tmp', path)
+
+    def dump_thread(self, path, interval):
+        """
+        keep dumping the Prometheus text every "interval" seconds in a daemon thread
+        """
+
+        def dump():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except Exception as e:
+                    print('failed to dump stats: {}'.format(e))
+
+        thread_dump = threading.Thread(target=dump)
+        thread_dump.daemon = True
+        thread_dump.start()
+
+class timed_lock:
+    """
+    lock recording how long callers wait to acquire it (stage "lock_wait <name>")
+    """
+
+    def __init__(self, name):
+        self.name = 'lock_wait ' + name
+        self.inner = threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not metrics.enabled:
+            return self.inner.acquire(blocking, timeout)
+        start = time.perf_counter()
+        acquired = self.inner.acquire(blocking, timeout)
+        metrics.observe(self.name, time.perf_counter() - start)
+
+        return acquired
+
+    def release(self):
+        self.inner.release()
+
+    def locked(self):
+        return self.inner.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+metrics = metrics_registry()  # hot path instrumentation shared by every class
+lock = timed_lock('database')
 
 class communication:
     """
@@ -27,8 +238,12 @@ class communication:
     """
 
     def __init__(self):
-        self.lock = lock
         self.controller = None
+        self.coordinator = None  # routes the client inputs to the worker servers in coordinator mode
+        self.executor = None  # thread pool for client tasks in asyncio mode
+        self.n_connections = 0  # open client connections in asyncio mode
+        self.refuse_wait = 1  # seconds a refused client has to send its first bytes (see async_refuse)
+        self.subscription_hub = None  # pushes new report rows to subscribed clients
         self.server_parser = server_parser()  # parse server inputs and create socket for the server
         self.client_parser = client_parser()  # parse clients inputs and send result back to clients
 
@@ -40,12 +255,36 @@ class communication:
         # parse server arguments
         port, tickers, sampling_period = self.server_parser.get_arguments()
 
+        # stage timings (stats command and Prometheus text file)
+        metrics.enabled = self.server_parser.instrument
+        if self.server_parser.stats_file:
+            metrics.dump_thread(self.server_parser.stats_file, self.server_parser.stats_interval)
+
+        # coordinator mode: the tickers are served by worker servers, this process only routes the client inputs
+        if self.server_parser.shards:
+            self.coordinator = coordinator(tickers, self.server_parser.shards, self.server_parser.shard_port,
+                                           self.server_parser.worker_arguments(), self.client_parser)
+            self.coordinator.subscription_hub = self.subscription_hub = subscription_hub(None, self.client_parser)
+            self.coordinator.start()
+            return
+
         # create controller object
-        self.controller = controller(tickers, sampling_period)
+        self.controller = controller(tickers, sampling_period, self.server_parser.fetch_workers,
+                                     self.server_parser.source1_rate_limit, self.server_parser.quote_timeout,
+                                     self.server_parser.ready_timeout, self.server_parser.cache_path,
+                                     self.server_parser.cache_max_age, self.server_parser.report_format,
+                                     self.server_parser.strategy_workers, self.server_parser.report_layout,
+                                     self.server_parser.strategies, self.server_parser.retention_hot,
+                                     self.server_parser.retention_warm, self.server_parser.warm_sampling,
+                                     self.server_parser.query_cache)
+
+        # push every new bar's report rows to subscribed clients
+        self.subscription_hub = subscription_hub(self.controller.report_store, self.client_parser)
+        self.controller.database.listeners.append(self.subscription_hub)
 
         # run server
         self.controller.update_price()  # constantly updating stock price in database class
-        self.controller.generate_report(latest=False, save=True)  # generate the report according to price and save to local
+        self.controller.generate_report_when_ready()  # generate the report according to price and save to local
 
     def build_tcp(self):
         """
@@ -76,87 +315,360 @@ class communication:
     def tcp_interaction(self, connection):
         """
         perform task according to client's inputs
+
+        # clients using length-prefixed frames are recognized by the first byte (frame headers start with a zero
+        # byte); anything else is served with the original line protocol
+        """
+
+        bdata = connection.recv(4096)
+        if not bdata:  # client disconnected
+            connection.close()
+        elif self.client_parser.is_frame(bdata):
+            self.tcp_interaction_frame(connection, bdata)
+        else:
+            self.tcp_interaction_line(connection, bdata)
+
+    def tcp_interaction_line(self, connection, bdata):
+        """
+        perform task according to client's inputs sent with the line protocol (one input per recv)
         """
 
         while True:  # server can continuously process on client's other inputs
             try:
                 # parse client input and store as string
-                client_input = self.client_parser.get_arguments(connection)
+                client_input = self.client_parser.decode_input(bdata)
+                print('client input: {}'.format(client_input))
+
+                # perform the task and send the result back to clients
+                with metrics.time('request'):
+                    result = self.process_input(client_input)
+                with metrics.time('socket_send'):
+                    self.client_parser.send_client(connection, result)
 
-                # case 1: clients input a data to request record from report
-                if re.match(r"^data \d\d\d\d-\d\d-\d\d-\d\d:\d\d$", client_input):  # ^ indicates it is beginning of the string
-                    # query records from report
-                    query = self.client_query_data(client_input)
+                bdata = connection.recv(4096)
+                if not bdata:  # client disconnected
+                    connection.close()
+                    break
+
+            except Exception as e:  # something wrong when interacting with clients
+                # send error message back to clients
+                msg = str(e)
+                self.client_parser.send_client(connection, msg)
 
-                    # send query results back to clients
-                    self.client_parser.send_client(connection, query)
+                connection.close()  # close current connection with the client
+                break
 
-                # case 2: if datetime is not specified by client, just return latest records
-                elif re.match(r"^data$", client_input):  # & indicates this is the end of string
-                    # query records from report
-                    query = self.client_query_data(client_input, False)
+    def tcp_interaction_frame(self, connection, bdata):
+        """
+        perform task according to client's requests sent as frames. Clients can pipeline requests; every reply
+        carries the id of its request
+        """
 
-                    # send query results back to clients
-                    self.client_parser.send_client(connection, query)
+        buffer = bytearray(bdata)
+        send_lock = threading.Lock()  # replies and pushes (sent by the subscription threads) share the socket
+        subscriptions = []  # subscriptions of this client
 
-                # case 3: clients ask to delete one ticker
-                elif re.match(r"^delete .", client_input):  # . means there can have any characters
-                    self.lock.acquire()  # lock for modifying
+        def send(frame):
+            with send_lock, metrics.time('socket_send'):
+                connection.sendall(frame)
 
-                    # delete tickers
-                    msg = self.client_delete_tickers(client_input)
+        def start_sender(client_subscription):
+            threading.Thread(target=client_subscription.run, args=(send,), daemon=True).start()
 
-                    # send message back to clients
-                    self.client_parser.send_client(connection, msg)
+        try:
+            while True:
+                for request in self.client_parser.split_frames(buffer):
+                    reply = self.process_request(request, subscriptions, start_sender)
+                    send(self.client_parser.encode_frame(reply))
+
+                bdata = connection.recv(65536)
+                if not bdata:  # client disconnected
+                    break
+                buffer += bdata
+        except Exception as e:  # broken frame or connection
+            print('Client connection closed: {}'.format(e))
+        self.client_unsubscribe(subscriptions)
+        connection.close()
+
+    def process_request(self, request, subscriptions=None, start_sender=None, loop=None):
+        """
+        perform the task of one framed request
 
-                    self.lock.release()
+        :param request: dict with the request 'id' and the client input 'cmd'
+        :param subscriptions: list of the client's subscriptions (for subscribe/unsubscribe)
+        :param start_sender: function starting the sender of a new subscription
+        :param loop: event loop of the client (asyncio mode)
+        :return: reply dict with the request 'id' and either the 'result' or an 'error' message
+        """
 
-                # case 4: clients ask to add one ticker
-                elif re.match(r"^add .", client_input):
-                    self.lock.acquire()  # lock for modifying
+        client_input = str(request.get('cmd'))
+        print('client input: {}'.format(client_input))
+        with metrics.time('request'):
+            try:
+                if re.match(r"^subscribe( .+)?$", client_input):
+                    result = self.client_subscribe(client_input, subscriptions, start_sender, loop)
+                elif client_input == 'unsubscribe':
+                    result = self.client_unsubscribe(subscriptions)
+                else:
+                    result = self.process_input(client_input)
+                return {'id': request.get('id'), 'result': result}
+            except Exception as e:  # the error is returned to the client, the connection stays open
+                return {'id': request.get('id'), 'error': str(e)}
 
-                    # add tickers
-                    msg = self.client_add_tickers(client_input)
+    @staticmethod
+    def is_subscription_request(request):
+        """
+        whether a framed request subscribes or unsubscribes
+        """
 
-                    # send message back to clients
-                    self.client_parser.send_client(connection, msg)
+        return bool(re.match(r"^(un)?subscribe( .+)?$", str(request.get('cmd'))))
 
-                    self.lock.release()
+    def process_input(self, client_input):
+        """
+        perform task according to one client input
 
-                # case 5: clients ask to regenerate report and save to local
-                elif client_input.lower() == 'report':
-                    # generate latest report and save
-                    msg = self.client_generate_report()
+        :return: result to send back to the client
+        """
 
-                    # send message back to clients
-                    self.client_parser.send_client(connection, msg)
+        # server stats are available during warm-up too
+        if client_input == 'stats':
+            return metrics.summary()
 
-                # case 6: clients input unrecognized arguments
-                else:
-                    # send message back to clients
-                    msg = 'unrecognized inputs'
-                    self.client_parser.send_client(connection, msg)
+        # coordinator mode: the shards perform the inputs
+        if self.coordinator is not None:
+            return self.coordinator.process_input(client_input)
 
-            except Exception as e:  # something wrong when interacting with clients
-                # release the lock if there is any
-                if self.lock.acquire(False):
-                    self.lock.release()
+        # so are the registered strategies
+        if client_input == 'strategies':
+            return self.client_list_strategies()
 
-                # send error message back to clients
-                msg = str(e)
-                self.client_parser.send_client(connection, msg)
+        # during warm-up (historical price still loading) clients get a clear reply instead of waiting indefinitely
+        if not self.controller.wait_ready(self.controller.ready_timeout):
+            return 'server not ready: price data is still loading, please retry later'
 
-                connection.close()  # close current connection with the client
-                break
+        # case 1: clients input a data to request record from report (optionally of a strategy given by name)
+        if re.match(r"^data( \w+)? \d\d\d\d-\d\d-\d\d-\d\d:\d\d$", client_input):  # ^ indicates it is beginning of the string
+            # query records from report
+            return self.client_query_data(client_input)
+
+        # case 2: if datetime is not specified by client, just return latest records
+        elif re.match(r"^data( \w+)?$", client_input):  # & indicates this is the end of string
+            # query records from report
+            return self.client_query_data(client_input, False)
+
+        # case 3: clients ask to delete one ticker
+        elif re.match(r"^delete .", client_input):  # . means there can have any characters
+            # delete tickers (the database only locks while swapping in the new state)
+            return self.client_delete_tickers(client_input)
+
+        # case 4: clients ask to add one ticker
+        elif re.match(r"^add .", client_input):
+            # add tickers (the database only locks while swapping in the new state)
+            return self.client_add_tickers(client_input)
+
+        # case 5: clients ask to regenerate report and save to local
+        elif client_input.lower() == 'report':
+            # generate latest report and save
+            return self.client_generate_report()
+
+        # case 6: clients ask for the cumulative pnl of one or all tickers between two times (optionally of a strategy)
+        elif re.match(r"^pnl( \w+)? \S+ \d\d\d\d-\d\d-\d\d-\d\d:\d\d \d\d\d\d-\d\d-\d\d-\d\d:\d\d$", client_input):
+            return self.client_query_pnl(client_input)
+
+        # case 7: clients ask for the pnl, hit rate and signal changes of every ticker between two times (optionally of
+        # a strategy)
+        elif re.match(r"^summary( \w+)? \d\d\d\d-\d\d-\d\d-\d\d:\d\d \d\d\d\d-\d\d-\d\d-\d\d:\d\d$", client_input):
+            return self.client_query_summary(client_input)
+
+        # subscriptions push data at any time, which only the frame protocol can carry
+        elif re.match(r"^(un)?subscribe( .+)?$", client_input):
+            return 'subscribe requires the frame protocol'
+
+        # case 8: clients input unrecognized arguments
+        else:
+            return 'unrecognized inputs'
+
+    def build_tcp_async(self):
+        """
+        serve all clients from one asyncio event loop instead of one thread per client
+        """
+
+        asyncio.run(self.serve_async())
+
+    async def serve_async(self):
+        """
+        accept clients on the event loop. Client tasks (report work, ticker downloads) run in a thread pool so the
+        loop keeps serving the other clients
+        """
+
+        self.executor = ThreadPoolExecutor(max_workers=self.server_parser.workers)
+        self.n_connections = 0
+
+        sock = self.server_parser.create_socket()
+        server = await asyncio.start_server(self.async_interaction, sock=sock)
+        print('waiting for a connection')
+        async with server:
+            await server.serve_forever()
+
+    async def async_interaction(self, reader, writer):
+        """
+        perform task according to one client's inputs on the event loop
+        """
+
+        client_address = writer.get_extra_info('peername')
+
+        # refuse the client if the server is at its connection limit
+        if self.n_connections >= self.server_parser.max_connections:
+            await self.async_refuse(reader, writer, 'server busy, too many connections')
+            return
+
+        self.n_connections += 1
+        print('Client connected. Client ip:', client_address)
+        loop = asyncio.get_running_loop()
+        idle_timeout = self.server_parser.idle_timeout or None
+        buffer = bytearray()
+        framed = None  # protocol of this client, known from its first bytes
+        last_request = None  # latest framed request task of this client
+        subscriptions = []  # subscriptions of this client
+        try:
+            while True:  # server can continuously process on client's other inputs
+                # close connections that stay idle for too long
+                try:
+                    bdata = await asyncio.wait_for(reader.read(65536), timeout=idle_timeout)
+                except asyncio.TimeoutError:
+                    if any(not s.closed for s in subscriptions):  # subscribers are waiting for pushes, not idle
+                        continue
+                    print('Client idle, connection closed. Client ip:', client_address)
+                    break
+                if not bdata:  # client disconnected
+                    break
+                if framed is None:
+                    framed = self.client_parser.is_frame(bdata)
+
+                if framed:
+                    # pipelined requests are queued without waiting for the previous replies; they still run in
+                    # the order they were sent
+                    buffer += bdata
+                    for request in self.client_parser.split_frames(buffer):
+                        last_request = asyncio.ensure_future(
+                            self.async_request(loop, writer, request, last_request, subscriptions))
+                    continue
+
+                client_input = self.client_parser.decode_input(bdata)
+                print('client input: {}'.format(client_input))
+                try:
+                    with metrics.time('request'):
+                        result = await loop.run_in_executor(self.executor, self.process_input, client_input)
+                except Exception as e:  # something wrong when performing the task
+                    writer.write(self.client_parser.encode_result(str(e)))
+                    await writer.drain()
+                    break
+
+                with metrics.time('socket_send'):
+                    writer.write(self.client_parser.encode_result(result))
+                    await writer.drain()
+        except Exception as e:  # broken frame or connection
+            print('Client connection closed: {}'.format(e))
+        finally:
+            if last_request is not None:
+                await asyncio.gather(last_request, return_exceptions=True)
+            self.client_unsubscribe(subscriptions)
+            self.n_connections -= 1
+            writer.close()
+
+    async def async_refuse(self, reader, writer, message):
+        """
+        send a refusal to a client in its own protocol and close the connection
+
+        # the protocol is known from the client's first bytes, waited for at most refuse_wait seconds (a client that
+        # sends nothing gets the json line). A frame client gets an error frame with the id of its first request
+        """
+
+        try:
+            bdata = await asyncio.wait_for(reader.read(65536), timeout=self.refuse_wait)
+        except asyncio.TimeoutError:
+            bdata = b''
+        if self.client_parser.is_frame(bdata):
+            try:
+                requests = self.client_parser.split_frames(bytearray(bdata))
+            except Exception:  # broken frame
+                requests = []
+            request_id = requests[0].get('id') if requests else None
+            writer.write(self.client_parser.encode_frame({'id': request_id, 'error': message}))
+        else:
+            writer.write(self.client_parser.encode_result(message))
+        await writer.drain()
+        writer.close()
+
+    async def async_request(self, loop, writer, request, previous_request, subscriptions):
+        """
+        process one framed request in the thread pool (after the client's previous request) and write its reply
+        """
+
+        if previous_request is not None:
+            await asyncio.gather(previous_request, return_exceptions=True)
+
+        if self.is_subscription_request(request):
+            # cheap, done on the loop so the subscription's sender task can be started here
+            def start_sender(client_subscription):
+                asyncio.ensure_future(client_subscription.run_async(writer))
+            reply = self.process_request(request, subscriptions, start_sender, loop)
+        else:
+            reply = await loop.run_in_executor(self.executor, self.process_request, request)
+        with metrics.time('socket_send'):
+            writer.write(self.client_parser.encode_frame(reply))
+            await writer.drain()
+
+    def client_subscribe(self, client_input, subscriptions, start_sender, loop=None):
+        """
+        subscribe the client to the report rows of the tickers given (all tickers if none given)
+        """
+
+        tickers = client_input.split(' ')[1:]
+        if tickers in ([], ['all']):
+            tickers = None
+        else:
+            known = self.coordinator.tickers if self.coordinator is not None else self.controller.tickers
+            unknown = [ticker for ticker in tickers if ticker not in known]
+            if unknown:
+                raise Exception("ticker not found: {}".format(', '.join(unknown)))
+
+        client_subscription = subscription(tickers, loop=loop)
+        subscriptions.append(client_subscription)
+        self.subscription_hub.add(client_subscription)
+        start_sender(client_subscription)
+
+        return 'subscribed to {}'.format(', '.join(tickers) if tickers else 'all tickers')
+
+    def client_unsubscribe(self, subscriptions):
+        """
+        cancel all subscriptions of the client
+        """
+
+        for client_subscription in subscriptions:
+            self.subscription_hub.remove(client_subscription)
+            client_subscription.close()
+        subscriptions.clear()
+
+        return 'unsubscribed'
 
     def client_query_data(self, client_input, date_given=True):
         """
         query from report (stored in controller class) for latest price and signal available as of the time specified
+
+        # "data [strategy] [date]": without strategy name the default strategy's report is queried. Rows of a named
+        # strategy include its pnl ("TICKER   price,signal,pnl"), "data" alone keeps the original "price,signal" rows
+        # replies come encoded from the query cache (see controller.query_reply)
         """
 
+        inputs = client_input.split(' ')
+        strategy = inputs[1] if len(inputs) == (3 if date_given else 2) else None
+        if strategy is not None and strategy not in self.controller.strategy_engine.stores:
+            return 'strategy not found: {}'.format(strategy)
+
         if date_given:  # if clients input a date
             # convert input to datetime
-            query_time_str = (client_input.split(' '))[1]
+            query_time_str = inputs[-1]
             query_time = dt.strptime(query_time_str, '%Y-%m-%d-%H:%M')
 
             current_time = dt.now()  # current time
@@ -164,20 +676,102 @@ class communication:
             # query records from report
             try:
                 if query_time > current_time:  # specifying time in the future, returns the latest data
-                    query = self.controller.query_data(current_time)
-                    query.append('(specifying time in the future, returns the latest data)')
+                    query = self.controller.query_reply(current_time, strategy,
+                                                        '(specifying time in the future, returns the latest data)',
+                                                        strategy is not None)
                 else:
-                    query = self.controller.query_data(query_time)
+                    query = self.controller.query_reply(query_time, strategy, pnl=strategy is not None)
             except:
                 query = ['Server has no data', '(specifying time before any data exists)']
 
         else:  # if no date is inputted by clients, just return the latest records
             current_time = dt.now()  # current time
-            query = self.controller.query_data(current_time)
-            query.append('(calling data without time returns the latest data)')
+            query = self.controller.query_reply(current_time, strategy,
+                                                '(calling data without time returns the latest data)',
+                                                strategy is not None)
 
         return query
 
+    def client_query_range(self, from_str, to_str, strategy=None):
+        """
+        aggregates of the report between the two times given by the client
+
+        :param strategy: name of the strategy (None: default strategy)
+        :return: tickers, dict of field: array, note about the range
+        """
+
+        from_time = dt.strptime(from_str, '%Y-%m-%d-%H:%M')
+        to_time = dt.strptime(to_str, '%Y-%m-%d-%H:%M')
+
+        tickers, totals, first_time, last_time = self.controller.query_range(from_time, to_time, strategy)
+        if first_time is None:
+            return tickers, totals, '(no data in the range)'
+        note = '(from {:%Y-%m-%d-%H:%M} to {:%Y-%m-%d-%H:%M})'.format(first_time, last_time)
+
+        return tickers, totals, note
+
+    def client_query_pnl(self, client_input):
+        """
+        "pnl [strategy] <ticker|all> <from> <to>": cumulative pnl between two times
+        """
+
+        inputs = client_input.split(' ')
+        strategy = inputs[1] if len(inputs) == 5 else None
+        if strategy is not None and strategy not in self.controller.strategy_engine.stores:
+            return 'strategy not found: {}'.format(strategy)
+        ticker, from_str, to_str = inputs[-3:]
+        if from_str > to_str:  # same format, so text order is time order
+            return 'invalid range: {} is after {}'.format(from_str, to_str)
+        tickers, totals, note = self.client_query_range(from_str, to_str, strategy)
+        if ticker == 'all':
+            result = ['{}   {}'.format(name, round(pnl, 2)) for name, pnl in zip(tickers, totals['pnl'])]
+            result.append('total   {}'.format(round(totals['pnl'].sum(), 2)))
+        elif ticker in tickers:
+            result = ['{}   {}'.format(ticker, round(totals['pnl'][tickers.index(ticker)], 2))]
+        else:
+            return 'ticker not found: {}'.format(ticker)
+        result.append(note)
+
+        return result
+
+    def client_query_summary(self, client_input):
+        """
+        "summary [strategy] <from> <to>": pnl, hit rate (winning bars / bars with pnl) and signal changes of every
+        ticker between two times
+        """
+
+        inputs = client_input.split(' ')
+        strategy = inputs[1] if len(inputs) == 4 else None
+        if strategy is not None and strategy not in self.controller.strategy_engine.stores:
+            return 'strategy not found: {}'.format(strategy)
+        from_str, to_str = inputs[-2:]
+        if from_str > to_str:
+            return 'invalid range: {} is after {}'.format(from_str, to_str)
+        tickers, totals, note = self.client_query_range(from_str, to_str, strategy)
+        result = ['ticker   pnl,hit_rate,signal_changes,bars']
+        for i, ticker in enumerate(tickers):
+            active = totals['active'][i]
+            hit_rate = round(totals['hits'][i] / active, 4) if active else 0
+            result.append('{}   {},{},{},{}'.format(ticker, round(totals['pnl'][i], 2), hit_rate,
+                                                    int(totals['changes'][i]), int(totals['bars'][i])))
+        result.append(note)
+
+        return result
+
+    def client_list_strategies(self):
+        """
+        list the registered strategies and their configuration
+        """
+
+        strategies = []
+        for name, store in self.controller.strategy_engine.stores.items():
+            strategy = store.trading_strategy
+            strategies.append('{}: rolling period {}, min periods {}, band {}{}'.format(
+                name, strategy.rolling_period, strategy.min_rolling_periods, strategy.band,
+                ' (default)' if name == strategy_engine.default else ''))
+
+        return strategies
+
     def client_add_tickers(self, client_input):
         """
         add tickers according to client inputs
@@ -240,6 +834,29 @@ class server_parser:
         self.port = None
         self.tickers = None
         self.sampling_period = None
+        self.fetch_workers = None
+        self.source1_rate_limit = None
+        self.quote_timeout = None
+        self.ready_timeout = None
+        self.cache_path = None
+        self.cache_max_age = None
+        self.report_format = None
+        self.strategy_workers = None
+        self.instrument = None
+        self.stats_file = None
+        self.stats_interval = None
+        self.report_layout = None
+        self.strategies = None
+        self.retention_hot = None
+        self.retention_warm = None
+        self.warm_sampling = None
+        self.query_cache = None
+        self.shards = None
+        self.shard_port = None
+        self.mode = None
+        self.max_connections = None
+        self.idle_timeout = None
+        self.workers = None
         self.host = '127.0.0.1'  # localhost
 
     def get_arguments(self):
@@ -250,13 +867,89 @@ class server_parser:
         self.parser.add_argument('--tickers', nargs="*", type=str, default=['AAPL', 'MSFT', 'TOST'])
         self.parser.add_argument('--port', type=int, default=8000)
         self.parser.add_argument('--sampling', type=int, default=5, choices=[5, 15, 30, 60])
+        self.parser.add_argument('--fetch_workers', type=int, default=8)  # tickers downloaded from source 1 at a time
+        self.parser.add_argument('--source1_rate_limit', type=int, default=None)  # max source 1 calls per minute
+        self.parser.add_argument('--quote_timeout', type=int, default=10)  # seconds to wait for source 2 quotes
+        self.parser.add_argument('--ready_timeout', type=float, default=5)  # seconds a request waits during warm-up
+        self.parser.add_argument('--cache_path', type=str, default='price_cache.db')  # persistent price cache, '' for none
+        self.parser.add_argument('--cache_max_age', type=int, default=1440)  # minutes before cached bars are refreshed
+        self.parser.add_argument('--report_format', type=str, default='csv', choices=['csv', 'binary', 'both'])
+        self.parser.add_argument('--report_layout', type=str, default='long', choices=['long', 'wide'])  # report.csv
+        self.parser.add_argument('--instrument', type=str, default='on', choices=['on', 'off'])  # stage timings
+        self.parser.add_argument('--stats_file', type=str, default=None)  # Prometheus text dump of the stage timings
+        self.parser.add_argument('--stats_interval', type=int, default=15)  # seconds between two dumps
+        self.parser.add_argument('--strategy_workers', type=int, default=0)  # processes for the strategy, 0 for serial
+        # extra strategies next to the default momentum one, each as name:rolling_period:min_rolling_periods:band
+        self.parser.add_argument('--strategies', nargs="*", type=str, default=[])
+        # retention tiers: hours of full resolution bars kept in memory (0 keeps every bar), hours of downsampled
+        # bars before them and minutes per downsampled bar
+        self.parser.add_argument('--retention_hot', type=float, default=0)
+        self.parser.add_argument('--retention_warm', type=float, default=0)
+        self.parser.add_argument('--warm_sampling', type=int, default=60)
+        self.parser.add_argument('--query_cache', type=int, default=1024)  # cached query replies, 0 for none
+        # coordinator mode: tickers sharded across this many worker servers (0 serves them in this process) on the
+        # ports from shard_port (default port + 1)
+        self.parser.add_argument('--shards', type=int, default=0)
+        self.parser.add_argument('--shard_port', type=int, default=None)
+        # 'thread': one thread per client; 'asyncio': all clients served from one event loop
+        self.parser.add_argument('--mode', type=str, default='thread', choices=['thread', 'asyncio'])
+        self.parser.add_argument('--max_connections', type=int, default=1000)  # asyncio mode only
+        self.parser.add_argument('--idle_timeout', type=int, default=0)  # asyncio mode only, seconds, 0 for no timeout
+        self.parser.add_argument('--workers', type=int, default=8)  # asyncio mode only, threads for client tasks
         self.args = self.parser.parse_args()
         self.port = self.args.port
         self.tickers = self.args.tickers
         self.sampling_period = self.args.sampling
+        self.fetch_workers = self.args.fetch_workers
+        self.source1_rate_limit = self.args.source1_rate_limit
+        self.quote_timeout = self.args.quote_timeout
+        self.ready_timeout = self.args.ready_timeout
+        self.cache_path = self.args.cache_path
+        self.cache_max_age = self.args.cache_max_age
+        self.report_format = self.args.report_format
+        self.strategy_workers = self.args.strategy_workers
+        self.instrument = self.args.instrument == 'on'
+        self.stats_file = self.args.stats_file
+        self.stats_interval = self.args.stats_interval
+        self.report_layout = self.args.report_layout
+        self.strategies = strategy_engine.parse_configs(self.args.strategies)
+        self.retention_hot = self.args.retention_hot
+        self.retention_warm = self.args.retention_warm
+        self.warm_sampling = self.args.warm_sampling
+        self.query_cache = self.args.query_cache
+        self.shards = self.args.shards
+        self.shard_port = self.args.shard_port or self.port + 1
+        self.mode = self.args.mode
+        self.max_connections = self.args.max_connections
+        self.idle_timeout = self.args.idle_timeout
+        self.workers = self.args.workers
 
         return self.port, self.tickers, self.sampling_period
 
+    def worker_arguments(self):
+        """
+        arguments of the coordinator's worker servers: the coordinator's own, except the port, tickers and shards
+
+        # the workers run in their own directories, so the price cache path is made absolute (all shards share the
+        # cache), and the Source 1 rate limit is split between them. The client connection settings are the
+        # coordinator's own: its pooled connections to the workers must not be limited or timed out
+        """
+
+        arguments = []
+        for name, value in vars(self.args).items():
+            if name in ('port', 'tickers', 'shards', 'shard_port') or value is None or value == []:
+                continue
+            if name in ('mode', 'max_connections', 'idle_timeout', 'workers'):
+                continue
+            if name == 'cache_path' and value:
+                value = os.path.abspath(value)
+            elif name == 'source1_rate_limit':
+                value = max(1, value // self.shards)
+            arguments.append('--{}'.format(name))
+            arguments += value if isinstance(value, list) else [str(value)]
+
+        return arguments
+
     def create_socket(self):
         """
         make the local server available over the internet by making it a socket
@@ -270,6 +963,10 @@ class server_parser:
         print('starting up on {} port {}'.format(*server_address))
         print()
 
+        # a restarted server (e.g. a coordinator's worker) binds the port again while connections of the previous
+        # one are still in TIME_WAIT
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
         # Bind the socket to a specific port
         # bind an empty string so the server listens on all network devices within the LAN
         sock.bind(('', self.port))
@@ -282,455 +979,3642 @@ class server_parser:
 class client_parser:
     """
     parse user inputs from clients
+
+    # two protocols are accepted:
+    # line protocol: the input string as is, reply is json
+    # frame protocol: 4-byte big-endian length followed by a json payload, both ways. Requests are
+    # {"id": ..., "cmd": "..."}, replies {"id": ..., "result": ...} or {"id": ..., "error": "..."}
     """
 
+    frame_header = struct.Struct('>I')
+    max_frame_size = 2 ** 24 - 1  # keeps the first header byte zero, which tells frames from line inputs
+
     def __init__(self):
         pass
 
-    def get_arguments(self, connection):
+    @staticmethod
+    def decode_input(bdata):
         """
-        parse clients arguments
+        convert the bytes received from a client to the input string
         """
 
-        bdata = connection.recv(4096)  # receive clients arguments in bytes. Specifying max bytes to receive
-        data = ((str(bdata)).split('\''))[1]  # store clients arguments in string
-        print('client input: {}'.format(data))
+        return ((str(bdata)).split('\''))[1]
 
-        return data
-
-    def send_client(self, connection, result):
+    @staticmethod
+    def encode_result(result):
         """
-        send results back to clients with results converted to bytes
+        convert a result to the bytes sent to clients (an encoded_result is sent as is)
         """
 
-        return connection.sendall(json.dumps(result).encode())
+        if isinstance(result, encoded_result):
+            return result.data
 
+        return json.dumps(result).encode()
 
-class database:
-    """
-    fetch historical price from Source1 and update real-time stock price from Source2
+    def send_client(self, connection, result):
+        """
+        send results back to clients with results converted to bytes
+        """
 
-    :param tickers: list of stock tickers
-    :type tickers: List of Strings
-    :param sampling_period: one of (5, 15, 30, 60), with unit in minutes
-    :type sampling_period: Int
-    """
-    def __init__(self, tickers, sampling_period):
-        self.session = requests.Session()
-        self.lock = lock
-        self.tickers = tickers
-        self.sampling_period = sampling_period
-        self.key_source1 = 'QILARUF4KL7NB71W'
-        self.key_source2 = 'cfb305pr01qrdg3nceu0cfb305pr01qrdg3nceug'
-        self.price = None
-        self.latest_time = None
-        self.source2_time = None
-        self.price_historical = None
-        self.price_realtime = None
-        self.status = None
-        # self.regenerate_db_flag = False
+        return connection.sendall(self.encode_result(result))
 
     @staticmethod
-    def fetch_source1(ticker, sampling, key, session):
+    def is_frame(bdata):
         """
-        create a df containing stock ticker's historical close price
+        whether the first bytes received from a client start a frame
         """
-        # connect with source 1 and fetch ticker content
-        input = (ticker, sampling, key)
-        CSV_URL = 'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY_EXTENDED&symbol={}' \
-                  '&interval={}min&slice=year1month1&apikey={}'.format(*input)
-        download = session.get(CSV_URL)
-        decoded_content = download.content.decode('utf-8')
-        csv_reader = csv.reader(decoded_content.splitlines(), delimiter=',')
-        list_source1_content = list(csv_reader)  # source1 ticker content list
-        header, content = list_source1_content[0], list_source1_content[1:]  # get header and content
-
-        # store only close price and time in dataframe
-        df_price_source1 = pd.DataFrame(columns=header, data=content)[['time', 'close']]
-        df_price_source1 = df_price_source1.rename(columns={'close': ticker})  # rename column 'close' to ticker name
-        df_price_source1['time'] = pd.to_datetime(df_price_source1['time'], format='%Y-%m-%d %H:%M:%S')  # reformat time column
-
-        # check if the tickers is valid:
-        if df_price_source1.empty:
-            raise Exception("invalid ticker")
-        elif not isinstance(df_price_source1, pd.DataFrame):
-            raise Exception('database error (source 1)!')
 
-        return df_price_source1
+        return bdata[:1] == b'\x00'
 
-    @staticmethod
-    def fetch_source2(ticker, key):
+    def encode_frame(self, payload):
         """
-        create a df containing only stock ticker's real time close price
+        convert a payload to a length-prefixed json frame
         """
-        # connect with source 2 and fetch ticker real-time content
-        finnhub_client = finnhub.Client(api_key=key)
-        dict_source2_content = finnhub_client.quote(ticker)  # source2 ticker content dict
 
-        # only store time and close price
-        source2_time = dt.fromtimestamp(dict_source2_content['t'])  # time for the latest price
-        source2_price = dict_source2_content['c']  # get the latest close price
-        source2_time = dt.strptime(dt.strftime(source2_time, '%Y-%m-%d %H:%M:%S'), '%Y-%m-%d %H:%M:%S')  # reformat time
-        # store the ticker's real-time price and time in dataframe
-        dict_price_source2 = {'time': [source2_time], ticker: [source2_price]}
-        df_price_source2 = pd.DataFrame(dict_price_source2)
+        result = payload.get('result')
+        if isinstance(result, encoded_result):
+            # same bytes as json.dumps of the payload, without encoding the result again
+            body = b'{"id": ' + json.dumps(payload.get('id')).encode() + b', "result": ' + result.data + b'}'
+        else:
+            body = json.dumps(payload).encode()
+        if len(body) > self.max_frame_size:
+            body = json.dumps({'id': payload.get('id'), 'error': 'reply too large'}).encode()
 
-        return df_price_source2, source2_time
+        return self.frame_header.pack(len(body)) + body
 
-    @staticmethod
-    def fill_NA(df):
+    def split_frames(self, buffer):
         """
-        deal with dataframe's missing value using backward and forward fill
+        take the complete frames out of the receive buffer (incomplete frames stay in the buffer)
 
-        :param df: df with time column in descending order
+        :param buffer: bytearray of the bytes received so far, consumed in place
+        :return: list of decoded payloads
         """
 
-        df.fillna(method='bfill', inplace=True)  # first backward fill (forward fill in time ascending order)
-        df.fillna(method='ffill', inplace=True)  # then forward fill (backward fill in time ascending order)
+        payloads = []
+        while len(buffer) >= self.frame_header.size:
+            (length,) = self.frame_header.unpack_from(buffer)
+            if length > self.max_frame_size:
+                raise Exception('frame too large')
+            end = self.frame_header.size + length
+            if len(buffer) < end:
+                break
+            payloads.append(json.loads(bytes(buffer[self.frame_header.size:end]).decode()))
+            del buffer[:end]
 
-        return df
+        return payloads
 
-    def fetch_price_historical(self):
-        """
-        get historical stock price from Source 1
-        """
+class encoded_result:
+    """
+    a result together with its json encoding, so that a reply sent many times is only encoded once
 
-        # get historical price for all tickers from source 1 and join them
-        df_price_source1 = pd.DataFrame(columns=['time'])
-        with self.session as source1_session:
-            for ticker in self.tickers:
-                # fetch historical price for this ticker from source 1
-                df_ticker = self.fetch_source1(ticker, self.sampling_period, self.key_source1, source1_session)
-                # join each ticker's price
-                df_price_source1 = df_price_source1.merge(df_ticker, how='outer', on='time')  # outer join on 'time' column
+    :param value: result (json serializable)
+    """
 
-        # use backward then forward fill to deal with missing stock price after combining all tickers
-        self.fill_NA(df_price_source1)  # df_price_source1 is in time descending order
+    def __init__(self, value):
+        self.value = value
+        self.data = json.dumps(value).encode()
 
-        # latest time in the time series
-        self.latest_time = df_price_source1['time'].loc[0]
+    def __repr__(self):
+        return repr(self.value)
 
-        # cache the generated price.
-        self.price = df_price_source1.copy()  # keep track of the updated price
-        self.price_historical = df_price_source1.copy()  # only store the price obtained from source 1 (historical price)
 
-        # track database status
-        self.status = 'fetched historical'
+class rate_limiter:
+    """
+    spread calls evenly so that at most "calls_per_minute" calls are made per minute (shared by all threads)
 
-    def append_realtime_price(self):
+    :param calls_per_minute: max number of calls per minute. None or 0 means no limit
+    """
+
+    def __init__(self, calls_per_minute):
+        self.interval = 60 / calls_per_minute if calls_per_minute else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
         """
-        update stock price to include real time (latest) price from Source 2
+        block until the caller is allowed to make its call
         """
 
-        # get real-time price for all tickers from source 2 and join them
-        df_price_source2 = pd.DataFrame(columns=['time'])
-        for ticker in self.tickers:
-            # fetch real time price from source 2
-            df_ticker, self.source2_time = self.fetch_source2(ticker, self.key_source2)
-            # outer join each ticker's price on 'time' column
-            df_price_source2 = df_price_source2.merge(df_ticker, how='outer', on='time')
+        if not self.interval:
+            return
 
-        # check db status
+        # reserve the next free slot, then sleep outside the lock until it comes
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_call)
+            self.next_call = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+class quote_fetcher:
+    """
+    fetch the real-time quotes of all tickers from Source2 concurrently through one reused finnhub client
+
+    :param key: Source2 api key
+    :param workers: max number of quotes requested at the same time
+    :param timeout: seconds a tick waits for its quotes; tickers that are slower are left out of the tick
+    :param url: Source2 api url (can point to a local mock quote server), finnhub's default if None
+    """
+
+    def __init__(self, key, workers=8, timeout=10, url=None):
+        self.timeout = timeout
+        # one client (and connection pool) for every tick instead of a new client per ticker
+        self.client = finnhub.Client(api_key=key)
+        self.client.DEFAULT_TIMEOUT = timeout
+        if url:
+            self.client.API_URL = url
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.client._session.mount('http://', adapter)
+        self.client._session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def fetch(self, tickers):
+        """
+        request the quotes of all tickers and wait at most "timeout" seconds for them
+
+        :return: dict of ticker: df from database.fetch_source2 for the tickers fetched in time, dict of
+                 ticker: error message for the others
+        """
+
+        futures = {ticker: self.executor.submit(database.fetch_source2, ticker, None, self.client) for ticker in tickers}
+        wait(futures.values(), timeout=self.timeout)
+
+        fetched, failed = {}, {}
+        for ticker, future in futures.items():
+            if not future.done():
+                future.cancel()  # a hung quote is dropped from this tick
+                failed[ticker] = 'timed out'
+            elif future.exception() is not None:
+                failed[ticker] = str(future.exception())
+            else:
+                fetched[ticker] = future.result()[0]
+
+        return fetched, failed
+
+class price_table_builder:
+    """
+    collect each ticker's (time, close) arrays and build the wide price table aligned on time in one pass
+
+    # replaces chained outer merges on 'time', which copy every column again for each ticker added
+    """
+
+    def __init__(self):
+        self.tickers = []
+        self.times = []
+        self.closes = []
+
+    def add(self, ticker, times, closes):
+        """
+        add one ticker's price series
+        """
+
+        self.tickers.append(ticker)
+        self.times.append(np.asarray(times, dtype='datetime64[ns]'))
+        self.closes.append(np.asarray(closes, dtype=np.float64))
+
+    def build(self):
+        """
+        :return: df with 'time' column (union of all tickers' times, descending) and one float column per ticker,
+                 nan where a ticker has no price at that time
+        """
+
+        # union time index and preallocated price matrix
+        time_index = np.unique(np.concatenate(self.times)) if self.times else np.array([], dtype='datetime64[ns]')
+        matrix = np.full((len(time_index), len(self.tickers)), np.nan)
+        for j, (times, closes) in enumerate(zip(self.times, self.closes)):
+            matrix[np.searchsorted(time_index, times), j] = closes
+
+        # database keeps the latest time on top
+        df_price = pd.DataFrame(matrix[::-1], columns=self.tickers)
+        df_price.insert(0, 'time', time_index[::-1])
+
+        return df_price
+
+class price_store:
+    """
+    append-only price database: a time array and a float64 price matrix (one column per ticker) in time ascending
+    order. The buffers double their capacity when full, so appending a bar is amortized O(1)
+
+    # rows already written are never modified and a grown buffer is a new array, so frames handed out by to_frame
+    # stay valid (and unchanged) while new bars are appended. Removing a ticker returns a new store
+    """
+
+    def __init__(self, tickers, capacity=1024):
+        self.tickers = list(tickers)
+        self.size = 0
+        self.times = np.empty(capacity, dtype='datetime64[ns]')
+        self.values = np.empty((capacity, len(self.tickers)), dtype=np.float64)
+
+    def load(self, df_price):
+        """
+        replace the content with a price df ('time' column and one column per ticker, any time order)
+        """
+
+        df_price = df_price.sort_values('time')
+        self.tickers = [column for column in df_price.columns if column != 'time']
+        self.size = len(df_price)
+        capacity = max(1024, 2 * self.size)
+        self.times = np.empty(capacity, dtype='datetime64[ns]')
+        self.values = np.empty((capacity, len(self.tickers)), dtype=np.float64)
+        self.times[:self.size] = df_price['time'].values
+        self.values[:self.size] = df_price[self.tickers].values.astype(np.float64)
+
+    def append(self, bar_time, bar_price):
+        """
+        append one bar (prices ordered as self.tickers) at the end of the store
+        """
+
+        if self.size == len(self.times):
+            self.grow()
+        self.times[self.size] = np.datetime64(pd.Timestamp(bar_time), 'ns')
+        self.values[self.size] = bar_price
+        self.size += 1
+
+    def grow(self):
+        """
+        double the capacity of the buffers
+        """
+
+        capacity = max(1, 2 * len(self.times))
+        times = np.empty(capacity, dtype='datetime64[ns]')
+        values = np.empty((capacity, len(self.tickers)), dtype=np.float64)
+        times[:self.size] = self.times[:self.size]
+        values[:self.size] = self.values[:self.size]
+        self.times, self.values = times, values
+
+    def without_ticker(self, ticker):
+        """
+        :return: new store with one ticker's column removed (copy on write, this store is left unchanged, it can be
+                 appended to meanwhile)
+        """
+
+        size = self.size  # bars appended while copying are left out
+        keep = [i for i, column in enumerate(self.tickers) if column != ticker]
+        store = price_store([self.tickers[i] for i in keep], capacity=len(self.times))
+        store.times[:size] = self.times[:size]
+        store.values[:size] = self.values[:size][:, keep]
+        store.size = size
+
+        return store
+
+    def with_ticker(self, ticker, times, prices):
+        """
+        :return: new store with one ticker's column added (copy on write, this store is left unchanged, it can be
+                 appended to meanwhile)
+
+        # the ticker's prices are spliced on the store's times: each bar takes the ticker's latest price as of the bar
+        # (its earliest price for the bars before its first one), like the backward/forward fill of a full rebuild
+        """
+
+        order = np.argsort(times, kind='stable')
+        times = np.asarray(times, dtype='datetime64[ns]')[order]
+        prices = np.asarray(prices, dtype=np.float64)[order]
+        size = self.size  # bars appended while copying are left out
+        position = np.searchsorted(times, self.times[:size], side='right') - 1
+
+        store = price_store(self.tickers + [ticker], capacity=len(self.times))
+        store.times[:size] = self.times[:size]
+        store.values[:size, :-1] = self.values[:size]
+        store.values[:size, -1] = prices[np.maximum(position, 0)]
+        store.size = size
+
+        return store
+
+    def latest_time(self):
+        """
+        :return: time of the latest bar
+        """
+
+        return pd.Timestamp(self.times[self.size - 1])
+
+    def to_frame(self):
+        """
+        :return: df with time index (ascending) and one column per ticker, built over the buffers without copying
+        """
+
+        size = self.size
+        index = pd.DatetimeIndex(self.times[:size], name='time')
+
+        return pd.DataFrame(self.values[:size], index=index, columns=list(self.tickers), copy=False)
+
+    def compact(self, hot_start, warm_start, warm_sampling):
+        """
+        :return: new store with the retention tiers applied (copy on write, this store is left unchanged): bars from
+                 hot_start on are kept as they are, bars from warm_start to hot_start are downsampled to the last
+                 bar of every warm_sampling bucket and older bars are evicted
+        """
+
+        times = self.times[:self.size]
+        start = np.searchsorted(times, pd.Timestamp(warm_start).to_datetime64(), side='left')
+        hot = max(start, np.searchsorted(times, pd.Timestamp(hot_start).to_datetime64(), side='left'))
+
+        # last bar of each bucket of the warm tier (already compacted buckets keep their bar)
+        buckets = times[start:hot].astype(np.int64) // pd.Timedelta(minutes=warm_sampling).value
+        warm_rows = start + np.flatnonzero(np.append(buckets[1:] != buckets[:-1], len(buckets) > 0))
+        rows = np.concatenate([warm_rows, np.arange(hot, self.size)])
+
+        store = price_store(self.tickers, capacity=max(1024, 2 * len(rows)))
+        store.times[:len(rows)] = times[rows]
+        store.values[:len(rows)] = self.values[rows]
+        store.size = len(rows)
+
+        return store
+
+class retention_policy:
+    """
+    retention tiers of a long-running server, so that memory and per-bar work stay bounded over months of uptime
+
+    # hot tier: the latest "hot" hours at full resolution (must cover the strategies' rolling periods, so that a
+    # rebuild after adding a ticker sees full resolution bars in its windows). Warm tier: the "warm" hours before,
+    # downsampled to one bar per "warm_sampling" minutes. Older bars are evicted from memory, they stay on disk in
+    # the price cache (and their report rows in report.csv); the report keeps their pnl as aggregates.
+    # Tiers are applied once per warm_sampling bucket, so their cost per bar is a fraction of one pass over the
+    # retained (bounded) data
+
+    :param hot: hours of full resolution bars
+    :param warm: hours of downsampled bars before the hot tier
+    :param warm_sampling: minutes per bar of the warm tier
+    """
+
+    def __init__(self, hot, warm=0, warm_sampling=60):
+        self.hot = pd.Timedelta(hours=hot)
+        self.warm = pd.Timedelta(hours=warm)
+        self.warm_sampling = warm_sampling
+        self.bucket = '{}min'.format(warm_sampling)
+        self.applied = None  # hot_start of the latest compaction
+
+    def bounds(self, latest_time):
+        """
+        :return: hot_start, warm_start of the tiers as of the latest bar (aligned on warm buckets)
+        """
+
+        hot_start = (pd.Timestamp(latest_time) - self.hot).floor(self.bucket)
+
+        return hot_start, hot_start - self.warm
+
+    def due(self, latest_time):
+        """
+        :return: whether a new bucket has left the hot tier since the latest compaction
+        """
+
+        return self.applied is None or self.bounds(latest_time)[0] > self.applied
+
+class price_cache:
+    """
+    persistent price database on disk (sqlite), one row per (ticker, sampling period, bar time)
+
+    # keeps every bar ever fetched from Source 1 and every real-time bar appended, so a restart loads them from disk
+    # instead of downloading them again. Times are stored as int64 nanoseconds
+
+    :param path: sqlite file
+    :param sampling_period: sampling period (minutes) of the bars read and written
+    :param max_age: minutes after which a ticker's cached bars are refreshed by a whole Source 1 download (recent bars
+        are kept and only the bars after them are added)
+    """
+
+    def __init__(self, path, sampling_period, max_age=1440):
+        self.path = path
+        self.sampling_period = sampling_period
+        self.max_age = pd.Timedelta(minutes=max_age)
+        self.lock = threading.Lock()  # one connection shared by the fetch threads and the updater
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')  # appends do not block readers, no full fsync per bar
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS price (ticker TEXT, sampling INTEGER, time INTEGER, '
+                                'close REAL, PRIMARY KEY (ticker, sampling, time)) WITHOUT ROWID')
+        self.connection.commit()
+
+    def load(self, ticker):
+        """
+        :return: (times, closes) arrays of the ticker's cached bars in time ascending order (empty if none)
+        """
+
+        with self.lock:
+            rows = self.connection.execute('SELECT time, close FROM price WHERE ticker = ? AND sampling = ? '
+                                           'ORDER BY time', (ticker, self.sampling_period)).fetchall()
+        times = np.array([row[0] for row in rows], dtype=np.int64).astype('datetime64[ns]')
+        closes = np.array([row[1] for row in rows], dtype=np.float64)
+
+        return times, closes
+
+    def is_fresh(self, times):
+        """
+        whether cached bars are recent enough to be kept as they are (only the bars after them are downloaded)
+        """
+
+        return len(times) > 0 and dt.now() - pd.Timestamp(times[-1]) < self.max_age
+
+    def is_current(self, times):
+        """
+        whether cached bars reach the latest bar (less than a sampling period old), so there is nothing to download
+        """
+
+        return len(times) > 0 and dt.now() - pd.Timestamp(times[-1]) < pd.Timedelta(minutes=self.sampling_period)
+
+    def save(self, ticker, times, closes):
+        """
+        write (or overwrite) one ticker's bars
+        """
+
+        times = np.asarray(times, dtype='datetime64[ns]').astype(np.int64).tolist()
+        closes = np.asarray(closes, dtype=np.float64).tolist()
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO price VALUES (?, ?, ?, ?)',
+                                        [(ticker, self.sampling_period, t, c) for t, c in zip(times, closes)])
+            self.connection.commit()
+
+    def save_bar(self, bar_time, tickers, bar_price):
+        """
+        write one real-time bar of the tickers quoted
+        """
+
+        bar_time = int(np.datetime64(pd.Timestamp(bar_time), 'ns').astype(np.int64))
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO price VALUES (?, ?, ?, ?)',
+                                        [(ticker, self.sampling_period, bar_time, float(price))
+                                         for ticker, price in zip(tickers, bar_price)])
+            self.connection.commit()
+
+    @staticmethod
+    def merge(cached_times, cached_closes, times, closes):
+        """
+        combine cached bars with freshly fetched ones (the fetched price wins for a time in both)
+
+        :return: (times, closes) arrays in time ascending order
+        """
+
+        times = np.concatenate([np.asarray(times, dtype='datetime64[ns]'), cached_times])
+        closes = np.concatenate([np.asarray(closes, dtype=np.float64), cached_closes])
+        times, first = np.unique(times, return_index=True)  # first occurrence, i.e. the fetched one
+
+        return times, closes[first]
+
+class database:
+    """
+    fetch historical price from Source1 and update real-time stock price from Source2
+
+    :param tickers: list of stock tickers
+    :type tickers: List of Strings
+    :param sampling_period: one of (5, 15, 30, 60), with unit in minutes
+    :type sampling_period: Int
+    :param fetch_workers: max number of tickers downloaded from Source1 at the same time
+    :type fetch_workers: Int
+    :param source1_rate_limit: max number of Source1 calls per minute for the api key (None for no limit)
+    :type source1_rate_limit: Int
+    :param source1_url: Source1 query url (can point to a local stand-in server)
+    :type source1_url: String
+    :param quote_timeout: seconds a real-time update waits for the Source2 quotes
+    :type quote_timeout: Int
+    :param source2_url: Source2 api url (can point to a local mock quote server), finnhub's default if None
+    :type source2_url: String
+    :param cache_path: sqlite file of the persistent price cache (None for no cache)
+    :type cache_path: String
+    :param cache_max_age: minutes after which cached bars are refreshed from Source1
+    :type cache_max_age: Int
+    :param retention: retention_policy bounding the bars kept in memory (None to keep every bar)
+    :type retention: retention_policy
+    """
+    def __init__(self, tickers, sampling_period, fetch_workers=8, source1_rate_limit=None,
+                 source1_url='https://www.alphavantage.co/query', quote_timeout=10, source2_url=None,
+                 cache_path=None, cache_max_age=1440, retention=None):
+        self.session = requests.Session()
+        # connection pool large enough for all fetch workers to share the session
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=fetch_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = lock
+        self.tickers = tickers
+        self.sampling_period = sampling_period
+        self.fetch_workers = fetch_workers
+        self.source1_limiter = rate_limiter(source1_rate_limit)
+        self.source1_url = source1_url
+        self.failed_tickers = {}  # ticker: error message of the latest Source1 backfill
+        self.key_source1 = 'QILARUF4KL7NB71W'
+        self.key_source2 = 'cfb305pr01qrdg3nceu0cfb305pr01qrdg3nceug'
+        self.quote_fetcher = quote_fetcher(self.key_source2, fetch_workers, quote_timeout, source2_url)
+        self.price_store = None  # historical price followed by the real-time bars, time ascending
+        self.price_cache = price_cache(cache_path, sampling_period, cache_max_age) if cache_path else None
+        self.retention = retention
+        self.historical_time = None  # time of the latest historical (Source 1) bar
+        self.latest_time = None
+        self.source2_time = None
+        self.price_historical = None
+        self.price_realtime = None
+        self.status = None
+        self.listeners = []  # objects notified whenever the price database changes (e.g. report_store)
+        self.events = deque()  # changes not notified to the listeners yet: list of (listener method, arguments)
+        self.listener_lock = timed_lock('listeners')  # listeners process one change at a time, in order
+        self.price_ready = threading.Event()  # set once the historical price is loaded (or failed to load)
+        self.price_error = None  # why the historical price failed to load
+        # self.regenerate_db_flag = False
+
+    @staticmethod
+    def fetch_source1(ticker, sampling, key, session, url='https://www.alphavantage.co/query'):
+        """
+        create a df containing stock ticker's historical close price
+        """
+        # connect with source 1 and fetch ticker content
+        input = (url, ticker, sampling, key)
+        CSV_URL = '{}?function=TIME_SERIES_INTRADAY_EXTENDED&symbol={}' \
+                  '&interval={}min&slice=year1month1&apikey={}'.format(*input)
+        download = session.get(CSV_URL)
+        content = download.content
+
+        # parse only the time and close columns of the raw bytes with the C csv engine, straight into typed arrays
+        # (close as float64, parsed exactly like float(); time as datetime64 from its ISO text)
+        try:
+            df_price_source1 = pd.read_csv(io.BytesIO(content), usecols=['time', 'close'],
+                                           dtype={'time': object, 'close': np.float64}, float_precision='round_trip')
+        except (ValueError, pd.errors.EmptyDataError):  # not a price csv, e.g. an error message
+            if b'Error Message' in content:
+                raise Exception("invalid ticker")
+            raise Exception('database error (source 1)!')
+        df_price_source1['time'] = df_price_source1['time'].values.astype('datetime64[ns]')
+        df_price_source1 = df_price_source1.rename(columns={'close': ticker})  # rename column 'close' to ticker name
+
+        # check if the tickers is valid:
+        if df_price_source1.empty:
+            raise Exception("invalid ticker")
+
+        return df_price_source1
+
+    @staticmethod
+    def fetch_source2(ticker, key, finnhub_client=None):
+        """
+        create a df containing only stock ticker's real time close price
+
+        :param finnhub_client: client to reuse, a new one is created with "key" if None
+        """
+        # connect with source 2 and fetch ticker real-time content
+        if finnhub_client is None:
+            finnhub_client = finnhub.Client(api_key=key)
+        dict_source2_content = finnhub_client.quote(ticker)  # source2 ticker content dict
+
+        # only store time and close price
+        source2_time = dt.fromtimestamp(dict_source2_content['t'])  # time for the latest price
+        source2_price = dict_source2_content['c']  # get the latest close price
+        source2_time = dt.strptime(dt.strftime(source2_time, '%Y-%m-%d %H:%M:%S'), '%Y-%m-%d %H:%M:%S')  # reformat time
+        # store the ticker's real-time price and time in dataframe
+        dict_price_source2 = {'time': [source2_time], ticker: [source2_price]}
+        df_price_source2 = pd.DataFrame(dict_price_source2)
+
+        return df_price_source2, source2_time
+
+    @staticmethod
+    def fill_NA(df):
+        """
+        deal with dataframe's missing value using backward and forward fill
+
+        :param df: df with time column in descending order
+        """
+
+        df.fillna(method='bfill', inplace=True)  # first backward fill (forward fill in time ascending order)
+        df.fillna(method='ffill', inplace=True)  # then forward fill (backward fill in time ascending order)
+
+        return df
+
+    def fetch_ticker_source1(self, ticker):
+        """
+        fetch one ticker from source 1 through the shared session, respecting the api key rate limit
+        """
+
+        self.source1_limiter.wait()
+
+        with metrics.time('source1_fetch'):
+            return self.fetch_source1(ticker, self.sampling_period, self.key_source1, self.session, self.source1_url)
+
+    def fetch_source1_concurrent(self, tickers):
+        """
+        download the historical price of all tickers from source 1 in parallel
+
+        :return: dict of ticker: df for the tickers fetched, dict of ticker: error message for the tickers that failed
+        """
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, len(tickers)))) as executor:
+            futures = {ticker: executor.submit(self.fetch_ticker_source1, ticker) for ticker in tickers}
+
+        fetched, failed = {}, {}
+        for ticker, future in futures.items():
+            try:
+                fetched[ticker] = future.result()
+            except Exception as e:  # one failed ticker does not abort the whole backfill
+                failed[ticker] = str(e)
+
+        return fetched, failed
+
+    def fetch_ticker_cached(self, ticker, times, closes):
+        """
+        merge a ticker's cached bars with a fresh Source 1 download and write the new bars to the cache
+
+        # fresh cached bars (see price_cache.is_fresh) are kept and only the missing tail, the bars after the latest
+        # cached one, is added; stale bars are refreshed by the whole download
+
+        :return: (times, closes) arrays in time ascending order
+        """
+
+        df_ticker = self.fetch_ticker_source1(ticker)
+        new_times, new_closes = df_ticker['time'].values, df_ticker[ticker].values
+        if self.price_cache.is_fresh(times):
+            tail = new_times > times[-1]
+            new_times, new_closes = new_times[tail], new_closes[tail]
+        self.price_cache.save(ticker, new_times, new_closes)
+
+        return self.price_cache.merge(times, closes, new_times, new_closes)
+
+    def fetch_price_historical(self):
+        """
+        get historical stock price from Source 1 (the persistent cache's bars are completed with the bars after them)
+        """
+
+        tickers = list(self.tickers)
+        if self.price_cache is None:
+            # get historical price for all tickers from source 1 concurrently (network, no lock held)
+            fetched, failed = self.fetch_source1_concurrent(tickers)
+            fetched = {ticker: (df['time'].values, df[ticker].values) for ticker, df in fetched.items()}
+        else:
+            # warm restart: load the cached bars and download the tickers whose bars do not reach the latest bar
+            cached = {ticker: self.price_cache.load(ticker) for ticker in tickers}
+            fetched = {ticker: bars for ticker, bars in cached.items() if self.price_cache.is_current(bars[0])}
+            missing = [ticker for ticker in tickers if ticker not in fetched]
+            with ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, len(missing)))) as executor:
+                futures = {ticker: executor.submit(self.fetch_ticker_cached, ticker, *cached[ticker])
+                           for ticker in missing}
+            failed = {}
+            for ticker, future in futures.items():
+                try:
+                    fetched[ticker] = future.result()
+                except Exception as e:
+                    if len(cached[ticker][0]):  # source 1 unavailable, fall back on the old cached bars
+                        fetched[ticker] = cached[ticker]
+                    else:
+                        failed[ticker] = str(e)
+
+        for ticker, error in failed.items():
+            print('failed to fetch {} from source 1: {}'.format(ticker, error))
+        if not fetched:
+            if set(failed.values()) == {'invalid ticker'}:
+                raise Exception('invalid ticker')
+            raise Exception('database error (source 1)!')
+
+        with metrics.time('merge_fill'):
+            # align the tickers' price on time in one pass
+            builder = price_table_builder()
+            for ticker, (times, closes) in fetched.items():
+                builder.add(ticker, times, closes)
+            df_price_source1 = builder.build()
+
+            # use backward then forward fill to deal with missing stock price after combining all tickers
+            self.fill_NA(df_price_source1)  # df_price_source1 is in time descending order
+
+        while True:
+            # tickers that failed are left out of the price database (so are tickers deleted during the download). The
+            # store is loaded without the lock, and loaded again if the tickers changed in the meantime
+            tickers = [ticker for ticker in self.tickers if ticker in fetched]
+            store = price_store(tickers)
+            store.load(df_price_source1[['time'] + tickers])
+            with self.lock:
+                if [ticker for ticker in self.tickers if ticker in fetched] != tickers:
+                    continue
+                self.failed_tickers = failed
+                self.tickers[:] = tickers
+
+                # cache the generated price.
+                # only store the price obtained from source 1 (historical price)
+                self.price_historical = store.to_frame()
+                self.price_store = store  # keep track of the updated price
+
+                # latest time in the time series
+                self.latest_time = store.latest_time()
+                self.historical_time = self.latest_time
+
+                # track database status
+                self.status = 'fetched historical'
+
+                # let listeners rebuild from the new price database (each gets its own frame: pandas index lookups are
+                # not safe to share between threads)
+                self.events.append([(listener.on_historical, (store.to_frame(),)) for listener in self.listeners])
+
+                # the listeners build from the full history, only the retained tiers are kept from now on
+                if self.retention is not None:
+                    self.retention.applied = None
+                self.apply_retention()
+            break
+
+        self.notify()
+
+        # wake up everyone waiting for the price database (and its report)
+        self.price_error = None
+        self.price_ready.set()
+
+    def append_realtime_price(self):
+        """
+        update stock price to include real time (latest) price from Source 2
+        """
+
+        # get real-time price for all tickers from source 2 concurrently (network, no lock held)
+        with metrics.time('source2_fetch'):
+            fetched, failed = self.quote_fetcher.fetch(list(self.tickers))
+        for ticker, error in failed.items():
+            print('failed to fetch {} from source 2: {}'.format(ticker, error))
+
+        # check db status
         self.status = 'previous updated price available. No new updates yet'
+        if not fetched:
+            return
+
+        # align them on time
+        with metrics.time('merge_fill'):
+            builder = price_table_builder()
+            for ticker, df_ticker in fetched.items():
+                builder.add(ticker, df_ticker['time'].values, df_ticker[ticker].values)
+            df_price_source2 = builder.build()
+        source2_time = df_price_source2['time'].iloc[0]  # latest quote time
+
+        bar = None  # new bar written to the persistent cache
+        with self.lock:
+            self.source2_time = source2_time
+
+            # update the price with the real-time price if it is available; if no, no update to the price
+            if self.source2_time > self.latest_time:
+                # use backward then forward fill to deal with missing stock price after combining all tickers
+                self.fill_NA(df_price_source2)
+                # only keep the latest row (ignoring the few seconds time delay when requesting for the latest price of different tickers)
+                # the older quotes of the other tickers were filled into it by the backward fill above
+                df_price_source2 = df_price_source2.iloc[:1]
+                # tickers without a quote (failed, or added during the request) keep their previous price
+                store = self.price_store
+                last_price = pd.Series(store.values[store.size - 1], index=store.tickers)
+                bar_price = df_price_source2.iloc[0].reindex(store.tickers).fillna(last_price).values.astype(float)
+                df_price_source2 = pd.DataFrame([bar_price], columns=store.tickers)
+                df_price_source2.insert(0, 'time', [self.source2_time])
+                # cache the newly added price from source 2
+                self.price_realtime = df_price_source2
+                # append the new bar to the price database if there are newer data available
+                store.append(self.source2_time, bar_price)
+                # update latest time
+                self.latest_time = self.source2_time
+                # check db status
+                self.status = "price updated to latest!"
+
+                # let listeners extend their results with the new bar only
+                self.events.append([(listener.on_realtime, (df_price_source2,)) for listener in self.listeners])
+
+                # bars leaving the hot tier are downsampled or evicted
+                self.apply_retention()
+
+                # only the tickers quoted in this tick are written through: a carried forward price is not a bar of
+                # its ticker, its cached history must stay incomplete so that it is completed from Source 1
+                quoted = [i for i, ticker in enumerate(store.tickers) if ticker in fetched]
+                bar = (self.source2_time, [store.tickers[i] for i in quoted], bar_price[quoted])
+
+        self.notify()
+
+        # write the new bar through to the persistent cache (disk, no lock held)
+        if bar is not None and self.price_cache is not None:
+            self.price_cache.save_bar(*bar)
+
+    def apply_retention(self):
+        """
+        apply the retention tiers to the price database and queue the compaction of the listeners' results (called
+        under the lock, and only once per warm bucket)
+        """
+
+        if self.retention is None or not self.retention.due(self.latest_time):
+            return
+
+        with metrics.time('retention'):
+            hot_start, warm_start = self.retention.bounds(self.latest_time)
+            store = self.price_store.compact(hot_start, warm_start, self.retention.warm_sampling)
+            self.price_store = store
+            # the historical price is the first rows of the store
+            n_historical = np.searchsorted(store.times[:store.size], self.historical_time.to_datetime64(), side='right')
+            self.price_historical = store.to_frame().iloc[:n_historical]
+            self.events.append([(listener.on_compact, (hot_start, warm_start, self.retention.warm_sampling))
+                                for listener in self.listeners])
+            self.retention.applied = hot_start
+
+    def notify(self):
+        """
+        let the listeners process the queued changes of the price database, in order
+
+        # called after releasing the lock, so the listeners (report rebuilds, saves before compactions) block
+        # neither the next price update nor the readers of the price database. Whichever thread gets the listener
+        # lock processes every change queued so far, so when notify returns the caller's changes have been processed
+        """
+
+        with self.listener_lock:
+            while self.events:
+                for method, arguments in self.events.popleft():
+                    method(*arguments)
+
+    def update_price(self):
+        """
+        constantly update the stock price every "sampling_period" min (e.g. every 5 min if self.sampling_period = 5)
+        """
+
+        self.status = None  # reset status to None every time we re-update the price
+
+        # get historical stock price
+        try:
+            self.fetch_price_historical()  # fetch price from source 1
+        except Exception as e:
+            # waiters must not wait for a price database that will never come
+            self.price_error = str(e) if str(e) == 'invalid ticker' else 'database error (source 1)!'
+            self.price_ready.set()
+            raise Exception(self.price_error)
+
+        # constantly update stock price every "sampling_period" minutes
+        while True:
+            time.sleep(60 * self.sampling_period)  # sleep for the sampling_period for this task
+            try:
+                self.append_realtime_price()  # fetch and append price from source 2
+            except:
+                raise Exception("database error (source 2)!")
+
+    def update_price_thread(self):
+        """
+        keep updating stock prices from source 1 and source 2 in multi-threading mode
+        """
+
+        thread_db_update = threading.Thread(target=self.update_price)  # create thread for updating price
+        thread_db_update.daemon = True
+        thread_db_update.start()
+
+    def wait_price(self, timeout=None):
+        """
+        wait (blocked, not spinning) until the historical price has been loaded
+
+        :param timeout: seconds to wait at most, None to wait until loaded
+        :return: True if loaded, False if still loading after the timeout
+        """
+
+        loaded = self.price_ready.wait(timeout)
+        if self.price_error is not None:
+            raise Exception(self.price_error)
+
+        return loaded
+
+    def get_price(self, latest):
+        """
+        :return: price database representing historical or latest price
+        """
+
+        if latest:
+            # updated price (a frame over the current store, readers never lock)
+            store = self.price_store
+            return store.to_frame() if store is not None else None
+        else:
+            return self.price_historical  # historical price from source 1
+
+    # def regenerate_database(self):
+    #     """
+    #     mark new_db as True to signal that the tickers have been updated and the price database needs to be re-generated
+    #     """
+    #
+    #     self.regenerate_db_flag = True
+
+    def delete_from_db(self, ticker_deleted):
+        """
+        delete a ticker's data from the price database
+        """
+
+        while True:
+            # copy the price database without the ticker outside the lock; the copy is only swapped in if no bar or
+            # ticker came in meanwhile, otherwise it is made again
+            store_before = self.price_store
+            store = store_before.without_ticker(ticker_deleted) if store_before is not None else None
+            with self.lock:
+                if ticker_deleted not in self.tickers:
+                    raise Exception("ticker not found")
+                if self.price_store is not store_before or (store is not None and store_before.size != store.size):
+                    continue
+
+                # if ticker is found in the current list, we delete its data from current price database
+                self.tickers.remove(ticker_deleted)
+                if store is not None:
+                    self.price_store = store
+                    # the historical price is the first rows of the store
+                    self.price_historical = store.to_frame().iloc[:len(self.price_historical)]
+                if self.price_realtime is not None:
+                    self.price_realtime = self.price_realtime.drop(columns=ticker_deleted, errors='ignore')
+                self.events.append([(listener.on_delete, (ticker_deleted,)) for listener in self.listeners])
+            break
+
+        self.notify()
+
+    def add_to_db(self, ticker_added):
+        """
+        add a new ticker's data to the price database
+        """
+
+        # only add ticker if it does not exist in current tickers list already
+        if ticker_added not in self.tickers:
+            # backfill only the new ticker (network or cache, no lock held). An invalid ticker raises here
+            if self.price_cache is None:
+                df_ticker = self.fetch_ticker_source1(ticker_added)
+                times, closes = df_ticker['time'].values, df_ticker[ticker_added].values
+            else:
+                times, closes = self.price_cache.load(ticker_added)
+                if not self.price_cache.is_current(times):
+                    try:
+                        times, closes = self.fetch_ticker_cached(ticker_added, times, closes)
+                    except Exception:
+                        if not len(times):  # nothing cached to fall back on
+                            raise
+
+            # if this step is reached, then ticker is valid
+            df_ticker = pd.DataFrame({ticker_added: np.asarray(closes, dtype=np.float64)},
+                                     index=pd.DatetimeIndex(times, name='time')).sort_index()
+            while True:
+                # splice its column into a copy of the price database outside the lock (made again if a bar or a
+                # ticker came in meanwhile)
+                store_before = self.price_store
+                store = store_before.with_ticker(ticker_added, times, closes) if store_before is not None else None
+                with self.lock:
+                    if ticker_added in self.tickers:  # added by another client in the meantime
+                        return
+                    if self.price_store is None:
+                        raise Exception('database error (source 1)!')
+                    if self.price_store is not store_before or store_before.size != store.size:
+                        continue
+
+                    self.price_store = store
+                    self.price_historical = store.to_frame().iloc[:len(self.price_historical)]
+                    self.failed_tickers.pop(ticker_added, None)
+                    # the running updater fetches its real-time price from the next tick on
+                    self.tickers.append(ticker_added)
+
+                    self.events.append([(listener.on_add, (ticker_added, store.to_frame(), df_ticker))
+                                        for listener in self.listeners])
+                break
+
+            self.notify()
+
+class trading_strategy:
+    """
+    generate trading strategy analytics based on stock price
+
+    :param tickers: list of stock tickers
+    :type tickers: List of Strings
+    :param sampling_period: one of (5, 15, 30, 60), with unit in minutes
+    :type sampling_period: Int
+    :param shards: strategy_shards process pool computing the strategy of ticker shards in parallel (None: serial)
+    :param rolling_period: rolling window of the mean and std, e.g. '24h'
+    :param min_rolling_periods: minimum number of prices in the window for valid rolling stats
+    :param band: signal band in rolling std: 1 above mean+band*std, -1 below mean-band*std
+    :param rolling_cache: rolling_stats_cache shared with other strategies on the same price (None: no sharing)
+    """
+
+    def __init__(self, shards=None, rolling_period='24h', min_rolling_periods=15, band=1, rolling_cache=None):
+        self.rolling_period = rolling_period
+        self.min_rolling_periods = min_rolling_periods
+        self.band = band
+        self.tickers = None
+        self.price = None
+        self.rolling_mean = None
+        self.rolling_std = None
+        self.shards = shards
+        self.rolling_cache = rolling_cache
+
+    @staticmethod
+    def index_time_ascd(df):
+        """
+        generate a df with index set to time in ascending order
+
+        # df from the price store is already indexed by time in ascending order and is returned as is
+        """
+
+        df_update = df.set_index('time', inplace=False) if 'time' in df.columns else df  # set time to index
+        if not df_update.index.is_monotonic_increasing:
+            df_update = df_update.sort_index()  # sort time index in ascending order
+
+        return df_update
+
+    def drop_ticker(self, ticker_deleted):
+        """
+        drop a deleted ticker from the cached price and rolling stats
+        """
+
+        if self.tickers is not None and ticker_deleted in self.tickers:
+            self.tickers = [ticker for ticker in self.tickers if ticker != ticker_deleted]
+        for name in ('price', 'rolling_mean', 'rolling_std'):
+            df = getattr(self, name)
+            if df is not None:
+                setattr(self, name, df.drop(columns=ticker_deleted, errors='ignore'))
+
+    def calc_rolling_stats(self, df_price_raw):
+        """
+        calc rolling stats: 24 hours rolling period: e.g. 3pm yesterday to 3pm today
+
+        :param df_price_raw: df containing ticker's price (from database.get_price)
+        :type df_price_raw: dataframe
+        """
+
+        # strategies with the same window read the stats computed by the first one
+        if self.rolling_cache is not None:
+            self.rolling_mean, self.rolling_std, self.price = self.rolling_cache.rolling_stats(
+                df_price_raw, self.rolling_period, self.min_rolling_periods)
+            return
+
+        self.rolling_mean, self.rolling_std, self.price = self.rolling_stats(
+            df_price_raw, self.rolling_period, self.min_rolling_periods)
+
+    @staticmethod
+    def rolling_stats(df_price_raw, rolling_period, min_rolling_periods):
+        """
+        rolling mean and std of the price, on the rows where they are valid
+
+        :return: df of rolling mean, df of rolling std, df of price aligned with them
+        """
+
+        # proprocess raw df_price
+        df_price = trading_strategy.index_time_ascd(df_price_raw)
+
+        # calc rolling mean and std.
+        rolling_mean = df_price.rolling(rolling_period, min_periods=min_rolling_periods).mean().astype(float)
+        rolling_mean.dropna(inplace=True)
+        rolling_std = df_price.rolling(rolling_period, min_rolling_periods).std().astype(float)
+        rolling_std.dropna(inplace=True)
+
+        # make sure that price index aligns with rolling stats index
+        price = df_price.loc[rolling_mean.index].astype(float)
+
+        return rolling_mean, rolling_std, price
+
+    def momentum_strategy(self, df_price):
+        """
+        Implement the momentum strategy to generate trading signal based on price, rolling mean and rolling std
+
+        :param df_price: price database with time index of ascending order
+        :return: df of trading signal and price
+        """
+
+        # get price, rolling mean, rolling std
+        with metrics.time('rolling_stats'):
+            self.calc_rolling_stats(df_price)
+
+        return self.momentum_signal()
+
+    def momentum_signal(self):
+        """
+        trading signal from the price and rolling stats of the valid rows (self.price, self.rolling_mean,
+        self.rolling_std)
+
+        :return: df of trading signal and price
+        """
+
+        with metrics.time('signal'):
+            # implement momentum strategy
+            signal_list = np.where(self.price > self.rolling_mean + self.band * self.rolling_std, 1,
+                                   np.where(self.price < self.rolling_mean - self.band * self.rolling_std, -1, np.nan))
+
+            # trading signal cald'd at time t would apply to t+1 period, so adjust the index for this
+            signal_list = signal_list[:-1]
+            time_index = self.price.index[1:]
+
+            # get tickers list
+            self.tickers = list(self.price.columns.values)
+
+            # generate signal dataframe and clean it
+            df_signal = pd.DataFrame(signal_list, columns=self.tickers, index=time_index)
+
+            # fill na: if mean-std < price < mean+std, signal(t+1) = signal(t), so use forward fill
+            df_signal.fillna(method='ffill', inplace=True)
+            df_signal.fillna(0, inplace=True)  # deal with the case where the earliest few records might have NA signals
+            df_signal = df_signal.astype(int)
+
+        return df_signal, self.price  # df_price has one more row than df_signal
+
+    def calc_pnl(self, df_signal, df_price):
+        """
+        calc the pnl based on (price(t+1) - price(t)) * signal(t)
+
+        :return: df of pnl
+        """
+
+        # price(t+1) - price(t), shared by the strategies with the same window
+        if self.rolling_cache is not None:
+            df_price_diff = self.rolling_cache.price_diff(df_price)
+        else:
+            df_price_diff = df_price.diff()
+
+        # signal starts at 5:20 ends at 20:00, price starts at 5:15 ends at 20:00
+        # Therefore, we need price from 5:20 to 20:00 and signal from 5:20 to 20:00 - delta_t
+        df_price_diff = df_price_diff[2:]  # adjust price time series
+        df_signal = df_signal[:-1]  # adjust signal time series
+        df_signal.index = df_price_diff.index  # reset index for signal
+
+        # calc pnl
+        df_pnl = df_price_diff * df_signal
+
+        return df_pnl
+
+    def run(self, df_price_raw):
+        """
+        momentum strategy and pnl of all tickers, sharded across the process pool if there is one
+
+        :return: df of trading signal, df of price, df of pnl
+        """
+
+        # the rolling stats of this window may already be in the cache, then only the (cheap) signal is left
+        shared = self.rolling_cache is not None and self.rolling_cache.has(
+            df_price_raw, self.rolling_period, self.min_rolling_periods)
+        if self.shards is not None and not shared:
+            with metrics.time('strategy_sharded'):
+                results = self.shards.compute(self, df_price_raw)
+            if results is not None:
+                return results
+
+        # serial computation
+        df_signal, df_price = self.momentum_strategy(df_price_raw)
+        with metrics.time('pnl'):
+            df_pnl = self.calc_pnl(df_signal, df_price)
+
+        return df_signal, df_price, df_pnl
+
+class rolling_stats_cache:
+    """
+    intermediates shared by the strategies running on the same price frame: rolling mean/std per
+    (window, min periods) and the price diffs of the valid rows
+
+    # entries are keyed by the identity of the price frame and the cache holds a reference to it, so a new frame
+    # from the database never reads stale entries. reset() releases them once all strategies are built
+    """
+
+    def __init__(self):
+        self.frame = None  # price frame the entries belong to
+        self.stats = {}  # (rolling_period, min_rolling_periods): (rolling mean, rolling std, price)
+        self.diffs = {}  # id(price): (price, price diff)
+
+    def reset(self):
+        self.frame = None
+        self.stats = {}
+        self.diffs = {}
+
+    def has(self, df_price_raw, rolling_period, min_rolling_periods):
+        return df_price_raw is self.frame and (rolling_period, min_rolling_periods) in self.stats
+
+    def put(self, df_price_raw, rolling_period, min_rolling_periods, stats):
+        if df_price_raw is not self.frame:
+            self.reset()
+            self.frame = df_price_raw
+        self.stats[(rolling_period, min_rolling_periods)] = stats
+
+    def rolling_stats(self, df_price_raw, rolling_period, min_rolling_periods):
+        """
+        :return: df of rolling mean, df of rolling std, df of price (computed on the first call of a window)
+        """
+
+        if not self.has(df_price_raw, rolling_period, min_rolling_periods):
+            self.put(df_price_raw, rolling_period, min_rolling_periods,
+                     trading_strategy.rolling_stats(df_price_raw, rolling_period, min_rolling_periods))
+
+        return self.stats[(rolling_period, min_rolling_periods)]
+
+    def price_diff(self, df_price):
+        """
+        :return: price(t+1) - price(t) of a price df returned by rolling_stats
+        """
+
+        if id(df_price) not in self.diffs:
+            self.diffs[id(df_price)] = (df_price, df_price.diff())
+
+        return self.diffs[id(df_price)][1]
+
+class strategy_shards:
+    """
+    sharded trading strategy computation: the ticker columns are split across a process pool
+
+    # the price matrix and the results are exchanged through shared memory, only block names and column ranges are
+    # sent to the workers. Each worker runs the same pandas computation as trading_strategy on its column block, and
+    # rows are dropped with the mask of all tickers (as the serial dropna does), so the output is identical.
+    # Two rounds: rolling stats, then (once the valid rows of all tickers are known) signal and pnl
+
+    :param workers: number of worker processes
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        # spawned (not forked) workers: the server process runs many threads
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    @staticmethod
+    def create_block(shape, dtype):
+        """
+        :return: new shared memory block and the array over it
+        """
+
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+
+        return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    @staticmethod
+    def attach_block(name, shape, dtype):
+        """
+        :return: existing shared memory block (opened in a worker) and the array over it
+        """
+
+        block = shared_memory.SharedMemory(name=name)  # the parent owns the block and unlinks it
+
+        return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    @staticmethod
+    def rolling_shard(names, n_rows, n_tickers, start, stop, rolling_period, min_periods):
+        """
+        worker: rolling mean and std of the columns start:stop
+        """
+
+        blocks = []
+        try:
+            times = strategy_shards.attach_block(names['times'], (n_rows,), 'datetime64[ns]')
+            price, mean, std = [strategy_shards.attach_block(names[key], (n_rows, n_tickers), np.float64)
+                                for key in ('price', 'mean', 'std')]
+            blocks = [times[0], price[0], mean[0], std[0]]
+
+            df_price = pd.DataFrame(price[1][:, start:stop], index=pd.DatetimeIndex(times[1]))
+            mean[1][:, start:stop] = df_price.rolling(rolling_period, min_periods=min_periods).mean().astype(float).values
+            std[1][:, start:stop] = df_price.rolling(rolling_period, min_periods).std().astype(float).values
+        finally:
+            for block in blocks:
+                block.close()
+
+    @staticmethod
+    def signal_shard(names, n_rows, n_tickers, valid_rows, start, stop, band=1):
+        """
+        worker: signal and pnl of the columns start:stop on the valid rows
+        """
+
+        n_valid = len(valid_rows)
+        blocks = []
+        try:
+            price, mean, std = [strategy_shards.attach_block(names[key], (n_rows, n_tickers), np.float64)
+                                for key in ('price', 'mean', 'std')]
+            signal = strategy_shards.attach_block(names['signal'], (n_valid - 1, n_tickers), np.int64)
+            pnl = strategy_shards.attach_block(names['pnl'], (n_valid - 2, n_tickers), np.float64)
+            blocks = [price[0], mean[0], std[0], signal[0], pnl[0]]
+
+            # same steps as trading_strategy.momentum_strategy and calc_pnl
+            price_valid = price[1][valid_rows, start:stop]
+            mean_valid = mean[1][valid_rows, start:stop]
+            std_valid = std[1][valid_rows, start:stop]
+            signal_list = np.where(price_valid > mean_valid + band * std_valid, 1,
+                                   np.where(price_valid < mean_valid - band * std_valid, -1, np.nan))
+            df_signal = pd.DataFrame(signal_list[:-1])
+            df_signal.fillna(method='ffill', inplace=True)
+            df_signal.fillna(0, inplace=True)
+            df_signal = df_signal.astype(int)
+            signal[1][:, start:stop] = df_signal.values
+
+            df_price_diff = pd.DataFrame(price_valid).diff()[2:]
+            df_pnl = df_price_diff.values * df_signal.values[:-1]
+            pnl[1][:, start:stop] = df_pnl
+        finally:
+            for block in blocks:
+                block.close()
+
+    def compute(self, strategy, df_price_raw):
+        """
+        momentum strategy and pnl of all tickers, computed shard by shard in the worker processes
+
+        :param strategy: trading_strategy whose parameters are used and whose cached stats are set
+        :return: df of trading signal, df of price, df of pnl (None if too few rows to shard, use the serial path)
+        """
+
+        df_price_all = strategy.index_time_ascd(df_price_raw).astype(float)
+        tickers = list(df_price_all.columns.values)
+        n_rows, n_tickers = df_price_all.shape
+        bounds = np.linspace(0, n_tickers, min(self.workers, n_tickers) + 1).astype(int)
+        shards = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+        blocks = []
+        try:
+            # inputs and rolling stats
+            times = self.create_block((n_rows,), 'datetime64[ns]')
+            price, mean, std = [self.create_block((n_rows, n_tickers), np.float64) for _ in range(3)]
+            blocks += [times[0], price[0], mean[0], std[0]]
+            times[1][:] = df_price_all.index.values
+            price[1][:] = df_price_all.values
+            names = {'times': times[0].name, 'price': price[0].name, 'mean': mean[0].name, 'std': std[0].name}
+            futures = [self.executor.submit(self.rolling_shard, names, n_rows, n_tickers, start, stop,
+                                            strategy.rolling_period, strategy.min_rolling_periods)
+                       for start, stop in shards]
+            for future in futures:
+                future.result()
+
+            # rows with valid rolling stats for every ticker (the serial dropna)
+            valid_rows = np.flatnonzero(~np.isnan(mean[1]).any(axis=1))
+            n_valid = len(valid_rows)
+            if n_valid < 3:
+                return None
+
+            # signal and pnl
+            signal = self.create_block((n_valid - 1, n_tickers), np.int64)
+            pnl = self.create_block((n_valid - 2, n_tickers), np.float64)
+            blocks += [signal[0], pnl[0]]
+            names.update({'signal': signal[0].name, 'pnl': pnl[0].name})
+            futures = [self.executor.submit(self.signal_shard, names, n_rows, n_tickers, valid_rows, start, stop,
+                                            strategy.band)
+                       for start, stop in shards]
+            for future in futures:
+                future.result()
+
+            # gather (copied out of the shared blocks before they are released)
+            time_index = df_price_all.index[valid_rows]
+            strategy.tickers = tickers
+            strategy.rolling_mean = pd.DataFrame(mean[1][valid_rows], index=time_index, columns=tickers)
+            strategy.rolling_std = pd.DataFrame(std[1][valid_rows], index=time_index, columns=tickers)
+            strategy.price = pd.DataFrame(price[1][valid_rows], index=time_index, columns=tickers)
+            df_signal = pd.DataFrame(signal[1].copy(), index=time_index[1:], columns=tickers)
+            df_pnl = pd.DataFrame(pnl[1].copy(), index=time_index[2:], columns=tickers)
+            if strategy.rolling_cache is not None:  # other strategies with the same window reuse the stats
+                strategy.rolling_cache.put(df_price_raw, strategy.rolling_period, strategy.min_rolling_periods,
+                                           (strategy.rolling_mean, strategy.rolling_std, strategy.price))
+
+            return df_signal, strategy.price, df_pnl
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+class rolling_window:
+    """
+    streaming rolling mean and std for all tickers, updated in constant time for every new bar
+
+    # mirrors the add/remove updates of pandas rolling mean (Kahan summation) and rolling std (Welford's method),
+    # so the results are identical to trading_strategy.calc_rolling_stats as long as every bar is fed in time order
+
+    :param n_tickers: number of tickers (one accumulator per ticker)
+    :param rolling_period: window length, e.g. '24h'
+    :param min_periods: minimum number of observations in the window to output a value
+    """
+
+    def __init__(self, n_tickers, rolling_period, min_periods):
+        self.rolling_period = pd.Timedelta(rolling_period)
+        self.min_periods = min_periods
+        self.bars = deque()  # (time, price) of the bars inside the window, time ascending
+        self.reset(n_tickers)
+
+    def reset(self, n_tickers):
+        """
+        clear the accumulators, e.g. when every bar of the previous window has been evicted
+        """
+
+        zeros = np.zeros(n_tickers)
+        # rolling mean state
+        self.nobs = zeros.copy()
+        self.sum_x = zeros.copy()
+        self.neg_ct = zeros.copy()
+        self.compensation_add = zeros.copy()
+        self.compensation_remove = zeros.copy()
+        self.same_value_ct = zeros.copy()
+        self.prev_value = zeros.copy()
+        # rolling variance state
+        self.mean_x = zeros.copy()
+        self.ssqdm_x = zeros.copy()
+        self.var_compensation_add = zeros.copy()
+        self.var_compensation_remove = zeros.copy()
+
+    def add(self, price):
+        """
+        add one bar to the accumulators (nan prices are skipped)
+        """
+
+        valid = ~np.isnan(price)
+        val = np.where(valid, price, 0)
+        self.nobs = self.nobs + valid
+
+        # record number of consecutive same values to remove floating point artifacts
+        same = valid & (price == self.prev_value)
+        self.same_value_ct = np.where(same, self.same_value_ct + 1, np.where(valid, 1, self.same_value_ct))
+        self.prev_value = np.where(valid, price, self.prev_value)
+
+        # mean: Kahan summation
+        y = val - self.compensation_add
+        t = self.sum_x + y
+        self.compensation_add = np.where(valid, t - self.sum_x - y, self.compensation_add)
+        self.sum_x = np.where(valid, t, self.sum_x)
+        self.neg_ct = self.neg_ct + (valid & np.signbit(price))
+
+        # variance: Welford's method with Kahan summation
+        prev_mean = self.mean_x - self.var_compensation_add
+        y = val - self.var_compensation_add
+        t = y - self.mean_x
+        self.var_compensation_add = np.where(valid, t + self.mean_x - y, self.var_compensation_add)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = self.mean_x + t / self.nobs
+        ssqdm_x = self.ssqdm_x + (val - prev_mean) * (val - mean_x)
+        self.mean_x = np.where(valid, mean_x, self.mean_x)
+        self.ssqdm_x = np.where(valid, ssqdm_x, self.ssqdm_x)
+
+    def remove(self, price):
+        """
+        remove one bar that has left the window from the accumulators
+        """
+
+        valid = ~np.isnan(price)
+        val = np.where(valid, price, 0)
+        self.nobs = self.nobs - valid
+
+        # mean
+        y = -val - self.compensation_remove
+        t = self.sum_x + y
+        self.compensation_remove = np.where(valid, t - self.sum_x - y, self.compensation_remove)
+        self.sum_x = np.where(valid, t, self.sum_x)
+        self.neg_ct = self.neg_ct - (valid & np.signbit(price))
+
+        # variance, reset when the window becomes empty
+        prev_mean = self.mean_x - self.var_compensation_remove
+        y = val - self.var_compensation_remove
+        t = y - self.mean_x
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = self.mean_x - t / self.nobs
+        ssqdm_x = self.ssqdm_x - (val - prev_mean) * (val - mean_x)
+        empty = valid & (self.nobs == 0)
+        removed = valid & ~empty
+        self.var_compensation_remove = np.where(removed, t + self.mean_x - y, self.var_compensation_remove)
+        self.mean_x = np.where(removed, mean_x, np.where(empty, 0, self.mean_x))
+        self.ssqdm_x = np.where(removed, ssqdm_x, np.where(empty, 0, self.ssqdm_x))
+
+    def update(self, bar_time, price):
+        """
+        slide the window to (bar_time - rolling_period, bar_time] with the new bar included
+
+        :return: rolling mean and rolling std of every ticker (nan if not enough observations)
+        """
+
+        price = np.asarray(price, dtype=float)
+
+        # evict the bars that are out of the window
+        evicted = []
+        while self.bars and bar_time - self.bars[0][0] >= self.rolling_period:
+            evicted.append(self.bars.popleft()[1])
+
+        if not self.bars:
+            # nothing left from the previous window: start over from the new bar
+            self.reset(len(price))
+            self.prev_value = price.copy()
+        else:
+            for old_price in evicted:
+                self.remove(old_price)
+
+        self.add(price)
+        self.bars.append((bar_time, price))
+
+        return self.calc_mean(), self.calc_std()
+
+    def calc_mean(self):
+        """
+        rolling mean from the current accumulators
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = self.sum_x / self.nobs
+        result = np.where(self.same_value_ct >= self.nobs, self.prev_value, result)
+        result = np.where((self.same_value_ct < self.nobs) & (self.neg_ct == 0) & (result < 0), 0, result)
+        result = np.where((self.same_value_ct < self.nobs) & (self.neg_ct == self.nobs) & (result > 0), 0, result)
+
+        return np.where((self.nobs >= self.min_periods) & (self.nobs > 0), result, np.nan)
+
+    def calc_std(self):
+        """
+        rolling std (ddof=1) from the current accumulators
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = self.ssqdm_x / (self.nobs - 1)
+        result = np.where((self.nobs == 1) | (self.same_value_ct >= self.nobs), 0, result)
+        result = np.where((self.nobs >= max(self.min_periods, 1)) & (self.nobs > 1), result, np.nan)
+
+        return np.sqrt(np.where(result < 0, 0, result))
+
+    def drop(self, keep):
+        """
+        keep only the accumulators (and window prices) of the tickers at positions "keep"
+        """
+
+        for name in ['nobs', 'sum_x', 'neg_ct', 'compensation_add', 'compensation_remove', 'same_value_ct',
+                     'prev_value', 'mean_x', 'ssqdm_x', 'var_compensation_add', 'var_compensation_remove']:
+            setattr(self, name, getattr(self, name)[keep])
+        self.bars = deque((bar_time, price[keep]) for bar_time, price in self.bars)
+
+    def join(self, other):
+        """
+        append the accumulators (and window prices) of the tickers of another window fed with the same bars
+        """
+
+        for name in ['nobs', 'sum_x', 'neg_ct', 'compensation_add', 'compensation_remove', 'same_value_ct',
+                     'prev_value', 'mean_x', 'ssqdm_x', 'var_compensation_add', 'var_compensation_remove']:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+        self.bars = deque((bar_time, np.concatenate([price, other_price]))
+                          for (bar_time, price), (_, other_price) in zip(self.bars, other.bars))
+
+    @staticmethod
+    def replay(df_price, rolling_period, min_periods):
+        """
+        :param df_price: price with time index (ascending), one column per ticker
+        :return: rolling_window fed with every bar of df_price
+
+        # the accumulators start over whenever the window becomes empty (a gap of at least the rolling period), so
+        # only the bars since the latest gap are fed
+        """
+
+        rolling = rolling_window(df_price.shape[1], rolling_period, min_periods)
+        times = df_price.index.values
+        gaps = np.flatnonzero(np.diff(times) >= pd.Timedelta(rolling_period).to_timedelta64())
+        start = gaps[-1] + 1 if len(gaps) else 0
+        for bar_time, bar_price in zip(df_price.index[start:], df_price.values[start:].astype(float)):
+            rolling.update(bar_time, bar_price)
+
+        return rolling
+
+class genReport:
+    """
+    generate trading strategy report based on stock price and strategy analytics
+
+    :param report_format: 'csv' (report.csv), 'binary' (memory-mappable columns in report_bin) or 'both'
+    :param report_layout: layout of report.csv, 'long' (one row per time and ticker) or 'wide' (one row per time)
+    """
+
+    def __init__(self, report_format='csv', report_layout='long'):
+        # saves only the rows added since the last save
+        self.writer = report_writer(os.getcwd(), report_format, report_layout)
+
+    @staticmethod
+    def combine_df(df_pnl, df_signal, df_price):
+        """
+        combine df_price, df_pnl, df_signal (aligned on the same time index and tickers) to form the long format
+        report dataframe: one row per time and ticker, times ascending and tickers in column order
+
+        # built straight from the arrays (row-major ravel, times repeated, tickers tiled), no stack and no joins.
+        # Entries with a missing price or pnl are left out, as stacking and joining the three frames did
+        # datetime column stays datetime64 for fast lookups; it is only formatted when saved
+        """
+
+        n_times, n_tickers = df_price.shape
+        price = df_price.values.ravel()
+        signal = df_signal.values.ravel()
+        pnl = df_pnl.values.ravel()
+        keep = ~(np.isnan(price) | np.isnan(pnl))
+
+        df_report = pd.DataFrame({'datetime': np.repeat(df_price.index.values, n_tickers)[keep],
+                                  'ticker': np.tile(np.asarray(df_price.columns, dtype=object), n_times)[keep],
+                                  'price': price[keep],
+                                  'signal': signal[keep],
+                                  'pnl': pnl[keep]})
+
+        return df_report
+
+    @staticmethod
+    def long_to_wide(df_report):
+        """
+        convert long format report rows to the wide format (tickers in the order of the report)
+        """
+
+        tickers = pd.unique(df_report['ticker'])
+        df_wide = pd.concat({field: df_report.pivot(index='datetime', columns='ticker', values=field)[tickers]
+                             for field in ('price', 'signal', 'pnl')}, axis=1)
+
+        return df_wide
+
+    def generate_report(self, df_pnl, df_signal, df_price, save):
+        """
+        generate the pnl, price, signal time series report for the requested tickers
+        """
+
+        # ensure correct formats for all input dataframes
+        # align the time index for df_price, df_signal with df_pnl
+        df_price = df_price.loc[df_pnl.index]
+        df_signal = df_signal.loc[df_pnl.index]
+        # adjust price and pnl's output to be two decimal places
+        df_price = df_price.round(2)
+        df_pnl = df_pnl.round(2)
+
+        # concatenate all columns for df_price, df_signal and df_pnl
+        with metrics.time('report_assembly'):
+            df_report = self.combine_df(df_pnl, df_signal, df_price)
+
+        # save the report to local
+        if save:
+            self.save_report(df_report)
+
+        return df_report
+
+    def save_report(self, df_report, generation=None):
+        """
+        save the report to local as report.csv (and/or the binary report)
+
+        :param generation: generation of the report (see report_snapshot). Reports of the same generation only
+                           grow, so only their new rows are appended; None always rewrites the files
+        """
+
+        with metrics.time('report_save'):
+            paths = self.writer.save(df_report, generation)
+        self.print_paths(paths)
+
+    def save_snapshot(self, snapshot):
+        """
+        save the rows of a report_snapshot that are not on disk yet (only those rows are turned into a df)
+        """
+
+        with metrics.time('report_save'):
+            paths = self.writer.save_snapshot(snapshot)
+        self.print_paths(paths)
+
+    @staticmethod
+    def print_paths(paths):
+        print("report saved at this address: ")
+        for filepath in paths:
+            print(filepath)
+        print()
+
+    @staticmethod
+    def index_report(df_report):
+        """
+        index the time-sorted report by timestamp
+
+        :return: array of the distinct report times (datetime64, ascending) and the row offsets where each time
+                 starts, followed by the total number of rows (so rows of time i are offsets[i]:offsets[i+1])
+        """
+
+        report_time = df_report['datetime'].values
+        starts = np.flatnonzero(np.concatenate(([True], report_time[1:] != report_time[:-1]))) if len(report_time) \
+            else np.zeros(0, dtype=np.int64)
+        offsets = np.append(starts, len(report_time))
+
+        return report_time[starts], offsets
+
+    def query_data(self, df_report, query_time, report_times=None, report_offsets=None):
+        """
+        query from report for latest price and signal available as of the time specified
+
+        :param report_times, report_offsets: index of the report from index_report (built here if not given)
+        """
+
+        if report_times is None:
+            report_times, report_offsets = self.index_report(df_report)
+
+        return self.query_rows(df_report, report_offsets, self.resolve_query(report_times, query_time))
+
+    @staticmethod
+    def resolve_query(report_times, query_time):
+        """
+        snap a query time to the report time it resolves to
+
+        :return: position of the latest report time as of query_time in report_times
+        """
+
+        # binary search the latest report time as of the query_time. Report times count at minute resolution (as
+        # formatted in the report), i.e. time t is as of query_time if t < floor(query_time, minute) + 1 minute
+        query_end = (pd.Timestamp(query_time).floor('min') + pd.Timedelta(minutes=1)).to_datetime64()
+        i = np.searchsorted(report_times, query_end, side='left') - 1
+        if i < 0:
+            raise Exception("no data as of the query time")
+
+        return i
+
+    @staticmethod
+    def query_rows(df_report, report_offsets, i):
+        """
+        :return: "TICKER   price,signal" rows of the report time at position i
+        """
+
+        return genReport.format_rows(df_report.iloc[report_offsets[i]:report_offsets[i + 1]])
+
+    @staticmethod
+    def format_rows(df_rows, pnl=False):
+        """
+        :param pnl: whether the rows end with the pnl, "TICKER   price,signal,pnl" (like the subscription pushes)
+        :return: "TICKER   price,signal" rows of report rows
+        """
+
+        latest_info = df_rows[['ticker', 'price', 'signal'] + (['pnl'] if pnl else [])].copy()
+
+        # format the result
+        latest_info['result'] = latest_info['ticker'].astype(str) + "   " + \
+                                latest_info['price'].astype(str) + "," + \
+                                latest_info["signal"].astype(str)
+        if pnl:
+            latest_info['result'] += "," + latest_info['pnl'].astype(str)
+        result = latest_info['result'].to_list()
+
+        return result
+
+class report_writer:
+    """
+    append-only report files: report.csv and/or a binary columnar report (report_bin)
+
+    # the report only grows between rebuilds, so a save appends the rows newer than the latest report time on disk
+    # instead of rewriting the whole file. A rebuilt report (new generation) is rewritten once, unless it has been
+    # compacted by the retention tiers: the files are never rewritten from a downsampled or evicted report, they keep
+    # the rows saved before and only newer rows are appended (the report is saved before every compaction, see
+    # strategy_engine.on_compact)
+    # wide layout: a ticker added later gets its columns in the file (empty before), a deleted ticker keeps them
+    # binary report: one raw little-endian file per column plus meta.json (row count, tickers, dtypes). The column
+    # files can be memory-mapped by other processes (see load_binary): a rewrite replaces them with new files instead
+    # of truncating them, and meta.json is replaced last, after the rows are written, so readers never see a partly
+    # written row
+
+    :param directory: directory of the report files
+    :param report_format: 'csv', 'binary' or 'both'
+    :param report_layout: layout of report.csv, 'long' or 'wide' (see report_writer.write_wide)
+    """
+
+    binary_columns = {'datetime': '<i8', 'ticker': '<i4', 'price': '<f8', 'signal': '<i8', 'pnl': '<f8'}
+
+    def __init__(self, directory, report_format='csv', report_layout='long'):
+        self.csv_path = os.path.join(directory, 'report.csv')
+        self.layout = report_layout
+        self.binary_path = os.path.join(directory, 'report_bin')
+        self.formats = ['csv', 'binary'] if report_format == 'both' else [report_format]
+        self.generation = None  # generation of the report on disk
+        self.saved_until = None  # latest report time on disk (datetime64)
+        self.disk_rows = 0  # rows in the binary report files
+        self.tickers = []  # ticker codes of the binary report
+        self.csv_tickers = []  # tickers of the wide report.csv columns
+        self.lock = threading.Lock()  # one save at a time
+
+    def rewrite(self, generation, complete=True):
+        """
+        whether a save of a report of this generation rewrites the files
+
+        :param complete: whether the report has all its rows (not compacted by the retention tiers)
+        """
+
+        if generation is None or self.generation is None:  # unknown report, or nothing written yet
+            return True
+
+        return complete and generation != self.generation
+
+    def save(self, df_report, generation=None):
+        """
+        write the rows of df_report (long format, time sorted) that are not on disk yet
+
+        :return: paths of the files written
+        """
+
+        with self.lock:
+            rewrite = self.rewrite(generation)
+            start = 0 if rewrite or self.saved_until is None else \
+                np.searchsorted(df_report['datetime'].values, self.saved_until, side='right')
+
+            return self.write(df_report.iloc[start:], rewrite, generation)
+
+    def save_snapshot(self, snapshot):
+        """
+        write the rows of a report_snapshot that are not on disk yet
+
+        :return: paths of the files written
+        """
+
+        with self.lock:
+            rewrite = self.rewrite(snapshot.generation, snapshot.complete)
+            i = 0 if rewrite or self.saved_until is None else \
+                np.searchsorted(snapshot.report_times, self.saved_until, side='right')
+
+            return self.write(snapshot.rows(snapshot.report_offsets[i], snapshot.size), rewrite, snapshot.generation)
+
+    def write(self, df_new, rewrite, generation):
+        """
+        write new rows to the report files (rewritten or appended to)
+        """
+
+        paths = []
+        if 'csv' in self.formats:
+            if self.layout == 'wide':
+                self.write_wide(df_new, rewrite)
+            else:
+                df_new.to_csv(self.csv_path, index=False, date_format='%Y-%m-%d-%H:%M', mode='w' if rewrite else 'a',
+                              header=rewrite)
+            paths.append(self.csv_path)
+        if 'binary' in self.formats:
+            self.disk_rows = len(df_new) if rewrite else self.disk_rows + len(df_new)
+            self.save_binary(df_new, rewrite, self.disk_rows)
+            paths.append(self.binary_path)
+
+        self.generation = generation
+        if len(df_new):
+            self.saved_until = df_new['datetime'].values[-1]
+        elif rewrite:
+            self.saved_until = None
+
+        return paths
+
+    def write_wide(self, df_new, rewrite):
+        """
+        write new rows to the wide report.csv (a bar's rows make one wide row)
+        """
+
+        if rewrite:
+            df_csv = genReport.long_to_wide(df_new)
+            self.csv_tickers = list(df_csv['price'].columns)
+            df_csv.to_csv(self.csv_path, date_format='%Y-%m-%d-%H:%M')
+            return
+        if not len(df_new):
+            return
+
+        df_csv = genReport.long_to_wide(df_new)
+        added = [ticker for ticker in df_csv['price'].columns if ticker not in self.csv_tickers]
+        if added:
+            # new columns for the tickers added since: the file is extended from its own rows, never rewritten from
+            # the report in memory
+            df_disk = pd.read_csv(self.csv_path, header=[0, 1], index_col=0)
+            self.csv_tickers += added
+            df_disk = df_disk.reindex(columns=self.wide_columns())
+            df_disk.to_csv(self.csv_path + '.tmp')
+            os.replace(self.csv_path + '.tmp', self.csv_path)
+        df_csv.reindex(columns=self.wide_columns()).to_csv(self.csv_path, date_format='%Y-%m-%d-%H:%M', mode='a',
+                                                           header=False)
+
+    def wide_columns(self):
+        return pd.MultiIndex.from_product([('price', 'signal', 'pnl'), self.csv_tickers])
+
+    def save_binary(self, df_new, rewrite, rows):
+        """
+        append the new rows to the column files and publish the new row count
+
+        # a rewrite goes to temporary files replaced over the old ones, so a reader that
+        # memory-mapped the old files keeps them intact (truncating a mapped file faults it)
+        """
+
+        os.makedirs(self.binary_path, exist_ok=True)
+        if rewrite:
+            self.tickers = []
+
+        # tickers are stored as codes into the ticker list of meta.json
+        for ticker in pd.unique(df_new['ticker']):
+            if ticker not in self.tickers:
+                self.tickers.append(ticker)
+        codes = pd.Index(self.tickers).get_indexer(df_new['ticker'])
+
+        columns = {'datetime': df_new['datetime'].values.astype('datetime64[ns]').astype(np.int64),
+                   'ticker': codes, 'price': df_new['price'].values, 'signal': df_new['signal'].values,
+                   'pnl': df_new['pnl'].values}
+        for name, dtype in self.binary_columns.items():
+            column_path = os.path.join(self.binary_path, name + '.bin')
+            with open(column_path + '.tmp' if rewrite else column_path, 'wb' if rewrite else 'ab') as f:
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+            if rewrite:
+                os.replace(column_path + '.tmp', column_path)
+
+        meta = {'rows': rows, 'tickers': self.tickers, 'columns': self.binary_columns}
+        meta_path = os.path.join(self.binary_path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @staticmethod
+    def load_binary(binary_path):
+        """
+        read a binary report without copying its columns (memory-mapped)
+
+        :return: report df as generated by genReport.generate_report
+        """
+
+        with open(os.path.join(binary_path, 'meta.json')) as f:
+            meta = json.load(f)
+        rows = meta['rows']
+        columns = {name: np.memmap(os.path.join(binary_path, name + '.bin'), dtype=dtype, mode='r', shape=(rows,))
+                   if rows else np.empty(0, dtype=dtype) for name, dtype in meta['columns'].items()}
+
+        return pd.DataFrame({'datetime': columns['datetime'].view('datetime64[ns]'),
+                             'ticker': pd.Categorical.from_codes(columns['ticker'], meta['tickers']),
+                             'price': columns['price'], 'signal': columns['signal'], 'pnl': columns['pnl']},
+                            copy=False)
+
+class report_buffer:
+    """
+    append-only long format report: one array per column and the row offsets of every report time. Like
+    price_store the buffers double their capacity when full, so the rows of a new bar are appended in amortized
+    O(tickers) instead of copying the whole report
+
+    # rows already written are never modified and a grown buffer is a new array, so the snapshots returned by view()
+    # stay valid (and unchanged) while new rows are appended
+    """
+
+    columns = {'datetime': 'datetime64[ns]', 'ticker': object, 'price': np.float64, 'signal': np.int64,
+               'pnl': np.float64}
+
+    def __init__(self, capacity=1024):
+        self.size = 0  # rows
+        self.n_times = 0  # report times
+        self.data = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        self.times = np.empty(capacity, dtype='datetime64[ns]')
+        self.offsets = np.zeros(capacity + 1, dtype=np.int64)
+
+    def load(self, df_report):
+        """
+        replace the content with a long format report df (time sorted)
+        """
+
+        report_times, report_offsets = genReport.index_report(df_report)
+        self.size = len(df_report)
+        self.n_times = len(report_times)
+        capacity = max(1024, 2 * self.size)
+        self.data = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        for name, values in self.data.items():
+            values[:self.size] = df_report[name].values
+        capacity = max(1024, 2 * self.n_times)
+        self.times = np.empty(capacity, dtype='datetime64[ns]')
+        self.times[:self.n_times] = report_times
+        self.offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self.offsets[:self.n_times + 1] = report_offsets
+
+    def append(self, bar_time, tickers, price, signal, pnl):
+        """
+        append the rows of one report time (one row per ticker)
+        """
+
+        stop = self.size + len(tickers)
+        while stop > len(self.data['datetime']):
+            self.grow()
+        if self.n_times == len(self.times):
+            self.grow_times()
+
+        self.data['datetime'][self.size:stop] = bar_time
+        self.data['ticker'][self.size:stop] = tickers
+        self.data['price'][self.size:stop] = price
+        self.data['signal'][self.size:stop] = signal
+        self.data['pnl'][self.size:stop] = pnl
+        self.times[self.n_times] = bar_time
+        self.offsets[self.n_times + 1] = stop
+        self.size = stop
+        self.n_times += 1
+
+    def add_ticker(self, ticker, price, signal, pnl, keep=None):
+        """
+        add the rows of a new ticker, one per report time, after the rows of the other tickers (new buffers, the
+        views stay unchanged)
+
+        :param keep: report times the ticker has a row at (None: all of them); price, signal and pnl have one value
+                     per report time either way
+        """
+
+        keep = np.ones(self.n_times, dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+        ends = self.offsets[1:self.n_times + 1][keep]
+        rows = {'datetime': self.times[:self.n_times][keep], 'ticker': ticker, 'price': np.asarray(price)[keep],
+                'signal': np.asarray(signal)[keep], 'pnl': np.asarray(pnl)[keep]}
+        size = self.size + int(keep.sum())
+        capacity = max(1024, 2 * size)
+        for name, values in self.data.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:size] = np.insert(values[:self.size], ends, rows[name])
+            self.data[name] = grown
+        offsets = self.offsets.copy()
+        offsets[1:self.n_times + 1] += np.cumsum(keep)
+        self.offsets = offsets
+        self.size = size
+
+    def grow(self):
+        """
+        double the capacity of the row buffers
+        """
+
+        for name, values in self.data.items():
+            grown = np.empty(max(1, 2 * len(values)), dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.data[name] = grown
+
+    def grow_times(self):
+        """
+        double the capacity of the report time buffers
+        """
+
+        capacity = max(1, 2 * len(self.times))
+        times = np.empty(capacity, dtype='datetime64[ns]')
+        offsets = np.zeros(capacity + 1, dtype=np.int64)
+        times[:self.n_times] = self.times[:self.n_times]
+        offsets[:self.n_times + 1] = self.offsets[:self.n_times + 1]
+        self.times, self.offsets = times, offsets
+
+    def view(self, tickers, generation, complete=True, pnl_index=None):
+        """
+        :return: report_snapshot over the current rows that later appends do not change
+        """
+
+        columns = {name: values[:self.size] for name, values in self.data.items()}
+
+        return report_snapshot(columns, self.times[:self.n_times], self.offsets[:self.n_times + 1], tickers,
+                               generation, complete, pnl_index)
+
+class report_snapshot:
+    """
+    the report as of one update. A snapshot is never modified after it is published, so readers can use it
+    without any lock
+
+    # the columns are views over the report_buffer; dataframes are only built when asked for: rows() for the few
+    # rows of a query, report_content (built once per snapshot) for the whole report
+
+    :param columns: dict of column name: array of the long format report rows, time sorted
+    :param report_times: distinct report times (datetime64, ascending)
+    :param report_offsets: rows of report time i are report_offsets[i]:report_offsets[i+1]
+    :param tickers: tickers in the report
+    :param generation: changes whenever the report is rebuilt or rows are removed (appending rows and compacting
+                       old rows keep it)
+    :param complete: False once old rows have been compacted by the retention tiers
+    :param pnl_index: view of the prefix sums of the report (see pnl_index)
+    """
+
+    def __init__(self, columns, report_times, report_offsets, tickers, generation=0, complete=True,
+                 pnl_index=None):
+        self.columns = columns
+        self.report_times = report_times
+        self.report_offsets = report_offsets
+        self.tickers = tickers
+        self.generation = generation
+        self.size = int(report_offsets[-1])  # rows
+        self.complete = complete
+        self.pnl_index = pnl_index
+        self.content = None  # report_content once built
+
+    def rows(self, start, stop):
+        """
+        :return: long format report df of the rows start:stop
+        """
+
+        return pd.DataFrame({name: values[start:stop] for name, values in self.columns.items()})
+
+    @property
+    def report_content(self):
+        """
+        long format report df of all rows
+        """
+
+        if self.content is None:
+            self.content = self.rows(0, self.size)
+
+        return self.content
+
+class pnl_index:
+    """
+    per-ticker prefix sums over the report times (pnl, bars, winning bars, bars with pnl, signal changes), so that
+    the aggregates between any two times cost two binary searches and O(1) per ticker
+
+    # row k+1 of a sum holds the total of the report times 0..k (row 0 the total before the first one). Like
+    # price_store the buffers are append-only and double in capacity; view() returns a fixed-size index over the
+    # current buffers that readers (report_snapshot) use without locking while new times are appended
+
+    :param tickers: tickers (one column per ticker)
+    """
+
+    fields = ('pnl', 'bars', 'hits', 'active', 'changes')
+
+    def __init__(self, tickers, capacity=1024):
+        self.tickers = list(tickers)
+        self.size = 0
+        self.times = np.empty(capacity, dtype='datetime64[ns]')
+        self.sums = {field: np.zeros((capacity + 1, len(self.tickers))) for field in self.fields}
+        self.last_signal = None  # signal of the latest time (for the signal changes)
+        self.evicted = None  # first and last time evicted by compact, their totals are left in row 0
+
+    def build(self, times, pnl, signal):
+        """
+        replace the content with the pnl and signal series of the report times
+
+        :param times: report times (ascending)
+        :param pnl: pnl matrix (one row per time, one column per ticker; nan for no pnl)
+        :param signal: signal matrix aligned with pnl
+        """
+
+        self.size = len(times)
+        capacity = max(1024, 2 * self.size)
+        self.times = np.empty(capacity, dtype='datetime64[ns]')
+        self.times[:self.size] = times
+        for field, values in zip(self.fields, self.series(pnl, signal)):
+            self.sums[field] = np.zeros((capacity + 1, len(self.tickers)))
+            np.cumsum(values, axis=0, out=self.sums[field][1:self.size + 1])
+        self.last_signal = np.asarray(signal[-1], dtype=float) if self.size else None
+        self.evicted = None
+
+    def series(self, pnl, signal, last_signal=None):
+        """
+        :return: per-time values of the fields (pnl, bars, hits, active, changes)
+        """
+
+        pnl = np.asarray(pnl, dtype=float).reshape(-1, len(self.tickers))
+        signal = np.asarray(signal, dtype=float).reshape(-1, len(self.tickers))
+        valid = ~np.isnan(pnl)
+        previous = np.vstack([signal[:1] if last_signal is None else last_signal[None, :], signal[:-1]])
+        changes = (signal != previous) & ~np.isnan(signal) & ~np.isnan(previous)
+
+        return np.where(valid, pnl, 0), valid, valid & (pnl > 0), valid & (pnl != 0), changes
+
+    def append(self, bar_time, pnl, signal):
+        """
+        append the pnl and signal of one report time (amortized O(1))
+        """
+
+        if self.size == len(self.times):
+            self.grow()
+        self.times[self.size] = pd.Timestamp(bar_time).to_datetime64()
+        for field, values in zip(self.fields, self.series(pnl, signal, self.last_signal)):
+            self.sums[field][self.size + 1] = self.sums[field][self.size] + values[0]
+        self.last_signal = np.asarray(signal, dtype=float)
+        self.size += 1
+
+    def grow(self):
+        """
+        double the capacity of the buffers
+        """
+
+        capacity = max(1, 2 * len(self.times))
+        times = np.empty(capacity, dtype='datetime64[ns]')
+        times[:self.size] = self.times[:self.size]
+        for field in self.fields:
+            sums = np.zeros((capacity + 1, len(self.tickers)))
+            sums[:self.size + 1] = self.sums[field][:self.size + 1]
+            self.sums[field] = sums
+        self.times = times
+
+    def drop(self, keep):
+        """
+        keep only the columns of the tickers at positions "keep" (new buffers, views stay unchanged)
+        """
+
+        self.tickers = [self.tickers[i] for i in keep]
+        self.sums = {field: sums[:, keep] for field, sums in self.sums.items()}
+        if self.last_signal is not None:
+            self.last_signal = self.last_signal[keep]
+
+    @staticmethod
+    def column_sums(pnl, signal):
+        """
+        :return: dict of field: prefix sums of the pnl and signal series of one ticker (row 0 is 0, row k+1 the total
+                 of the times 0..k)
+        """
+
+        column = pnl_index([None], capacity=0)
+
+        return {field: np.concatenate([[0], np.cumsum(values[:, 0])])
+                for field, values in zip(pnl_index.fields, column.series(pnl, signal))}
+
+    def add_ticker(self, ticker, sums, last_signal):
+        """
+        add the column of a new ticker (new buffers, views stay unchanged)
+
+        :param sums: dict of field: prefix sums of the ticker over the current times (see column_sums), row 0 holding
+                     the total before the first time
+        :param last_signal: signal of the ticker at the latest time
+        """
+
+        for field in self.fields:
+            grown = np.zeros((len(self.sums[field]), len(self.tickers) + 1))
+            grown[:, :-1] = self.sums[field]
+            grown[:self.size + 1, -1] = sums[field]
+            self.sums[field] = grown
+        if self.last_signal is not None:
+            self.last_signal = np.append(self.last_signal, last_signal)
+        self.tickers = self.tickers + [ticker]
+
+    def compact(self, hot_start, warm_start, warm_sampling):
+        """
+        apply the retention tiers (see price_store.compact): times from warm_start to hot_start are reduced to the
+        last time of every warm_sampling bucket and older times are evicted. Sums at the kept times are unchanged,
+        so a kept time stands for the times dropped since the previous kept one, and row 0 for the evicted times
+        """
+
+        times = self.times[:self.size]
+        start = np.searchsorted(times, pd.Timestamp(warm_start).to_datetime64(), side='left')
+        if start:
+            self.evicted = (times[0] if self.evicted is None else self.evicted[0], times[start - 1])
+        hot = max(start, np.searchsorted(times, pd.Timestamp(hot_start).to_datetime64(), side='left'))
+        buckets = times[start:hot].astype(np.int64) // pd.Timedelta(minutes=warm_sampling).value
+        warm_rows = start + np.flatnonzero(np.append(buckets[1:] != buckets[:-1], len(buckets) > 0))
+        rows = np.concatenate([warm_rows, np.arange(hot, self.size)]).astype(int)
+
+        capacity = max(1024, 2 * len(rows))
+        times = np.empty(capacity, dtype='datetime64[ns]')
+        times[:len(rows)] = self.times[rows]
+        for field in self.fields:
+            sums = np.zeros((capacity + 1, len(self.tickers)))
+            sums[0] = self.sums[field][start]
+            sums[1:len(rows) + 1] = self.sums[field][rows + 1]
+            self.sums[field] = sums
+        self.times = times
+        self.size = len(rows)
+
+    def view(self):
+        """
+        :return: index over the current times that later appends do not change
+        """
+
+        index = pnl_index(self.tickers, capacity=0)
+        index.size = self.size
+        index.times = self.times[:self.size]
+        index.sums = {field: sums[:self.size + 1] for field, sums in self.sums.items()}
+        index.last_signal = self.last_signal
+        index.evicted = self.evicted
+
+        return index
+
+    def range(self, from_time, to_time):
+        """
+        aggregates of the report times from from_time to to_time (both included, at minute resolution like
+        genReport.resolve_query)
+
+        # evicted times only left their totals (row 0): a range reaching any of them includes all of them, and its
+        # first report time is the first evicted one
+
+        :return: dict of field: array (one value per ticker), first and last report time in the range (None if the
+                 range has no report time)
+        """
+
+        times = self.times[:self.size]
+        from_time = pd.Timestamp(from_time).floor('min').to_datetime64()
+        to_time = (pd.Timestamp(to_time).floor('min') + pd.Timedelta(minutes=1)).to_datetime64()
+        start = np.searchsorted(times, from_time, side='left')
+        stop = max(start, np.searchsorted(times, to_time, side='left'))
+        if self.evicted is not None and from_time <= self.evicted[1] and to_time > self.evicted[0]:
+            totals = {field: self.sums[field][stop] for field in self.fields}
+            last_time = times[stop - 1] if stop else self.evicted[1]
+            return totals, pd.Timestamp(self.evicted[0]), pd.Timestamp(last_time)
+
+        totals = {field: self.sums[field][stop] - self.sums[field][start] for field in self.fields}
+        # the change at the first time of the range is relative to a time before it
+        if stop > start:
+            totals['changes'] = self.sums['changes'][stop] - self.sums['changes'][start + 1]
+            return totals, pd.Timestamp(times[start]), pd.Timestamp(times[stop - 1])
+
+        return totals, None, None
+
+class report_store:
+    """
+    materialized trading strategy report that is extended bar by bar instead of being recomputed for every query
+
+    # the full report is only built when the historical price is (re)fetched. Each real-time bar afterwards only
+    # computes its own rolling stats, signal and pnl row and appends it to the report; an added ticker only computes
+    # its own rows
+    # writers (database listeners, called one change at a time after the database lock is released) publish a new report_snapshot by swapping
+    # self.snapshot; readers just take the current snapshot
+    """
+
+    def __init__(self, strategy, report):
+        self.trading_strategy = strategy
+        self.report = report
+        self.rolling_period = pd.Timedelta(strategy.rolling_period)
+        self.min_rolling_periods = strategy.min_rolling_periods
+        self.tickers = None
+        self.rolling = None  # streaming rolling mean/std of the latest rolling period
+        self.n_valid = 0  # number of bars with valid rolling stats so far
+        self.first_valid = None  # times of the first two bars with valid rolling stats (before the first report row)
+        self.last_price = None  # price of the latest bar with valid rolling stats
+        self.signal_prev = None  # signal applied to the latest valid bar
+        self.signal_carry = None  # signal that will be applied to the next valid bar
+        self.snapshot = None  # latest published report_snapshot
+        self.report_buffer = None  # rows of the report, appended bar by bar
+        self.pnl_index = None  # prefix sums of the pnl and signal series, for the range queries
+        self.generation = 0  # generation of the published report
+        self.latest_rows = None  # report rows added by the latest bar (None if the bar added no row)
+        self.evicted_until = None  # time of the latest evicted report row
+        self.compacted = False  # whether old rows have been compacted since the historical build
+
+    @property
+    def ready(self):
+        """
+        whether the report has been built
+        """
+
+        return self.snapshot is not None
+
+    @staticmethod
+    def raw_signal(price, mean, std, band=1):
+        """
+        momentum signal of one bar: 1 above mean+band*std, -1 below mean-band*std, nan within the band
+        """
+
+        return np.where(price > mean + band * std, 1, np.where(price < mean - band * std, -1, np.nan))
+
+    def build(self, df_price_raw, rolling=None):
+        """
+        build the full report from the price database and keep the state needed to extend it incrementally
+
+        :param rolling: rolling_window of the same window already replayed over df_price_raw (None: replay here)
+        """
+
+        # full computation, same as the non incremental path
+        df_signal, df_price, df_pnl = self.trading_strategy.run(df_price_raw)
+        report_content = self.report.generate_report(df_pnl, df_signal, df_price, save=False)
+        self.tickers = list(df_price.columns.values)
+        self.pnl_index = pnl_index(self.tickers)
+        self.pnl_index.build(df_pnl.index.values, df_pnl.values, df_signal.loc[df_pnl.index].values)
+
+        # replay the history once through the streaming rolling stats so that later bars continue from the exact
+        # same state as the full pandas computation
+        if rolling is None:
+            df_price_all = self.trading_strategy.index_time_ascd(df_price_raw).astype(float)
+            rolling = rolling_window(len(self.tickers), self.rolling_period, self.min_rolling_periods)
+            for bar_time, bar_price in zip(df_price_all.index, df_price_all.values):
+                rolling.update(bar_time, bar_price)
+        self.rolling = rolling
+
+        # signal state: signal(t) is the forward filled raw signal of the previous valid bar
+        self.n_valid = len(df_price)
+        self.first_valid = df_price.index.values[:2]
+        zeros = np.zeros(len(self.tickers))
+        if self.n_valid:
+            self.last_price = df_price.iloc[-1].values
+            self.signal_prev = df_signal.iloc[-1].values if len(df_signal) else zeros
+            raw = self.raw_signal(self.last_price, self.trading_strategy.rolling_mean.iloc[-1].values,
+                                  self.trading_strategy.rolling_std.iloc[-1].values, self.trading_strategy.band)
+            self.signal_carry = np.where(np.isnan(raw), self.signal_prev, raw)
+        else:
+            self.last_price = None
+            self.signal_prev = zeros
+            self.signal_carry = zeros
+
+        # publish
+        self.generation += 1
+        self.report_buffer = report_buffer()
+        self.report_buffer.load(report_content)
+        self.snapshot = self.report_buffer.view(list(self.tickers), self.generation, not self.compacted,
+                                                self.pnl_index.view())
+
+    def append(self, df_bar, stats=None):
+        """
+        extend the report with one new price bar
+
+        :param df_bar: one row df with 'time' column and one column per ticker
+        :param stats: rolling mean and std of the bar if the rolling window is updated by the caller (shared)
+        """
+
+        self.latest_rows = None
+        bar_time = pd.Timestamp(df_bar['time'].iloc[0])
+        bar_price = df_bar[self.tickers].iloc[0].values.astype(float)
+
+        # slide the rolling window in constant time
+        mean, std = self.rolling.update(bar_time, bar_price) if stats is None else stats
+
+        # bars without enough observations in the window are dropped from the report
+        if np.isnan(mean).any() or np.isnan(std).any():
+            return
+
+        raw = self.raw_signal(bar_price, mean, std, self.trading_strategy.band)
+
+        # the report starts from the third valid bar (first pnl available)
+        if self.n_valid < 2:
+            self.first_valid = np.append(self.first_valid, bar_time.to_datetime64())
+        else:
+            pnl = (bar_price - self.last_price) * self.signal_prev
+            self.pnl_index.append(bar_time, pnl, self.signal_carry)
+            df_rows = pd.DataFrame({'datetime': [bar_time] * len(self.tickers),
+                                    'ticker': self.tickers,
+                                    'price': np.round(bar_price, 2),
+                                    'signal': self.signal_carry.astype(int),
+                                    'pnl': np.round(pnl, 2)})
+            # publish the extended report as a new snapshot (amortized O(tickers), the history is not copied)
+            self.report_buffer.append(bar_time.to_datetime64(), df_rows['ticker'].values, df_rows['price'].values,
+                                      df_rows['signal'].values, df_rows['pnl'].values)
+            self.snapshot = self.report_buffer.view(list(self.tickers), self.generation, not self.compacted,
+                                                    self.pnl_index.view())
+            self.latest_rows = df_rows
+
+        # roll signal state forward
+        self.signal_prev = self.signal_carry
+        self.signal_carry = np.where(np.isnan(raw), self.signal_carry, raw)
+        self.last_price = bar_price
+        self.n_valid += 1
+
+    @staticmethod
+    def ticker_prices(ticker, df_price, df_ticker=None):
+        """
+        :return: price of one ticker (time index, one column): its column of the price database, plus its own bars
+                 (df_ticker) where the retention tiers have downsampled or evicted the price database
+        """
+
+        df_ticker_price = df_price[[ticker]]
+        if df_ticker is None:
+            return df_ticker_price
+
+        df_ticker_price = pd.concat([df_ticker.loc[df_ticker.index <= df_price.index[-1], [ticker]], df_ticker_price])
+
+        return df_ticker_price[~df_ticker_price.index.duplicated(keep='last')].sort_index()
+
+    def add_ticker(self, ticker_added, df_price, join_rolling=True, df_ticker=None):
+        """
+        add a ticker to the report, computing only its own rows and incremental state
+
+        # the report only has the bars where every ticker has valid rolling stats. The new ticker's rows are
+        # computed on those bars, which matches a rebuild as long as it has a valid price, rolling stats and pnl on
+        # all of them (always the case for the filled price database); otherwise the report has to be rebuilt.
+        # Once old rows have been compacted the other tickers' rows are never recomputed (the price database only
+        # has their downsampled bars): the new ticker's strategy runs on its own full resolution bars and each kept
+        # report time gets the pnl of the bars since the previous kept one, like compact. The generation is kept:
+        # the rows on disk stay valid and the ticker is saved from its next bar on
+
+        :param df_price: price database including the new ticker
+        :param join_rolling: also add it to the rolling window (False if the window is shared and joined once)
+        :param df_ticker: the ticker's own bars at full resolution (time index, one column), used once old rows have
+                          been compacted
+        :return: False if the report has to be rebuilt instead
+        """
+
+        if not self.ready or self.n_valid < 3:
+            return False
+
+        # the ticker's strategy on the bars of the report, same steps as trading_strategy.run
+        strategy = trading_strategy(None, self.trading_strategy.rolling_period, self.min_rolling_periods,
+                                    self.trading_strategy.band)
+        df_ticker_price = self.ticker_prices(ticker_added, df_price, df_ticker if self.compacted else None)
+        rolling_mean, rolling_std, price = strategy.rolling_stats(df_ticker_price,
+                                                                  self.trading_strategy.rolling_period,
+                                                                  self.min_rolling_periods)
+        snapshot = self.snapshot
+        if self.compacted:
+            # its own valid bars, from the first valid bar of the report to the latest report time
+            valid = price.index[(price.index >= self.first_valid[0]) & (price.index <= snapshot.report_times[-1])]
+            if len(valid) < 3:
+                return False
+        else:
+            valid = pd.DatetimeIndex(np.concatenate([self.first_valid, snapshot.report_times]), name=price.index.name)
+            if not (valid.isin(rolling_mean.index).all() and valid.isin(rolling_std.index).all()):
+                return False
+        strategy.rolling_mean, strategy.rolling_std, strategy.price = \
+            rolling_mean.loc[valid], rolling_std.loc[valid], price.loc[valid]
+        df_signal, df_price_valid = strategy.momentum_signal()
+        df_pnl = strategy.calc_pnl(df_signal, df_price_valid)
+        sums = pnl_index.column_sums(df_pnl.values, df_signal.loc[df_pnl.index].values)
+
+        if self.compacted:
+            # a kept report time stands for the bars since the previous kept one, the first one for the bars since
+            # the latest evicted row
+            pnl_times = df_pnl.index.values
+            start = 0 if self.evicted_until is None else \
+                np.searchsorted(pnl_times, self.evicted_until.to_datetime64(), side='right')
+            positions = np.append(start, np.searchsorted(pnl_times, snapshot.report_times, side='right'))
+            sums = {field: values[positions] for field, values in sums.items()}
+            pnl = np.append(0, np.cumsum(np.nan_to_num(np.round(df_pnl.values[:, 0], 2))))[positions]
+            report_index = pd.DatetimeIndex(snapshot.report_times)
+            price = df_ticker_price[ticker_added].reindex(report_index).values
+            signal = df_signal[ticker_added].reindex(report_index, method='ffill').values
+            keep = (np.diff(sums['bars']) > 0) & ~np.isnan(price) & ~np.isnan(signal)
+            self.report_buffer.add_ticker(ticker_added, np.round(price, 2), np.nan_to_num(signal).astype(int),
+                                          np.round(np.diff(pnl), 2), keep)
+        else:
+            df_rows = self.report.generate_report(df_pnl, df_signal, df_price_valid, save=False)
+            if len(df_rows) != len(snapshot.report_times):  # missing price or pnl on some bars
+                return False
+            self.report_buffer.add_ticker(ticker_added, df_rows['price'].values, df_rows['signal'].values,
+                                          df_rows['pnl'].values)
+        self.pnl_index.add_ticker(ticker_added, sums, df_signal.values[-1, 0])
+        if join_rolling:
+            self.rolling.join(rolling_window.replay(df_ticker_price, self.rolling_period, self.min_rolling_periods))
+
+        # signal state, as in build
+        last_price = df_price_valid.values[-1]
+        signal_prev = df_signal.values[-1]
+        raw = self.raw_signal(last_price, strategy.rolling_mean.values[-1], strategy.rolling_std.values[-1],
+                              strategy.band)
+        self.last_price = np.append(self.last_price, last_price)
+        self.signal_prev = np.append(self.signal_prev, signal_prev)
+        self.signal_carry = np.append(self.signal_carry, np.where(np.isnan(raw), signal_prev, raw))
+
+        # publish
+        self.tickers = self.tickers + [ticker_added]
+        self.snapshot = self.report_buffer.view(list(self.tickers), self.generation, not self.compacted,
+                                                self.pnl_index.view())
+
+        return True
+
+    def drop_ticker(self, ticker_deleted, drop_rolling=True):
+        """
+        remove a ticker from the report and from the incremental state
+
+        :param drop_rolling: also drop it from the rolling window (False if the window is shared and dropped once)
+        """
+
+        if not self.ready or ticker_deleted not in self.tickers:
+            return
+
+        keep = [i for i, ticker in enumerate(self.tickers) if ticker != ticker_deleted]
+        self.tickers = [self.tickers[i] for i in keep]
+        if drop_rolling:
+            self.rolling.drop(keep)
+        self.trading_strategy.drop_ticker(ticker_deleted)
+        if self.last_price is not None:
+            self.last_price = self.last_price[keep]
+        self.pnl_index.drop(keep)
+        self.signal_prev = self.signal_prev[keep]
+        self.signal_carry = self.signal_carry[keep]
+        report_content = self.snapshot.report_content
+        report_content = report_content[report_content['ticker'] != ticker_deleted].reset_index(drop=True)
+        self.generation += 1
+        self.report_buffer = report_buffer()
+        self.report_buffer.load(report_content)
+        self.snapshot = self.report_buffer.view(list(self.tickers), self.generation, not self.compacted,
+                                                self.pnl_index.view())
+
+    def compact(self, hot_start, warm_start, warm_sampling):
+        """
+        apply the retention tiers to the report: rows from hot_start on are kept, rows from warm_start to hot_start
+        are downsampled to the last row of every warm_sampling bucket (with the pnl of the bucket) and older rows
+        are evicted (their totals stay in the pnl_index, see pnl_index.compact)
+
+        # the incremental state (rolling window, signals) does not depend on old rows, so the report keeps being
+        # extended exactly as before. The generation is kept: the rows on disk stay valid and saves keep appending.
+        # The snapshot is no longer complete, so the report files are never rewritten from it
+        """
+
+        if not self.ready:
+            return
+
+        snapshot = self.snapshot
+        report_content = snapshot.report_content
+        start = snapshot.report_offsets[np.searchsorted(snapshot.report_times, pd.Timestamp(warm_start).to_datetime64())]
+        hot = max(start, snapshot.report_offsets[np.searchsorted(snapshot.report_times,
+                                                                 pd.Timestamp(hot_start).to_datetime64())])
+
+        if start:
+            self.evicted_until = pd.Timestamp(report_content['datetime'].iloc[start - 1])
+
+        # warm rows: last row of each bucket and ticker, with the pnl summed over the bucket
+        df_warm = report_content.iloc[start:hot]
+        buckets = df_warm['datetime'].values.astype('datetime64[ns]').astype(np.int64) // \
+            pd.Timedelta(minutes=warm_sampling).value
+        tickers = df_warm['ticker'].values
+        last = ~pd.DataFrame({'bucket': buckets, 'ticker': tickers}).duplicated(keep='last').values
+        pnl = df_warm['pnl'].groupby([buckets, tickers], sort=False).transform('sum').values
+        df_warm = df_warm[last].assign(pnl=np.round(pnl[last], 2))
+
+        report_content = pd.concat([df_warm, report_content.iloc[hot:]], ignore_index=True)
+        self.pnl_index.compact(hot_start, warm_start, warm_sampling)
+        self.report_buffer = report_buffer()
+        self.report_buffer.load(report_content)
+        self.compacted = True
+        self.snapshot = self.report_buffer.view(list(self.tickers), self.generation, False, self.pnl_index.view())
+
+        # the frames of the full build are not needed by the incremental updates
+        self.trading_strategy.price = self.trading_strategy.rolling_mean = self.trading_strategy.rolling_std = None
+
+    def on_historical(self, df_price):
+        """
+        database listener: historical price (re)fetched, rebuild the full report
+        """
+
+        self.evicted_until = None
+        self.compacted = False
+        self.build(df_price)
+
+    def on_realtime(self, df_bar):
+        """
+        database listener: new real-time bar appended
+        """
+
+        if self.ready:
+            with metrics.time('report_append'):
+                self.append(df_bar)
+
+    def on_add(self, ticker_added, df_price, df_ticker=None):
+        """
+        database listener: ticker added, only its rows are computed (the report is rebuilt from the price database
+        if they cannot be and no rows have been compacted, see add_ticker)
+
+        :param df_ticker: the ticker's own bars at full resolution (time index, one column)
+        """
+
+        if self.ready and not self.add_ticker(ticker_added, df_price, df_ticker=df_ticker):
+            if self.compacted:  # a rebuild would recompute the other tickers' rows from downsampled bars
+                raise Exception('{} has too few prices to be added'.format(ticker_added))
+            self.build(df_price)
+
+    def on_delete(self, ticker_deleted):
+        """
+        database listener: ticker deleted
+        """
+
+        self.drop_ticker(ticker_deleted)
+
+    def on_compact(self, hot_start, warm_start, warm_sampling):
+        """
+        database listener: retention tiers applied to the price database
+        """
+
+        self.compact(hot_start, warm_start, warm_sampling)
+
+class strategy_engine:
+    """
+    registry of strategy configurations running against the same price database, one report_store each
+
+    # strategies with the same rolling window share its intermediates: full builds read the rolling mean/std and
+    # the price diffs from one rolling_stats_cache, and every real-time bar slides one rolling_window per window
+    # for all of them. Each strategy only computes its own signal and pnl
+
+    :param report: genReport
+    :param configs: dict of strategy name: (rolling_period, min_rolling_periods, band)
+    :param shards: strategy_shards process pool for the full builds (None: serial)
+    """
+
+    default = 'momentum'  # strategy of the report saved to local, of the subscriptions and of "data" without name
+    default_config = ('24h', 15, 1)
+
+    def __init__(self, report, configs=None, shards=None):
+        self.report = report
+        self.configs = configs or {self.default: self.default_config}
+        self.shards = shards
+        self.cache = rolling_stats_cache()
+        self.stores = {}  # strategy name: report_store
+        for name, (rolling_period, min_rolling_periods, band) in self.configs.items():
+            strategy = trading_strategy(shards, rolling_period, min_rolling_periods, band, self.cache)
+            self.stores[name] = report_store(strategy, report)
+        self.rolling = {}  # (rolling_period, min_rolling_periods): rolling_window shared by the stores
+
+    @staticmethod
+    def parse_configs(specs):
+        """
+        parse strategy configurations "name:rolling_period:min_rolling_periods:band", e.g. "slow:48h:30:1.5"
+
+        :return: dict of strategy name: (rolling_period, min_rolling_periods, band), the default strategy first
+        """
+
+        configs = {strategy_engine.default: strategy_engine.default_config}
+        for spec in specs or []:
+            fields = spec.split(':')
+            if len(fields) != 4 or not re.match(r"^\w+$", fields[0]):
+                raise Exception('invalid strategy {}: expected name:rolling_period:min_rolling_periods:band'.format(spec))
+            try:
+                pd.Timedelta(fields[1])
+                configs[fields[0]] = (fields[1], int(fields[2]), float(fields[3]))
+            except ValueError:
+                raise Exception('invalid strategy {}: expected name:rolling_period:min_rolling_periods:band'.format(spec))
+
+        return configs
+
+    @staticmethod
+    def window(store):
+        return store.trading_strategy.rolling_period, store.min_rolling_periods
+
+    @property
+    def ready(self):
+        """
+        whether the reports have been built
+        """
+
+        return all(store.ready for store in self.stores.values())
+
+    def store(self, name=None):
+        """
+        :return: report_store of the strategy (the default one if no name is given)
+        """
+
+        if (name or self.default) not in self.stores:
+            raise Exception('strategy not found: {}'.format(name))
+
+        return self.stores[name or self.default]
+
+    def build(self, df_price_raw):
+        """
+        build the reports of all strategies, computing the rolling stats of each window once
+        """
+
+        self.rolling = {}
+        try:
+            for store in self.stores.values():
+                store.build(df_price_raw, self.rolling.get(self.window(store)))
+                self.rolling[self.window(store)] = store.rolling
+        finally:
+            self.cache.reset()  # the intermediates of a full build are not needed between builds
+
+    def prepare(self, df_price_raw):
+        """
+        build the reports of all strategies into new stores, leaving the published ones untouched (see adopt)
+
+        # the new stores have their own strategies and rolling stats cache, so the build can run without any lock
+        # while the listeners keep working on the published stores
+
+        :return: strategy_engine holding the new reports
+        """
+
+        engine = strategy_engine(self.report, self.configs, self.shards)
+        for name, store in self.stores.items():
+            built = engine.stores[name]
+            built.generation, built.evicted_until, built.compacted = store.generation, store.evicted_until, \
+                store.compacted
+        engine.build(df_price_raw)
+
+        return engine
+
+    def adopt(self, engine):
+        """
+        publish the reports built by prepare (reference swaps only)
+
+        # the stores keep their identity, the controller and the subscription hub hold them
+        """
+
+        for name, store in self.stores.items():
+            store.__dict__.update(engine.stores[name].__dict__)
+        self.cache = engine.cache
+        self.rolling = engine.rolling
+
+    def append(self, df_bar):
+        """
+        extend the reports with one new price bar, sliding each rolling window once
+        """
+
+        tickers = next(iter(self.stores.values())).tickers  # all stores are built from the same price
+        bar_time = pd.Timestamp(df_bar['time'].iloc[0])
+        bar_price = df_bar[tickers].iloc[0].values.astype(float)
+        stats = {window: rolling.update(bar_time, bar_price) for window, rolling in self.rolling.items()}
+        for store in self.stores.values():
+            store.append(df_bar, stats[self.window(store)])
+
+    def add_ticker(self, ticker_added, df_price, df_ticker=None):
+        """
+        add a ticker to the reports (see report_store.add_ticker) and to the shared rolling windows
+
+        :return: False if the reports have to be rebuilt instead
+        """
+
+        for store in self.stores.values():
+            if not store.add_ticker(ticker_added, df_price, join_rolling=False, df_ticker=df_ticker):
+                return False
+        compacted = any(store.compacted for store in self.stores.values())
+        df_ticker_price = report_store.ticker_prices(ticker_added, df_price, df_ticker if compacted else None)
+        for (rolling_period, min_rolling_periods), rolling in self.rolling.items():
+            rolling.join(rolling_window.replay(df_ticker_price, rolling_period, min_rolling_periods))
+
+        return True
+
+    def drop_ticker(self, ticker_deleted):
+        """
+        remove a ticker from the reports and from the shared rolling windows
+        """
+
+        tickers = next(iter(self.stores.values())).tickers
+        if not self.ready or ticker_deleted not in tickers:
+            return
+
+        keep = [i for i, ticker in enumerate(tickers) if ticker != ticker_deleted]
+        for rolling in self.rolling.values():
+            rolling.drop(keep)
+        for store in self.stores.values():
+            store.drop_ticker(ticker_deleted, drop_rolling=False)
+
+    def on_historical(self, df_price):
+        """
+        database listener: historical price (re)fetched, rebuild the full reports
+        """
+
+        for store in self.stores.values():
+            store.evicted_until = None
+            store.compacted = False
+        self.build(df_price)
+
+    def on_realtime(self, df_bar):
+        """
+        database listener: new real-time bar appended
+        """
+
+        if self.ready:
+            with metrics.time('report_append'):
+                self.append(df_bar)
+
+    def on_add(self, ticker_added, df_price, df_ticker=None):
+        """
+        database listener: ticker added, only its rows are computed (the reports are rebuilt from the price database
+        if they cannot be and no rows have been compacted, see report_store.add_ticker)
+
+        :param df_ticker: the ticker's own bars at full resolution (time index, one column)
+        """
+
+        if self.ready and not self.add_ticker(ticker_added, df_price, df_ticker):
+            if any(store.compacted for store in self.stores.values()):
+                raise Exception('{} has too few prices to be added'.format(ticker_added))
+            self.build(df_price)
+
+    def on_delete(self, ticker_deleted):
+        """
+        database listener: ticker deleted
+        """
+
+        self.drop_ticker(ticker_deleted)
+
+    def on_compact(self, hot_start, warm_start, warm_sampling):
+        """
+        database listener: retention tiers applied to the price database
+        """
+
+        # the default strategy's report rows about to be downsampled or evicted are saved first, so report.csv keeps
+        # every row at full resolution
+        if self.store().ready:
+            self.report.save_snapshot(self.store().snapshot)
+        for store in self.stores.values():
+            store.compact(hot_start, warm_start, warm_sampling)
+
+class query_cache:
+    """
+    LRU cache of encoded query replies, keyed by the report time a query resolves to
+
+    # a query time is snapped to its report time first, so all the query times resolving to the same bar share an
+    # entry. A new bar does not change the answer for earlier bars (later query times simply resolve to the new
+    # bar), only a rebuild or a ticker add/delete does: those change the report generation, which is part of the
+    # key, and clear the cache (as a database listener) to free the entries that can no longer be hit
+
+    :param max_entries: number of replies kept (0 disables the cache)
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key: encoded_result, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+        :param key: (strategy, generation, report time, tickers, note)
+        :param build: function computing the result on a miss
+        :return: encoded_result of the reply
+        """
+
+        with self.lock:
+            reply = self.entries.get(key)
+            if reply is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return reply
+            self.misses += 1
+
+        # built outside the lock, two threads missing the same key just build it twice
+        reply = encoded_result(build())
+        if self.max_entries:
+            with self.lock:
+                self.entries[key] = reply
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+        return reply
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def on_historical(self, df_price):
+        """
+        database listener: report rebuilt
+        """
+
+        self.clear()
+
+    def on_realtime(self, df_bar):
+        """
+        database listener: new bar, earlier answers are unchanged
+        """
+
+        pass
+
+    def on_add(self, ticker_added, df_price, df_ticker=None):
+        """
+        database listener: ticker added, every answer changes
+        """
+
+        self.clear()
+
+    def on_delete(self, ticker_deleted):
+        """
+        database listener: ticker deleted, every answer changes
+        """
+
+        self.clear()
+
+    def on_compact(self, hot_start, warm_start, warm_sampling):
+        """
+        database listener: the bars kept after compaction answer as before
+        """
+
+        pass
+
+class subscription:
+    """
+    one client's subscription to the report rows of new bars
 
-        # update the price with the real-time price if it is available; if no, no update to the price
-        if self.source2_time > self.latest_time:
-            # use backward then forward fill to deal with missing stock price after combining all tickers
-            self.fill_NA(df_price_source2)
-            # only keep the latest row (ignoring the few seconds time delay when requesting for the latest price of different tickers)
-            df_price_source2 = df_price_source2.iloc[:1]
-            # cache the newly added price from source 2
-            self.price_realtime = df_price_source2
-            # cache the df that contains the updated stock price for all tickers if there are newer data available
-            self.price = pd.concat([df_price_source2, self.price], ignore_index=True)
-            # update latest time
-            self.latest_time = self.source2_time
-            # check db status
-            self.status = "price updated to latest!"
+    # the database updater only queues pre-encoded pushes and never waits for the client; the subscription's own
+    # sender (a thread, or a task in asyncio mode) writes them. A client that falls behind gets the newest pushes
+    # only (the oldest queued ones are dropped), and one that keeps falling behind is unsubscribed
 
-    def update_price(self):
+    :param tickers: subscribed tickers, None for all tickers
+    :param max_pending: pushes queued at most for the client
+    :param max_dropped: pushes dropped before the client is unsubscribed
+    :param loop: event loop of the client's sender task (asyncio mode), None for a sender thread
+    """
+
+    def __init__(self, tickers, max_pending=16, max_dropped=64, loop=None):
+        self.tickers = None if tickers is None else frozenset(tickers)
+        self.max_pending = max_pending
+        self.max_dropped = max_dropped
+        self.loop = loop
+        self.pending = deque()  # encoded push frames not sent yet
+        self.lock = threading.Lock()  # guards pending between the updater and the sender
+        self.dropped = 0
+        self.closed = False
+        self.wakeup = asyncio.Event() if loop is not None else threading.Event()
+
+    def offer(self, frame):
         """
-        constantly update the stock price every "sampling_period" min (e.g. every 5 min if self.sampling_period = 5)
+        queue one push for the client without blocking
+
+        :return: False if the subscription is closed
         """
 
-        self.status = None  # reset status to None every time we re-update the price
+        with self.lock:
+            if self.closed:
+                return False
+            if len(self.pending) >= self.max_pending:  # slow client: drop the oldest push
+                self.pending.popleft()
+                self.dropped += 1
+                if self.dropped > self.max_dropped:
+                    self.closed = True
+                    print('Slow subscriber dropped')
+            self.pending.append(frame)
+        self.wake()
+
+        return not self.closed
+
+    def close(self):
+        """
+        stop the subscription, the sender exits once woken up
+        """
 
-        # get historical stock price
-        try:
-            self.lock.acquire()
-            self.fetch_price_historical()  # fetch price from source 1
-            # time.sleep(2)  # wait for fetching
-            self.lock.release()
-        except Exception as e:
-            if str(e) == 'invalid ticker':
-                raise e
-            else:
-                raise Exception('database error (source 1)!')
+        with self.lock:
+            self.closed = True
+        self.wake()
 
-        # constantly update stock price every "sampling_period" minutes
-        while True:
-            time.sleep(60 * self.sampling_period)  # sleep for the sampling_period for this task
+    def wake(self):
+        """
+        wake up the sender
+        """
+
+        if self.loop is None:
+            self.wakeup.set()
+        else:
             try:
-                self.lock.acquire()
-                self.append_realtime_price()  # fetch and append price from source 2
-                # time.sleep(2)
-                self.lock.release()
-            except:
-                raise Exception("database error (source 2)!")
+                self.loop.call_soon_threadsafe(self.wakeup.set)
+            except RuntimeError:  # event loop already closed
+                pass
 
-    def update_price_thread(self):
+    def take(self):
         """
-        keep updating stock prices from source 1 and source 2 in multi-threading mode
+        take all queued pushes (none once the subscription is closed)
         """
 
-        thread_db_update = threading.Thread(target=self.update_price)  # create thread for updating price
-        thread_db_update.daemon = True
-        thread_db_update.start()
+        with self.lock:
+            frames = [] if self.closed else list(self.pending)
+            self.pending.clear()
 
-    def get_price(self, latest):
+        return frames
+
+    def run(self, send):
         """
-        :return: price database representing historical or latest price
+        sender thread: write the queued pushes to the client
+
+        :param send: function writing one encoded frame to the client socket
         """
 
-        if latest:
-            return self.price  # updated price
-        else:
-            return self.price_historical  # historical price from source 1
+        try:
+            while not self.closed:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                for frame in self.take():
+                    send(frame)
+        except Exception as e:  # client gone
+            print('Subscription closed: {}'.format(e))
+            self.close()
+
+    async def run_async(self, writer):
+        """
+        sender task: write the queued pushes to the client stream
+        """
 
-    # def regenerate_database(self):
-    #     """
-    #     mark new_db as True to signal that the tickers have been updated and the price database needs to be re-generated
-    #     """
-    #
-    #     self.regenerate_db_flag = True
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                frames = self.take()
+                if frames:
+                    writer.write(b''.join(frames))
+                    await writer.drain()
+        except Exception as e:  # client gone
+            print('Subscription closed: {}'.format(e))
+            self.close()
+
+class subscription_hub:
+    """
+    database listener pushing the report rows of every new bar to the subscribed clients
 
-    def delete_from_db(self, ticker_deleted):
+    # each distinct ticker set is formatted and encoded once per bar and the same bytes are queued for all of its
+    # subscribers. Called by the thread that updated the price database, so it only formats and queues, the
+    # sockets are written by the subscriptions' senders
+
+    :param report_store: report_store whose latest rows are pushed (must be registered as a listener before the hub),
+        None in coordinator mode where the shards' rows are published
+    :param client_parser: client_parser encoding the push frames
+    """
+
+    def __init__(self, report_store, client_parser):
+        self.report_store = report_store
+        self.client_parser = client_parser
+        self.subscriptions = []
+        self.lock = threading.Lock()  # guards the subscription list (client threads add and remove)
+
+    def add(self, client_subscription):
+        with self.lock:
+            self.subscriptions.append(client_subscription)
+
+    def remove(self, client_subscription):
+        with self.lock:
+            if client_subscription in self.subscriptions:
+                self.subscriptions.remove(client_subscription)
+
+    def on_historical(self, df_price):
         """
-        delete a ticker's data from the price database
+        database listener: nothing to push, subscribers only receive new bars
         """
 
-        if ticker_deleted in self.tickers:
-            # if ticker is found in the current list, we delete its data from current price database
-            self.tickers.remove(ticker_deleted)
-            self.price.drop([ticker_deleted], axis=1, inplace=True)
-        else:
-            raise Exception("ticker not found")
+        pass
 
-    def add_to_db(self, ticker_added):
+    def on_realtime(self, df_bar):
         """
-        add a new ticker's data to the price database
+        database listener: push the report rows added by the new bar
         """
 
-        # only add ticker if it does not exist in current tickers list already
-        if ticker_added not in self.tickers:
-            # check if ticker is valid
-            self.fetch_source1(ticker_added, self.sampling_period, self.key_source1, self.session)
+        df_rows = self.report_store.latest_rows
+        with self.lock:
+            subscribed = bool(self.subscriptions)
+        if df_rows is None or not subscribed:
+            return
 
-            # if this step is reached, then ticker is valid
-            self.tickers.append(ticker_added)  # append the new ticker to tickers list
-            self.update_price_thread()  # re-update price database according to new tickers list
+        # format the rows once, same format as the data query
+        bar_time = pd.Timestamp(df_rows['datetime'].iloc[0]).strftime('%Y-%m-%d-%H:%M')
+        rows = dict(zip(df_rows['ticker'],
+                        df_rows['ticker'].astype(str) + '   ' + df_rows['price'].astype(str) + ',' +
+                        df_rows['signal'].astype(str) + ',' + df_rows['pnl'].astype(str)))
+        self.publish(bar_time, rows)
 
-class trading_strategy:
+    def publish(self, bar_time, rows):
+        """
+        queue the push of one bar's rows for every subscribed client
+
+        :param bar_time: bar time as formatted in the pushes
+        :param rows: dict of ticker: formatted row
+        """
+
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+
+        # encode once per ticker set
+        frames = {}
+        closed = []
+        for client_subscription in subscriptions:
+            key = client_subscription.tickers
+            if key not in frames:
+                tickers = rows if key is None else [ticker for ticker in rows if ticker in key]
+                frames[key] = self.client_parser.encode_frame(
+                    {'push': 'bar', 'datetime': bar_time, 'rows': [rows[ticker] for ticker in tickers]})
+            if not client_subscription.offer(frames[key]):
+                closed.append(client_subscription)
+
+        for client_subscription in closed:
+            self.remove(client_subscription)
+
+    def on_add(self, ticker_added, df_price, df_ticker=None):
+        """
+        database listener: nothing to push, the added ticker is in the rows of the next bar
+        """
+
+        pass
+
+    def on_delete(self, ticker_deleted):
+        """
+        database listener: nothing to push, the deleted ticker simply has no more rows
+        """
+
+        pass
+
+    def on_compact(self, hot_start, warm_start, warm_sampling):
+        """
+        database listener: nothing to push, only old rows are compacted
+        """
+
+        pass
+
+class hash_ring:
     """
-    generate trading strategy analytics based on stock price
+    consistent hashing of tickers onto shards
 
-    :param tickers: list of stock tickers
-    :type tickers: List of Strings
-    :param sampling_period: one of (5, 15, 30, 60), with unit in minutes
-    :type sampling_period: Int
+    # every shard owns "replicas" points on a 64-bit hash ring and a ticker belongs to the shard of the first point at
+    # or after the ticker's hash. Adding a shard only moves the tickers the new shard takes over, the others stay
+
+    :param replicas: points per shard (more points spread the tickers more evenly)
     """
 
-    def __init__(self):
-        self.rolling_period = '24h'
-        self.min_rolling_periods = 15
-        self.tickers = None
-        self.price = None
-        self.rolling_mean = None
-        self.rolling_std = None
+    def __init__(self, replicas=64):
+        self.replicas = replicas
+        self.points = []  # hashes of the points, ascending
+        self.owners = []  # shard of each point
 
     @staticmethod
-    def index_time_ascd(df):
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def copy(self):
+        ring = hash_ring(self.replicas)
+        ring.points = list(self.points)
+        ring.owners = list(self.owners)
+
+        return ring
+
+    def add(self, shard):
         """
-        generate a df with index set to time in ascending order
+        add the points of a shard
         """
 
-        df_update = df.set_index('time', inplace=False)  # set time to index
-        df_update.sort_index(inplace=True)  # sort time index in ascending order
+        for i in range(self.replicas):
+            point = self.hash('{}#{}'.format(shard, i))
+            position = bisect_left(self.points, point)
+            self.points.insert(position, point)
+            self.owners.insert(position, shard)
 
-        return df_update
+    def owner(self, ticker):
+        """
+        :return: shard owning the ticker
+        """
 
-    def calc_rolling_stats(self, df_price_raw):
+        return self.owners[bisect_left(self.points, self.hash(ticker)) % len(self.points)]
+
+class shard_client:
+    """
+    one worker server.py process of the coordinator and a pool of frame protocol connections to it
+
+    :param name: shard name, also the name of its working directory
+    :param port: port of the worker
+    :param client_parser: client_parser encoding and decoding the frames
+    """
+
+    def __init__(self, name, port, client_parser, host='127.0.0.1'):
+        self.name = name
+        self.port = port
+        self.host = host
+        self.client_parser = client_parser
+        self.tickers = []  # tickers owned by the shard
+        self.process = None  # worker process, None until the shard owns a ticker
+        self.idle = []  # idle connections
+        self.lock = threading.Lock()  # guards the idle connections
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def read_reply(self, sock, buffer):
+        """
+        :return: next frame received on the connection
         """
-        calc rolling stats: 24 hours rolling period: e.g. 3pm yesterday to 3pm today
 
-        :param df_price_raw: df containing ticker's price (stored in database.price)
-        :type df_price_raw: dataframe
+        while True:
+            payloads = self.client_parser.split_frames(buffer)
+            if payloads:
+                return payloads[0]
+            bdata = sock.recv(65536)
+            if not bdata:
+                raise Exception('{} closed the connection'.format(self.name))
+            buffer += bdata
+
+    def request(self, cmd, timeout=120):
         """
+        send one command to the worker and wait for its reply
 
-        # proprocess raw df_price
-        df_price = self.index_time_ascd(df_price_raw)
+        # an idle connection may have been closed by the worker in the meantime: the command is then sent again
+        # once on a new connection
 
-        # calc rolling mean and std.
-        self.rolling_mean = df_price.rolling(self.rolling_period, min_periods=self.min_rolling_periods).mean().astype(float)
-        self.rolling_mean.dropna(inplace=True)
-        self.rolling_std = df_price.rolling(self.rolling_period, self.min_rolling_periods).std().astype(float)
-        self.rolling_std.dropna(inplace=True)
+        :return: result of the command (an error reply is raised)
+        """
 
-        # make sure that price index aligns with rolling stats index
-        self.price = df_price.loc[self.rolling_mean.index].astype(float)
+        with self.lock:
+            sock = self.idle.pop() if self.idle else None
+        pooled = sock is not None
 
-    def momentum_strategy(self, df_price):
+        while True:
+            if sock is None:
+                sock = socket.create_connection((self.host, self.port), timeout=timeout)
+            try:
+                sock.sendall(self.client_parser.encode_frame({'id': 0, 'cmd': cmd}))
+                reply = self.read_reply(sock, bytearray())
+                break
+            except socket.timeout:  # the worker got the command
+                sock.close()
+                raise
+            except Exception:
+                sock.close()
+                if not pooled:
+                    raise
+                sock, pooled = None, False
+        with self.lock:
+            self.idle.append(sock)
+
+        if 'error' in reply:
+            raise Exception(reply['error'])
+        return reply['result']
+
+    def feed(self, publish):
         """
-        Implement the momentum strategy to generate trading signal based on price, rolling mean and rolling std
+        thread: subscribe to the worker's new bars and publish the rows of the tickers the shard owns, reconnecting
+        while the worker runs
 
-        :param df_price: price database with time index of ascending order
-        :return: df of trading signal and price
+        :param publish: function(bar_time, rows dict) queuing a push for the coordinator's subscribers
         """
 
-        # get price, rolling mean, rolling std
-        self.calc_rolling_stats(df_price)
+        while self.running:
+            try:
+                sock = socket.create_connection((self.host, self.port))
+                sock.sendall(self.client_parser.encode_frame({'id': 0, 'cmd': 'subscribe'}))
+                buffer = bytearray()
+                while True:
+                    bdata = sock.recv(65536)
+                    if not bdata:
+                        break
+                    buffer += bdata
+                    for payload in self.client_parser.split_frames(buffer):
+                        if payload.get('push') == 'bar':
+                            tickers = set(self.tickers)
+                            rows = {row.split(' ')[0]: row for row in payload['rows']}
+                            publish(payload['datetime'],
+                                    {ticker: row for ticker, row in rows.items() if ticker in tickers})
+                sock.close()
+            except Exception:
+                time.sleep(1)
+
+    def close(self):
+        """
+        stop the worker
+        """
+
+        with self.lock:
+            for sock in self.idle:
+                sock.close()
+            self.idle = []
+        if self.running:
+            self.process.terminate()
+            self.process.wait()
 
-        # implement momentum strategy
-        signal_list = np.where(self.price > self.rolling_mean + self.rolling_std, 1,
-                               np.where(self.price < self.rolling_mean - self.rolling_std, -1, np.nan))
+class coordinator:
+    """
+    coordinator mode: the tickers are sharded across local worker server.py processes by consistent hashing and
+    the clients keep talking to the coordinator only
+
+    # each worker is a full server (own GIL, own price database, own Source 1/Source 2 calls) in its own working
+    # directory (shards/<name>, with its report.csv); they share the persistent price cache, so moving a ticker to
+    # another shard does not download it again. "add"/"delete" and single-ticker "pnl" are routed to the owning
+    # shard, "data", "pnl all", "summary" and "report" are scattered to every shard and the replies are merged.
+    # "add_shard" starts one more shard: it takes over its tickers from the other shards (started with them, and
+    # only once it is ready are they moved to it and deleted from their previous shards; a shard that fails to start
+    # is removed again and the tickers stay where they were). A shard is only started once it owns a ticker
+    # the worker requests and startups of add/delete/add_shard run outside self.lock, which only guards the routing
+    # (ring, shards and their tickers), so queries keep being served meanwhile; the changes run one at a time
+
+    :param tickers: ticker universe
+    :param n_shards: number of shards
+    :param first_port: port of the first worker (the next ones follow)
+    :param worker_arguments: server.py arguments passed to every worker (see server_parser.worker_arguments)
+    :param client_parser: client_parser of the frames exchanged with the workers
+    :param directory: directory of the workers' working directories
+    :param ready_timeout: seconds to wait for a new worker to load its price database
+    """
 
-        # trading signal cald'd at time t would apply to t+1 period, so adjust the index for this
-        signal_list = signal_list[:-1]
-        time_index = self.price.index[1:]
+    def __init__(self, tickers, n_shards, first_port, worker_arguments, client_parser, directory='shards',
+                 ready_timeout=600):
+        self.tickers = []
+        self.worker_arguments = worker_arguments
+        self.client_parser = client_parser
+        self.directory = directory
+        self.ready_timeout = ready_timeout
+        self.next_port = first_port
+        self.ring = hash_ring()
+        self.shards = {}  # name: shard_client
+        self.subscription_hub = None  # subscribers of the new bars of all shards
+        self.executor = ThreadPoolExecutor(max_workers=max(4, 2 * n_shards))  # scatter requests
+        self.lock = threading.Lock()  # guards the routing: ring, shards and their tickers
+        self.changes = threading.Lock()  # one add/delete/add_shard at a time
+        for _ in range(n_shards):
+            self.ring.add(self.new_shard().name)
+        for ticker in tickers:
+            if ticker not in self.tickers:
+                self.tickers.append(ticker)
+                self.shards[self.ring.owner(ticker)].tickers.append(ticker)
+        atexit.register(self.close)
+
+    def new_shard(self):
+        """
+        :return: new shard, not on the ring yet (not started)
+        """
 
-        # get tickers list
-        self.tickers = list(self.price.columns.values)
+        shard = shard_client('shard{}'.format(len(self.shards)), self.next_port, self.client_parser)
+        self.next_port += 1
+        self.shards[shard.name] = shard
 
-        # generate signal dataframe and clean it
-        df_signal = pd.DataFrame(signal_list, columns=self.tickers, index=time_index)
+        return shard
 
-        # fill na: if mean-std < price < mean+std, signal(t+1) = signal(t), so use forward fill
-        df_signal.fillna(method='ffill', inplace=True)
-        df_signal.fillna(0, inplace=True)  # deal with the case where the earliest few records might have NA signals
-        df_signal = df_signal.astype(int)
+    def start(self):
+        """
+        start the shards owning tickers, the workers are terminated with the coordinator (exit or SIGTERM)
+        """
 
-        return df_signal, self.price  # df_price has one more row than df_signal
+        signal.signal(signal.SIGTERM, self.terminate)
+        for shard in self.shards.values():
+            if shard.tickers:
+                self.start_shard(shard, shard.tickers)
 
-    def calc_pnl(self, df_signal, df_price):
+    def terminate(self, signum, frame):
+        """
+        SIGTERM handler: stop the workers before exiting
         """
-        calc the pnl based on (price(t+1) - price(t)) * signal(t)
 
-        :return: df of pnl
+        self.close()
+        sys.exit(128 + signum)
+
+    def start_shard(self, shard, tickers):
+        """
+        start the worker process of a shard with the tickers and wait until it accepts connections
         """
 
-        # price(t+1) - price(t)
-        df_price_diff = df_price.diff()
+        directory = os.path.join(self.directory, shard.name)
+        os.makedirs(directory, exist_ok=True)
+        command = [sys.executable, os.path.abspath(__file__), '--port', str(shard.port),
+                   '--tickers'] + tickers + self.worker_arguments
+        with open(os.path.join(directory, 'server.log'), 'ab') as log:
+            shard.process = subprocess.Popen(command, cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+        print('{} started on port {} with {}'.format(shard.name, shard.port, ', '.join(tickers)))
 
-        # signal starts at 5:20 ends at 20:00, price starts at 5:15 ends at 20:00
-        # Therefore, we need price from 5:20 to 20:00 and signal from 5:20 to 20:00 - delta_t
-        df_price_diff = df_price_diff[2:]  # adjust price time series
-        df_signal = df_signal[:-1]  # adjust signal time series
-        df_signal.index = df_price_diff.index  # reset index for signal
+        deadline = time.time() + self.ready_timeout
+        while True:
+            if not shard.running or time.time() >= deadline:
+                shard.close()
+                raise Exception('{} did not start, see {}'.format(shard.name, os.path.join(directory, 'server.log')))
+            try:
+                socket.create_connection((shard.host, shard.port)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
 
-        # calc pnl
-        df_pnl = df_price_diff * df_signal
+        if self.subscription_hub is not None:
+            thread_feed = threading.Thread(target=shard.feed, args=(self.subscription_hub.publish,))
+            thread_feed.daemon = True
+            thread_feed.start()
 
-        return df_pnl
+    def wait_shard(self, shard):
+        """
+        wait until a shard has loaded its price database (errors of the load are raised)
+        """
 
-class genReport:
-    """
-    generate trading strategy report based on stock price and strategy analytics
-    """
+        deadline = time.time() + self.ready_timeout
+        while str(shard.request('data')).startswith('server not ready'):
+            if time.time() >= deadline:
+                raise Exception('{} not ready after {} s'.format(shard.name, self.ready_timeout))
+            time.sleep(0.5)
 
-    def __init__(self):
-        pass
+    def close(self):
+        for shard in list(self.shards.values()):
+            shard.close()
+
+    def owner(self, ticker):
+        """
+        :return: shard owning the ticker
+        """
+
+        with self.lock:
+            return self.shards[self.ring.owner(ticker)]
+
+    def active_shards(self):
+        """
+        :return: shards owning tickers and the tickers they own (copied, for a consistent scatter)
+        """
+
+        with self.lock:
+            return [(shard, list(shard.tickers)) for shard in self.shards.values() if shard.tickers]
+
+    def scatter(self, cmd):
+        """
+        send a command to every shard owning tickers in parallel
+
+        :return: list of (tickers of the shard, reply); a string reply (e.g. server not ready) is raised
+        """
+
+        shards = self.active_shards()
+        futures = [(tickers, self.executor.submit(shard.request, cmd)) for shard, tickers in shards]
+        replies = [(tickers, future.result()) for tickers, future in futures]
+        for _, reply in replies:
+            if isinstance(reply, str):
+                raise Exception(reply)
+
+        return replies
 
     @staticmethod
-    def stack_df(df, name_second_col, name_third_col):
+    def merge_rows(replies, skip=()):
         """
-        concatenate all columns in a dataframe
+        merge "TICKER   ..." rows of the shards (only the rows of the tickers each shard owns) and their notes
 
-        :param df: dataframe with time as its index.
-        :param name_second_col: string to rename for the second col of the stacked df
-        :param name_third_col: string to rename for the third col of the stacked df
-        :return: stacked dataframe with second and third column name as specified
+        :return: rows, notes (distinct, in order)
         """
 
-        df_output = df.stack().reset_index()
-        df_output.rename(columns={df_output.columns[0]: "datetime", df_output.columns[1]: name_second_col, df_output.columns[2]: name_third_col}, inplace=True)
+        rows, notes = [], []
+        for tickers, reply in replies:
+            for row in reply:
+                if row.startswith('('):
+                    if row not in notes:
+                        notes.append(row)
+                elif row.split(' ')[0] in tickers and row not in skip:
+                    rows.append(row)
 
-        return df_output
+        return rows, notes
 
-    def combine_df(self, df_pnl, df_signal, df_price):
+    def process_input(self, client_input):
         """
-        combine df_price, df_pnl, df_signal to form the report dataframe
+        perform one client input across the shards
+
+        :return: result to send back to the client
         """
 
-        # concatenate all columns in each dataframe
-        df_pnl = self.stack_df(df_pnl, 'ticker', 'pnl')
-        df_signal = self.stack_df(df_signal, 'ticker', 'signal')
-        df_price = self.stack_df(df_price, 'ticker', 'price')
+        try:
+            if re.match(r"^data( \w+)?( \d\d\d\d-\d\d-\d\d-\d\d:\d\d)?$", client_input):
+                return self.query_data(client_input)
+            elif re.match(r"^add .", client_input):
+                return self.add_ticker(client_input.split(' ')[1])
+            elif re.match(r"^delete .", client_input):
+                return self.delete_ticker(client_input.split(' ')[1])
+            elif re.match(r"^pnl( \w+)? \S+ \S+ \S+$", client_input) and client_input.split(' ')[-3] != 'all':
+                ticker = client_input.split(' ')[-3]  # "pnl [strategy] <ticker> <from> <to>"
+                if ticker not in self.tickers:
+                    return 'ticker not found: {}'.format(ticker)
+                return self.owner(ticker).request(client_input)
+            elif re.match(r"^pnl( \w+)? all \S+ \S+$", client_input):
+                return self.query_pnl_all(client_input)
+            elif re.match(r"^summary ", client_input):
+                replies = self.scatter(client_input)
+                rows, notes = self.merge_rows(replies)
+                return [replies[0][1][0]] + self.order_rows(rows) + notes if replies else '(no data in the range)'
+            elif client_input.lower() == 'report':
+                self.scatter(client_input)
+                return 'report generated'
+            elif client_input == 'strategies':
+                return self.active_shards()[0][0].request(client_input)
+            elif client_input == 'add_shard':
+                return self.add_shard()
+            elif client_input == 'shards':
+                return ['{} (port {}): {}'.format(shard.name, shard.port, ', '.join(tickers))
+                        for shard, tickers in self.active_shards()]
+            elif re.match(r"^(un)?subscribe( .+)?$", client_input):
+                return 'subscribe requires the frame protocol'
+            else:
+                return 'unrecognized inputs'
+        except IndexError:
+            return 'server not ready: no shard owns any ticker'
+        except Exception as e:
+            return str(e)
+
+    def query_data(self, client_input):
+        """
+        scatter a data query and merge the rows of all shards (in ticker order)
+        """
 
-        # join df_price, df_signal and df_pnl
-        df_report = df_price.merge(df_signal.merge(df_pnl, on=['datetime', 'ticker']), on=['datetime', 'ticker'])
-        # format datetime column
-        df_report['datetime'] = df_report['datetime'].dt.strftime('%Y-%m-%d-%H:%M')
+        rows, notes = self.merge_rows(self.scatter(client_input))
+        if not rows:  # no shard has data as of the time
+            return ['Server has no data', '(specifying time before any data exists)']
 
-        return df_report
+        return self.order_rows(rows) + notes
 
-    def generate_report(self, df_pnl, df_signal, df_price, save):
+    def order_rows(self, rows):
         """
-        generate the pnl, price, signal time series report for the requested tickers
+        :return: rows in the order of the coordinator's tickers (as a single server lists them)
         """
 
-        # ensure correct formats for all input dataframes
-        # align the time index for df_price, df_signal with df_pnl
-        df_price = df_price.loc[df_pnl.index]
-        df_signal = df_signal.loc[df_pnl.index]
-        # adjust price and pnl's output to be two decimal places
-        df_price = df_price.round(2)
-        df_pnl = df_pnl.round(2)
+        order = {ticker: i for i, ticker in enumerate(self.tickers)}
 
-        # concatenate all columns for df_price, df_signal and df_pnl
-        df_report = self.combine_df(df_pnl, df_signal, df_price)
+        return sorted(rows, key=lambda row: order.get(row.split(' ')[0], len(order)))
 
-        # save the report to local
-        if save:
-            filepath = os.path.join(os.getcwd(), "report.csv")
-            print("report saved at this address: ")
-            print(filepath)
-            print()
-            df_report.to_csv(filepath, index=False)
+    def query_pnl_all(self, client_input):
+        """
+        scatter "pnl all" and merge the tickers' pnl, with the total over all shards
+        """
 
-        return df_report
+        rows, notes = self.merge_rows(self.scatter(client_input))
+        total = sum(float(row.split(' ')[-1]) for row in rows)
 
-    def query_data(self, df_report, query_time):
+        return self.order_rows(rows) + ['total   {}'.format(round(total, 2))] + notes
+
+    def add_ticker(self, ticker):
         """
-        query from report for latest price and signal available as of the time specified
+        add a ticker to its owning shard (started with it if the shard is not running yet)
+
+        :return: 0 success, 1 server error, 2 invalid ticker (as client_add_tickers)
         """
 
-        # convert 'datetime' column from string to datetime for comparison later
-        df_report = df_report.copy()
-        df_report['datetime'] = pd.to_datetime(df_report['datetime'])
+        with self.changes:
+            if ticker in self.tickers:
+                return 0
+            shard = self.owner(ticker)
+            if shard.running:
+                msg = shard.request('add {}'.format(ticker))
+            else:  # first ticker of the shard
+                try:
+                    self.start_shard(shard, [ticker])
+                    self.wait_shard(shard)
+                    msg = 0
+                except Exception as e:
+                    shard.close()
+                    msg = 2 if str(e) == 'invalid ticker' else 1
+            if msg == 0:
+                with self.lock:
+                    shard.tickers.append(ticker)
+                    self.tickers.append(ticker)
 
-        # get the latest info from the report as of the query_time
-        latest_time_in_report = df_report['datetime'][df_report['datetime'] <= query_time].iloc[-1]
-        latest_info = df_report.loc[df_report['datetime'] == latest_time_in_report][['ticker', 'price', 'signal']]
-        # format the result
-        latest_info['result'] = latest_info['ticker'].astype(str) + "   " + \
-                                latest_info['price'].astype(str) + "," + \
-                                latest_info["signal"].astype(str)
-        result = latest_info['result'].to_list()
+        return msg
 
-        return result
+    def delete_ticker(self, ticker):
+        """
+        delete a ticker from its owning shard
+
+        :return: 0 success, 1 server error, 2 ticker not found (as client_delete_tickers)
+        """
+
+        with self.changes:
+            if ticker not in self.tickers:
+                return 2
+            shard = self.owner(ticker)
+            msg = shard.request('delete {}'.format(ticker))
+            if msg == 0:
+                with self.lock:
+                    shard.tickers.remove(ticker)
+                    self.tickers.remove(ticker)
+
+        return msg
+
+    def add_shard(self):
+        """
+        rebalance onto one more shard: it is started with the tickers it takes over, and once it is ready they are
+        moved to it and deleted from their previous shards
+        """
+
+        with self.changes:
+            with self.lock:
+                shard = self.new_shard()  # no ticker yet, so not scattered to
+                ring = self.ring.copy()
+                ring.add(shard.name)
+                moved = [ticker for ticker in self.tickers if ring.owner(ticker) == shard.name]
+                if not moved:
+                    self.ring = ring
+                    return '{} added, no ticker moved (started once it owns a ticker)'.format(shard.name)
+
+            try:
+                self.start_shard(shard, moved)
+                self.wait_shard(shard)
+            except Exception as e:  # roll back: the tickers stay on their shards
+                shard.close()
+                with self.lock:
+                    del self.shards[shard.name]
+                return '{} not added: {}'.format(shard.name, e)
+
+            with self.lock:
+                previous = {ticker: self.shards[self.ring.owner(ticker)] for ticker in moved}
+                self.ring = ring
+                shard.tickers = list(moved)
+                for ticker in moved:
+                    previous[ticker].tickers.remove(ticker)  # rows of the ticker are now taken from the new shard
+            for ticker in moved:
+                previous[ticker].request('delete {}'.format(ticker))
+
+        return '{} added, tickers moved: {}'.format(shard.name, ', '.join(moved))
 
 class controller:
     """
     This class is to coordinate database, trading_strategy and report
     """
 
-    def __init__(self, tickers, sampling_period):
+    def __init__(self, tickers, sampling_period, fetch_workers=8, source1_rate_limit=None, quote_timeout=10,
+                 ready_timeout=None, cache_path=None, cache_max_age=1440, report_format='csv', strategy_workers=0,
+                 report_layout='long', strategies=None, retention_hot=0, retention_warm=0, warm_sampling=60,
+                 query_cache_size=1024):
         self.tickers = tickers
+        self.ready_timeout = ready_timeout  # seconds client requests wait for the price database at most
         self.sampling_period = sampling_period
+        # bounded memory for long-running servers: older bars are downsampled, then evicted
+        retention = None
+        if retention_hot:
+            rolling_periods = [pd.Timedelta(config[0]) for config in (strategies or {}).values()] or \
+                              [pd.Timedelta(strategy_engine.default_config[0])]
+            if pd.Timedelta(hours=retention_hot) < max(rolling_periods):
+                raise Exception('retention_hot must cover the longest strategy rolling period')
+            retention = retention_policy(retention_hot, retention_warm, warm_sampling)
         # create database, trading_strategy and report objects
-        self.database = database(tickers, sampling_period)
-        self.trading_strategy = trading_strategy()
-        self.report = genReport()
+        self.database = database(tickers, sampling_period, fetch_workers, source1_rate_limit,
+                                 quote_timeout=quote_timeout, cache_path=cache_path, cache_max_age=cache_max_age,
+                                 retention=retention)
+        # full strategy computations are sharded across a process pool if more than one worker is asked for
+        self.strategy_shards = strategy_shards(strategy_workers) if strategy_workers > 1 else None
+        self.trading_strategy = trading_strategy(self.strategy_shards)
+        self.report = genReport(report_format, report_layout)
+        # materialized reports of every strategy, kept up to date by the database on every new bar. The default
+        # strategy's report is the one saved to local and pushed to subscribers
+        self.strategy_engine = strategy_engine(self.report, strategies, self.strategy_shards)
+        self.report_store = self.strategy_engine.store()
+        self.database.listeners.append(self.strategy_engine)
+        # encoded replies of the data queries
+        self.query_cache = query_cache(query_cache_size)
+        self.database.listeners.append(self.query_cache)
         self.price = None
         self.report_content = None
 
@@ -741,51 +4625,152 @@ class controller:
 
         self.database.update_price_thread()
 
+    def wait_ready(self, timeout=None):
+        """
+        wait until the price database has been generated
+
+        :param timeout: seconds to wait at most, None to wait until generated
+        :return: False if the price database is still being generated after the timeout
+        """
+
+        return self.database.wait_price(timeout)
+
     def get_price(self, latest):
         """
         get stock price cache from database class
 
-        # this function must be run after function update_price has been run to generate the price database
+        # this function must be run after function update_price has been run to generate the price database. It
+        # blocks until the database signals that the price is loaded
         """
 
-        # get latest price from database object
-        while True:
-            self.price = self.database.get_price(latest)
-            # check if the price has been generated
-            if isinstance(self.price, pd.DataFrame):
-                # raise Exception("Please run update_price to generate the price first!")
-                break
+        self.wait_ready()
+        self.price = self.database.get_price(latest)
+
+    def generate_report_when_ready(self):
+        """
+        generate the report and save to local as soon as the price database is generated (in a thread, so that the
+        server can answer clients during warm-up)
+
+        # the report saved is the snapshot of the materialized report store, the strategy is not run again
+        """
+
+        def generate():
+            try:
+                self.generate_report(latest=True, save=True)
+            except Exception as e:
+                print('failed to generate report: {}'.format(e))
+
+        thread_report = threading.Thread(target=generate)
+        thread_report.daemon = True
+        thread_report.start()
+
+    def ensure_report(self):
+        """
+        make sure the materialized report exists. It is only built here if the database has not built it yet
+        """
+
+        while not self.strategy_engine.ready:
+            self.get_price(True)  # wait for the price database without holding the lock
+            self.database.notify()  # changes still being processed by the listeners
+            with self.database.lock:
+                store = self.database.price_store
+                size = store.size
+                df_price = store.to_frame()
+
+            # full build without any lock held, neither the price updates nor the other listeners wait for it
+            engine = self.strategy_engine.prepare(df_price)
+
+            # only swapped in if the price database has not changed since it was read: the unbuilt reports skipped
+            # the listener calls of any change, which the new reports would miss (or get twice if still queued)
+            with self.database.listener_lock, self.database.lock:
+                if self.strategy_engine.ready:
+                    return
+                if self.database.price_store is store and store.size == size and not self.database.events:
+                    self.strategy_engine.adopt(engine)
 
     def generate_report(self, latest, save):
         """
         generate the trading strategy analytics report based on updated price
         """
 
+        # latest report is read from the materialized report store, no recomputation
+        if latest:
+            self.ensure_report()
+            snapshot = self.report_store.snapshot
+            if save:
+                self.report.save_snapshot(snapshot)
+            return
+
         # get price database from database class
         self.get_price(latest)
 
         # calc analytics to form the report
-        df_signal, df_price = self.trading_strategy.momentum_strategy(self.price)  # get trading signals
-        df_pnl = self.trading_strategy.calc_pnl(df_signal, df_price)  # get pnl
+        df_signal, df_price, df_pnl = self.trading_strategy.run(self.price)  # get trading signals and pnl
 
         # generate report
         self.report_content = self.report.generate_report(df_pnl, df_signal, df_price, save)
 
-    def query_data(self, query_time=dt.now()):
+    def query_data(self, query_time=dt.now(), strategy=None):
         """
         query from report for latest price and signal available as of the time specified
+
+        :param strategy: name of the strategy (None: default strategy)
+        """
+
+        return list(self.query_reply(query_time, strategy).value)
+
+    def query_reply(self, query_time, strategy=None, note=None, pnl=False):
+        """
+        encoded reply of a query: the report rows as of the time specified (followed by the note if given), from
+        the query cache if the bar the query time resolves to has been queried before
+
+        :param pnl: whether the rows include the pnl (see genReport.format_rows)
+        :return: encoded_result
+        """
+
+        store = self.strategy_engine.store(strategy)  # unknown strategy raises before waiting for the report
+        self.ensure_report()
+
+        # consistent report and index without locking
+        snapshot = store.snapshot
+
+        with metrics.time('query'):
+            i = self.report.resolve_query(snapshot.report_times, query_time)
+            key = (strategy or strategy_engine.default, snapshot.generation, snapshot.report_times[i],
+                   tuple(snapshot.tickers), pnl, note)
+
+            def build():
+                offsets = snapshot.report_offsets
+                rows = self.report.format_rows(snapshot.rows(offsets[i], offsets[i + 1]), pnl)
+                return rows + [note] if note else rows
+
+            return self.query_cache.get(key, build)
+
+    def query_range(self, from_time, to_time, strategy=None):
+        """
+        aggregates per ticker of the report between two times, from the prefix sums of the report (O(1) per ticker)
+
+        :return: tickers, dict of field: array (see pnl_index.range), first and last report time in the range
         """
 
-        self.generate_report(latest=True, save=False)
+        store = self.strategy_engine.store(strategy)
+        self.ensure_report()
+        snapshot = store.snapshot
+
+        with metrics.time('query_range'):
+            totals, first_time, last_time = snapshot.pnl_index.range(from_time, to_time)
 
-        return self.report.query_data(self.report_content, query_time)
+        return snapshot.pnl_index.tickers, totals, first_time, last_time
 
     def delete_ticker(self, ticker_deleted):
         """
         delete ticker's data from the stock price cache in database class
         """
 
-        self.database.delete_from_db(ticker_deleted)
+        self.database.delete_from_db(ticker_deleted)  # the report store drops it as a database listener
+        self.trading_strategy.drop_ticker(ticker_deleted)
+        if self.price is not None:
+            self.price = self.price.drop(columns=ticker_deleted, errors='ignore')
 
     def add_ticker(self, ticker_added):
         """
@@ -803,7 +4788,10 @@ if __name__ == "__main__":
     communication.launch_server()  # server is running after receiving user input
 
     # make connection between server and clients (running as a thread)
-    thread_tcp = threading.Thread(target=communication.build_tcp)
+    if communication.server_parser.mode == 'asyncio':
+        thread_tcp = threading.Thread(target=communication.build_tcp_async)
+    else:
+        thread_tcp = threading.Thread(target=communication.build_tcp)
     thread_tcp.daemon = True  # run at background for a long running process
     thread_tcp.start()
 
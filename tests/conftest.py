@@ -0,0 +1,193 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def trading_times(days=6, sampling=5, start='2023-01-02'):
+    """
+    bar times every "sampling" minutes from 4:00 to 20:00 on weekdays, time ascending
+    """
+
+    times = []
+    day = pd.Timestamp(start)
+    while len(times) < days * (16 * 60 // sampling + 1):
+        if day.weekday() < 5:
+            times += list(pd.date_range(day + pd.Timedelta(hours=4), day + pd.Timedelta(hours=20),
+                                        freq='{}min'.format(sampling)))
+        day += pd.Timedelta(days=1)
+
+    return pd.DatetimeIndex(times, name='time')
+
+
+def price_frame(tickers=('AAPL', 'MSFT', 'TOST'), days=6, seed=0):
+    """
+    random walk prices as returned by database.get_price: time index ascending, one column per ticker
+    """
+
+    times = trading_times(days)
+    rng = np.random.default_rng(seed)
+    values = 100 + np.cumsum(rng.normal(0, 0.3, (len(times), len(tickers))), axis=0)
+
+    return pd.DataFrame(np.round(values, 4), index=times, columns=list(tickers))
+
+
+def bar_frames(df_price):
+    """
+    rows of a price frame as the one-row bars passed to the database listeners
+    """
+
+    return [pd.DataFrame({'time': [time], **{ticker: [price] for ticker, price in row.items()}})
+            for time, row in df_price.iterrows()]
+
+
+@pytest.fixture
+def df_price():
+    return price_frame()
+
+
+class source1_stub:
+    """
+    stand-in for the Source 1 http session of database: answers with the bars of a price frame, latest on top
+    """
+
+    class response:
+        def __init__(self, content):
+            self.content = content
+
+    def __init__(self, df_price):
+        self.df_price = df_price
+
+    def get(self, url):
+        ticker = url.split('symbol=')[1].split('&')[0]
+        if ticker not in self.df_price.columns:
+            return self.response(b'{"Error Message": "Invalid API call"}')
+        df = pd.DataFrame({'time': self.df_price.index.strftime('%Y-%m-%d %H:%M:%S'), 'open': 1, 'high': 1, 'low': 1,
+                           'close': self.df_price[ticker].values, 'volume': 100})
+
+        return self.response(df.iloc[::-1].to_csv(index=False).encode())
+
+
+class source2_stub:
+    """
+    stand-in for the Source 2 quote fetcher of database: every fetch returns the next bar of a price frame
+    """
+
+    def __init__(self, df_price):
+        self.bars = iter(df_price.iterrows())
+
+    def fetch(self, tickers):
+        time, row = next(self.bars)
+
+        return {ticker: pd.DataFrame({'time': [time], ticker: [row[ticker]]}) for ticker in tickers
+                if ticker in row.index}, {}
+
+
+def loaded_controller(df_price, n_historical=400, **settings):
+    """
+    controller whose price database is loaded from the first bars of a price frame; the other bars are the next
+    real-time bars (database.append_realtime_price)
+    """
+
+    controller = server.controller(list(df_price.columns), 5, **settings)
+    controller.database.session = source1_stub(df_price.iloc[:n_historical])
+    controller.database.quote_fetcher = source2_stub(df_price.iloc[n_historical:])
+    controller.database.fetch_price_historical()
+
+    return controller
+
+
+def serve(controller, mode='thread', **settings):
+    """
+    serve a controller to clients on a free local port in a background thread, like __main__ does
+
+    :param settings: server_parser settings (max_connections, idle_timeout, workers)
+    :return: communication, port
+    """
+
+    communication = server.communication()
+    communication.controller = controller
+    communication.subscription_hub = server.subscription_hub(controller.report_store, communication.client_parser)
+    controller.database.listeners.append(communication.subscription_hub)
+    parser = communication.server_parser
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        parser.port = sock.getsockname()[1]
+    parser.mode = mode
+    parser.max_connections = settings.get('max_connections', 1000)
+    parser.idle_timeout = settings.get('idle_timeout', 0)
+    parser.workers = settings.get('workers', 4)
+    target = communication.build_tcp_async if mode == 'asyncio' else communication.build_tcp
+    threading.Thread(target=target, daemon=True).start()
+
+    deadline = time.time() + 5
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', parser.port)).close()
+            break
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+    return communication, parser.port
+
+
+class frame_client:
+    """
+    frame protocol client on a plain socket
+    """
+
+    def __init__(self, port, timeout=10):
+        self.client_parser = server.client_parser()
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+        self.buffer = bytearray()
+        self.frames = []
+
+    def send(self, cmd, request_id=0):
+        self.sock.sendall(self.client_parser.encode_frame({'id': request_id, 'cmd': cmd}))
+
+    def receive(self):
+        """
+        :return: next frame received (raises socket.timeout if none comes)
+        """
+
+        while not self.frames:
+            bdata = self.sock.recv(65536)
+            if not bdata:
+                raise ConnectionError('server closed the connection')
+            self.buffer += bdata
+            self.frames += self.client_parser.split_frames(self.buffer)
+
+        return self.frames.pop(0)
+
+    def close(self):
+        self.sock.close()
+
+
+def line_request(port, client_input, timeout=10):
+    """
+    send one input with the line protocol
+
+    :return: decoded reply
+    """
+
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+        sock.sendall(client_input.encode())
+        data = b''
+        while True:
+            data += sock.recv(65536)
+            try:
+                return json.loads(data.decode())
+            except ValueError:  # reply not complete yet
+                continue
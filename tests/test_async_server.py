@@ -0,0 +1,76 @@
+import json
+import socket
+import time
+
+import pytest
+
+from conftest import frame_client, loaded_controller, price_frame, serve
+
+
+@pytest.fixture(scope='module')
+def controller():
+    return loaded_controller(price_frame(days=3))
+
+
+def wait_connections(communication, n_connections):
+    deadline = time.time() + 5
+    while communication.n_connections != n_connections:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_idle_clients_are_disconnected(controller):
+    communication, port = serve(controller, 'asyncio', idle_timeout=1)
+    idle = frame_client(port)
+    subscriber = frame_client(port)
+    try:
+        idle.send('strategies', 1)
+        assert idle.receive()['id'] == 1
+        subscriber.send('subscribe', 1)
+        assert subscriber.receive()['result'] == 'subscribed to all tickers'
+
+        time.sleep(1.5)
+        assert idle.sock.recv(1) == b''  # closed by the server
+        # a subscriber waits for pushes, it is not idle
+        subscriber.send('strategies', 2)
+        assert subscriber.receive()['id'] == 2
+        wait_connections(communication, 1)
+    finally:
+        idle.close()
+        subscriber.close()
+
+
+def test_clients_over_the_connection_limit_are_refused(controller):
+    communication, port = serve(controller, 'asyncio', max_connections=2)
+    clients = []
+    try:
+        for n_connections in (1, 2):
+            clients.append(frame_client(port))
+            clients[-1].send('strategies', 1)
+            assert clients[-1].receive()['id'] == 1
+            wait_connections(communication, n_connections)
+        # refused in the client's protocol: a frame client gets an error frame, others the json line
+        refused = frame_client(port)
+        try:
+            refused.send('strategies', 7)
+            assert refused.receive() == {'id': 7, 'error': 'server busy, too many connections'}
+            assert refused.sock.recv(1) == b''
+        finally:
+            refused.close()
+        for client_input in (b'strategies', b''):  # a client sending nothing is answered after refuse_wait
+            with socket.create_connection(('127.0.0.1', port), timeout=10) as sock:
+                sock.sendall(client_input)
+                assert json.loads(sock.recv(4096).decode()) == 'server busy, too many connections'
+                assert sock.recv(1) == b''
+    finally:
+        for client in clients:
+            client.close()
+
+    # connections closed by their clients are released
+    wait_connections(communication, 0)
+    client = frame_client(port)
+    try:
+        client.send('strategies', 2)
+        assert client.receive()['id'] == 2
+    finally:
+        client.close()
@@ -0,0 +1,103 @@
+import socket
+import sys
+import threading
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    """
+    coordinator whose workers are not started: requests are recorded, startups do nothing
+    """
+
+    requests = []
+    monkeypatch.setattr(server.shard_client, 'request', lambda shard, cmd: requests.append((shard.name, cmd)) or 0)
+    monkeypatch.setattr(server.coordinator, 'start_shard', lambda self, shard, tickers: None)
+    monkeypatch.setattr(server.coordinator, 'wait_shard', lambda self, shard: None)
+    tickers = ['T{}'.format(i) for i in range(20)]
+    shards = server.coordinator(tickers, 2, 19000, [], server.client_parser(), directory=str(tmp_path))
+    shards.requests = requests
+
+    return shards
+
+
+def owned(shards):
+    return {name: list(shard.tickers) for name, shard in shards.shards.items()}
+
+
+def test_add_shard_moves_tickers(shards):
+    reply = shards.add_shard()
+
+    moved = shards.shards['shard2'].tickers
+    assert reply == 'shard2 added, tickers moved: {}'.format(', '.join(moved))
+    assert all(shards.owner(ticker).name == 'shard2' for ticker in moved)
+    assert sorted(sum(owned(shards).values(), [])) == sorted(shards.tickers)
+    assert sorted(cmd for _, cmd in shards.requests) == sorted('delete {}'.format(ticker) for ticker in moved)
+
+
+def test_add_shard_rolls_back_when_not_ready(shards, monkeypatch):
+    def not_ready(self, shard):
+        raise Exception('{} not ready after 600 s'.format(shard.name))
+    monkeypatch.setattr(server.coordinator, 'wait_shard', not_ready)
+    before = owned(shards)
+
+    assert shards.add_shard() == 'shard2 not added: shard2 not ready after 600 s'
+    assert owned(shards) == before
+    assert all(shards.owner(ticker).name in before for ticker in shards.tickers)
+    assert shards.requests == []
+
+
+def test_add_invalid_first_ticker_of_a_shard(tmp_path, monkeypatch):
+    def invalid(self, shard):
+        raise Exception('invalid ticker')
+    monkeypatch.setattr(server.coordinator, 'start_shard', lambda self, shard, tickers: None)
+    monkeypatch.setattr(server.coordinator, 'wait_shard', invalid)
+    shards = server.coordinator([], 2, 19000, [], server.client_parser(), directory=str(tmp_path))
+
+    assert shards.add_ticker('NOPE') == 2
+    assert shards.tickers == [] and owned(shards) == {'shard0': [], 'shard1': []}
+
+
+def test_pnl_of_a_strategy_goes_to_the_owning_shard(shards):
+    cmd = 'pnl slow T3 2023-01-03-00:00 2023-01-12-00:00'
+    shards.process_input(cmd)
+
+    assert shards.requests == [(shards.owner('T3').name, cmd)]
+
+
+def test_workers_keep_default_connection_settings(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['server.py', '--shards', '2', '--mode', 'asyncio', '--idle_timeout', '5',
+                                      '--max_connections', '10', '--workers', '2', '--cache_path', 'cache.db'])
+    parser = server.server_parser()
+    parser.get_arguments()
+    arguments = parser.worker_arguments()
+
+    assert not {'--mode', '--idle_timeout', '--max_connections', '--workers', '--shards'} & set(arguments)
+    assert arguments[arguments.index('--cache_path') + 1].endswith('cache.db')
+
+
+def test_request_retries_a_closed_idle_connection():
+    # a worker that closes every connection after one reply, like an idle timeout
+    client_parser = server.client_parser()
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        for served in range(1, 3):
+            connection, _ = listener.accept()
+            buffer = bytearray()
+            while not client_parser.split_frames(buffer):
+                buffer += connection.recv(4096)
+            connection.sendall(client_parser.encode_frame({'id': 0, 'result': served}))
+            connection.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+
+    shard = server.shard_client('shard0', listener.getsockname()[1], client_parser)
+    assert shard.request('data') == 1
+    assert shard.request('data') == 2  # the pooled connection is closed: sent again on a new one
+    thread.join(5)
+    listener.close()
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+from conftest import price_frame, source1_stub, source2_stub
+
+
+@pytest.fixture
+def df_recent():
+    # bars up to 5 minutes before now, so cached bars are recent
+    df_price = price_frame(days=2)
+    shift = pd.Timestamp.now().floor('5min') - pd.Timedelta(minutes=5) - df_price.index[-1]
+
+    return df_price.set_axis((df_price.index + shift).rename('time'))
+
+
+def load(tmp_path, df_price, cache_max_age):
+    """
+    :return: price database loaded by a database whose cache holds the bars but the last 20, with other prices
+    """
+
+    cache = server.price_cache(str(tmp_path / 'cache.db'), 5)
+    for ticker in df_price.columns:
+        cache.save(ticker, df_price.index.values[:-20], df_price[ticker].values[:-20] + 1000)
+    db = server.database(list(df_price.columns), 5, cache_path=str(tmp_path / 'cache.db'),
+                         cache_max_age=cache_max_age)
+    db.session = source1_stub(df_price)
+    db.fetch_price_historical()
+
+    return db
+
+
+def test_fresh_cache_only_gets_the_missing_tail(tmp_path, df_recent):
+    db = load(tmp_path, df_recent, 1440)
+
+    # the cached bars are kept, the tail is downloaded and written through
+    expected = df_recent.copy()
+    expected.iloc[:-20] += 1000
+    pd.testing.assert_frame_equal(db.get_price(True), expected, check_freq=False)
+    times, closes = db.price_cache.load('MSFT')
+    np.testing.assert_array_equal(times, df_recent.index.values)
+    np.testing.assert_array_equal(closes, expected['MSFT'].values)
+
+
+def test_stale_cache_is_refreshed(tmp_path, df_recent):
+    db = load(tmp_path, df_recent, 60)
+
+    pd.testing.assert_frame_equal(db.get_price(True), df_recent, check_freq=False)
+    np.testing.assert_array_equal(db.price_cache.load('AAPL')[1], df_recent['AAPL'].values)
+
+
+def test_current_cache_is_not_downloaded(tmp_path, df_recent):
+    cache = server.price_cache(str(tmp_path / 'cache.db'), 5)
+    cache.save('AAPL', df_recent.index.values + pd.Timedelta(minutes=4), df_recent['AAPL'].values)
+    db = server.database(['AAPL'], 5, cache_path=str(tmp_path / 'cache.db'))
+    db.session = None  # any download fails
+    db.fetch_price_historical()
+
+    np.testing.assert_array_equal(db.get_price(True)['AAPL'].values, df_recent['AAPL'].values)
+
+
+def test_only_quoted_tickers_are_written_through(tmp_path, df_recent):
+    db = load(tmp_path, df_recent, 1440)
+    bar_time = df_recent.index[-1] + pd.Timedelta(minutes=5)
+    db.quote_fetcher = source2_stub(pd.DataFrame({'AAPL': [123.0]}, index=[bar_time]))  # no quote for the others
+    db.append_realtime_price()
+
+    assert db.get_price(True).index[-1] == bar_time
+    times, closes = db.price_cache.load('AAPL')
+    assert (times[-1], closes[-1]) == (bar_time.to_datetime64(), 123.0)
+    # the price carried forward for MSFT is not cached as its bar
+    np.testing.assert_array_equal(db.price_cache.load('MSFT')[0], df_recent.index.values)
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+import server
+from conftest import frame_client, line_request, loaded_controller, price_frame, serve
+
+
+@pytest.fixture(scope='module')
+def controller():
+    return loaded_controller(price_frame(days=3))
+
+
+@pytest.fixture(scope='module', params=['thread', 'asyncio'])
+def port(request, controller):
+    return serve(controller, request.param)[1]
+
+
+def test_split_frames_keeps_partial_frames():
+    client_parser = server.client_parser()
+    data = client_parser.encode_frame({'id': 1, 'cmd': 'data'}) + client_parser.encode_frame({'id': 2, 'cmd': 'x' * 300})
+    buffer = bytearray()
+    payloads = []
+    for i in range(0, len(data), 7):  # received in small pieces
+        buffer += data[i:i + 7]
+        payloads += client_parser.split_frames(buffer)
+
+    assert payloads == [{'id': 1, 'cmd': 'data'}, {'id': 2, 'cmd': 'x' * 300}]
+    assert buffer == bytearray()
+
+    buffer = bytearray(data[:-1])
+    assert client_parser.split_frames(buffer) == [{'id': 1, 'cmd': 'data'}]
+    assert bytes(buffer) == data[len(client_parser.encode_frame({'id': 1, 'cmd': 'data'})):-1]
+
+
+def test_split_frames_refuses_oversized_frames():
+    client_parser = server.client_parser()
+    buffer = bytearray(client_parser.frame_header.pack(client_parser.max_frame_size + 1) + b'{}')
+
+    with pytest.raises(Exception, match='frame too large'):
+        client_parser.split_frames(buffer)
+
+
+def test_pipelined_replies_carry_request_ids(controller, port):
+    client = frame_client(port)
+    commands = ['data', 'data 2023-01-03-12:02', 'bogus', 'strategies', 'data nope']
+    try:
+        # all requests in one write, before any reply is read
+        client.sock.sendall(b''.join(client.client_parser.encode_frame({'id': 'r{}'.format(i), 'cmd': cmd})
+                                     for i, cmd in enumerate(commands)))
+        replies = [client.receive() for _ in commands]
+    finally:
+        client.close()
+
+    assert [reply['id'] for reply in replies] == ['r{}'.format(i) for i in range(len(commands))]
+    assert replies[0]['result'][:-1] == controller.query_data()
+    assert replies[1]['result'] == controller.query_data(datetime(2023, 1, 3, 12, 2))
+    assert replies[2]['result'] == 'unrecognized inputs'
+    assert replies[3]['result'] == ['momentum: rolling period 24h, min periods 15, band 1 (default)']
+    assert replies[4]['result'] == 'strategy not found: nope'
+
+
+def test_line_protocol_is_still_served(controller, port):
+    # a first byte other than zero selects the line protocol: one input per message, json replies
+    assert line_request(port, 'data 2023-01-03-12:02') == controller.query_data(datetime(2023, 1, 3, 12, 2))
+    assert line_request(port, 'subscribe') == 'subscribe requires the frame protocol'
+
+
+def test_large_replies_are_not_truncated():
+    tickers = ['T{:03d}'.format(i) for i in range(300)]
+    controller = loaded_controller(price_frame(tickers=tickers, days=2), n_historical=300)
+    _, port = serve(controller, 'thread')
+    client = frame_client(port)
+    try:
+        client.send('data', 7)
+        reply = client.receive()
+    finally:
+        client.close()
+
+    assert reply['id'] == 7
+    assert len(reply['result']) == len(tickers) + 1
+    assert len(server.client_parser.encode_result(reply['result'])) > 4096
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+import numpy as np
+
+import server
+from conftest import loaded_controller, price_frame, source1_stub
+
+
+def test_query_times_of_one_bar_share_an_entry():
+    controller = loaded_controller(price_frame(days=3))
+    cache = controller.query_cache
+
+    first = controller.query_reply(datetime(2023, 1, 3, 12, 0))
+    assert controller.query_reply(datetime(2023, 1, 3, 12, 4)) is first  # resolves to the 12:00 bar
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert controller.query_reply(datetime(2023, 1, 3, 12, 5)) is not first
+    assert controller.query_reply(datetime(2023, 1, 3, 12, 0), note='(note)').value == first.value + ['(note)']
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    # hits are sent as the bytes encoded once
+    assert first.data == json.dumps(first.value).encode()
+    assert server.client_parser.encode_result(first) is first.data
+
+    # keyed by strategy, report generation, resolved report time, tickers, row format and note
+    generation = controller.report_store.generation
+    assert list(cache.entries)[0] == ('momentum', generation, np.datetime64('2023-01-03T12:00'),
+                                      ('AAPL', 'MSFT', 'TOST'), False, None)
+    assert list(cache.entries)[2][2:] == (np.datetime64('2023-01-03T12:00'), ('AAPL', 'MSFT', 'TOST'), False,
+                                          '(note)')
+    with_pnl = controller.query_reply(datetime(2023, 1, 3, 12, 0), pnl=True)
+    assert with_pnl is not first and with_pnl.value[0].startswith(first.value[0] + ',')
+
+
+def test_new_bars_keep_entries_ticker_changes_clear_them():
+    df_price = price_frame(tickers=('AAPL', 'MSFT', 'TOST', 'NVDA'), days=3)
+    controller = loaded_controller(df_price[['AAPL', 'MSFT', 'TOST']])
+    cache = controller.query_cache
+    before = controller.query_reply(datetime(2023, 1, 3, 12, 0))
+    controller.query_reply(datetime(2023, 1, 5, 12, 0))
+
+    controller.database.append_realtime_price()
+    assert len(cache.entries) == 2
+    assert controller.query_reply(datetime(2023, 1, 3, 12, 0)) is before
+
+    controller.database.session = source1_stub(df_price.iloc[:401])
+    controller.add_ticker('NVDA')
+    assert len(cache.entries) == 0
+    after = controller.query_reply(datetime(2023, 1, 3, 12, 0))
+    assert after.value[:3] == before.value and after.value[3].startswith('NVDA')
+
+    controller.delete_ticker('MSFT')
+    assert len(cache.entries) == 0
+    assert [row.split(' ')[0] for row in controller.query_reply(datetime(2023, 1, 3, 12, 0)).value] == \
+        ['AAPL', 'TOST', 'NVDA']
+
+
+def test_disabled_cache_keeps_no_entry():
+    controller = loaded_controller(price_frame(days=3), query_cache_size=0)
+    reply = controller.query_reply(datetime(2023, 1, 3, 12, 0))
+
+    assert controller.query_reply(datetime(2023, 1, 3, 12, 0)).value == reply.value
+    assert len(controller.query_cache.entries) == 0
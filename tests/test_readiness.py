@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+import server
+from conftest import frame_client, price_frame, serve, source1_stub
+
+
+@pytest.mark.parametrize('mode', ['thread', 'asyncio'])
+def test_clients_get_a_reply_during_warm_up(mode):
+    df_price = price_frame(days=3)
+    controller = server.controller(list(df_price.columns), 5, ready_timeout=0.2)
+    _, port = serve(controller, mode)
+    client = frame_client(port)
+    try:
+        client.send('data', 1)
+        assert client.receive() == {'id': 1, 'result': 'server not ready: price data is still loading, please retry '
+                                                        'later'}
+        client.send('strategies', 2)  # answered without the price
+        assert client.receive()['result'] == ['momentum: rolling period 24h, min periods 15, band 1 (default)']
+
+        controller.database.session = source1_stub(df_price)
+        controller.database.fetch_price_historical()
+        client.send('data', 3)
+        assert client.receive()['result'][:-1] == controller.query_data()
+    finally:
+        client.close()
+
+
+def test_waiters_wake_up_when_the_price_is_loaded():
+    df_price = price_frame(days=3)
+    controller = server.controller(list(df_price.columns), 5)
+    controller.database.session = source1_stub(df_price)
+    loader = threading.Timer(0.3, controller.database.fetch_price_historical)
+    start = time.time()
+    loader.start()
+
+    assert not controller.wait_ready(0.05)
+    assert controller.wait_ready(10)
+    assert time.time() - start < 5
+    assert controller.report_store.ready
+
+
+def test_failed_load_is_reported_to_waiters():
+    controller = server.controller(['NOPE'], 5)
+    controller.database.session = source1_stub(price_frame(days=1))
+
+    with pytest.raises(Exception, match='invalid ticker'):
+        controller.database.update_price()
+    with pytest.raises(Exception, match='invalid ticker'):
+        controller.wait_ready(10)
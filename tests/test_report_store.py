@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+from conftest import bar_frames, loaded_controller, price_frame, source1_stub, source2_stub
+
+
+def new_store(**kwargs):
+    return server.report_store(server.trading_strategy(**kwargs), server.genReport())
+
+
+@pytest.mark.parametrize('n_historical', [100, 600])
+def test_incremental_matches_full_build(df_price, n_historical):
+    # the report built from part of the bars and extended bar by bar equals the report built from all of them
+    store = new_store()
+    store.on_historical(df_price.iloc[:n_historical])
+    for df_bar in bar_frames(df_price.iloc[n_historical:]):
+        store.on_realtime(df_bar)
+
+    full = new_store()
+    full.on_historical(df_price)
+    pd.testing.assert_frame_equal(store.snapshot.report_content, full.snapshot.report_content, check_exact=True)
+    np.testing.assert_array_equal(store.snapshot.report_times, full.snapshot.report_times)
+    np.testing.assert_array_equal(store.snapshot.report_offsets, full.snapshot.report_offsets)
+
+
+def test_snapshot_unchanged_by_later_bars(df_price):
+    store = new_store()
+    store.on_historical(df_price.iloc[:400])
+    snapshot = store.snapshot
+    df_before = snapshot.report_content.copy()
+    for df_bar in bar_frames(df_price.iloc[400:]):
+        store.on_realtime(df_bar)
+
+    assert store.snapshot.size > snapshot.size
+    pd.testing.assert_frame_equal(snapshot.rows(0, snapshot.size), df_before, check_exact=True)
+
+
+def test_query_rows(df_price):
+    store = new_store()
+    store.on_historical(df_price)
+    snapshot = store.snapshot
+    report = server.genReport()
+    df_report = snapshot.report_content
+
+    query_time = df_price.index[500] + pd.Timedelta(minutes=2)
+    expected = df_report[df_report['datetime'] == df_price.index[500]]
+    assert report.query_data(df_report, query_time) == \
+        ['{}   {},{}'.format(*row) for row in expected[['ticker', 'price', 'signal']].values]
+
+
+def test_range_matches_report(df_price):
+    store = new_store()
+    store.on_historical(df_price.iloc[:300])
+    for df_bar in bar_frames(df_price.iloc[300:]):
+        store.on_realtime(df_bar)
+    df_report = store.snapshot.report_content
+
+    from_time, to_time = df_price.index[350], df_price.index[900]
+    totals, first_time, last_time = store.snapshot.pnl_index.range(from_time, to_time)
+    df_range = df_report[(df_report['datetime'] >= from_time) & (df_report['datetime'] <= to_time)]
+    pnl = df_range.groupby('ticker', sort=False)['pnl'].sum()
+    # the report pnl is rounded to cents, the prefix sums are not
+    np.testing.assert_allclose(totals['pnl'], pnl[store.tickers].values, atol=0.005 * df_range['datetime'].nunique())
+    assert (first_time, last_time) == (df_range['datetime'].iloc[0], df_range['datetime'].iloc[-1])
+
+
+
+def test_range_queries_of_a_strategy(tmp_path, df_price, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    comm = server.communication()
+    comm.controller = server.controller(list(df_price.columns), 5,
+                                        strategies=server.strategy_engine.parse_configs(['slow:48h:30:1.5']))
+    comm.controller.database.session = source1_stub(df_price)
+    comm.controller.database.fetch_price_historical()
+
+    slow = new_store(rolling_period='48h', min_rolling_periods=30, band=1.5)
+    slow.on_historical(df_price)
+    totals, _, _ = slow.snapshot.pnl_index.range(df_price.index[0], df_price.index[-1])
+    times = '{:%Y-%m-%d-%H:%M} {:%Y-%m-%d-%H:%M}'.format(df_price.index[0], df_price.index[-1])
+    assert comm.process_input('pnl slow MSFT ' + times)[0] == 'MSFT   {}'.format(round(totals['pnl'][1], 2))
+    assert comm.process_input('pnl slow all ' + times)[:-2] == \
+        ['{}   {}'.format(ticker, round(pnl, 2)) for ticker, pnl in zip(slow.tickers, totals['pnl'])]
+    assert comm.process_input('summary slow ' + times)[1].startswith('AAPL   {},'.format(round(totals['pnl'][0], 2)))
+    assert comm.process_input('pnl MSFT ' + times) != comm.process_input('pnl slow MSFT ' + times)
+    assert comm.process_input('pnl nope MSFT ' + times) == 'strategy not found: nope'
+    assert comm.process_input('summary nope ' + times) == 'strategy not found: nope'
+
+    # "data <strategy>" rows carry the strategy's pnl, "data" keeps the price,signal rows
+    df_rows = slow.snapshot.report_content.iloc[-len(slow.tickers):]
+    assert comm.process_input('data slow {:%Y-%m-%d-%H:%M}'.format(df_price.index[-1])).value == \
+        ['{}   {},{},{}'.format(row.ticker, row.price, row.signal, row.pnl) for row in df_rows.itertuples()]
+    assert comm.process_input('data {:%Y-%m-%d-%H:%M}'.format(df_price.index[-1])).value[0].count(',') == 1
+
+
+def test_engine_matches_standalone_stores(df_price):
+    configs = {'momentum': ('24h', 15, 1), 'wide': ('24h', 15, 2), 'fast': ('2h', 5, 1)}
+    engine = server.strategy_engine(server.genReport(), configs)
+    engine.on_historical(df_price.iloc[:500])
+    for df_bar in bar_frames(df_price.iloc[500:]):
+        engine.on_realtime(df_bar)
+
+    for name, (rolling_period, min_periods, band) in configs.items():
+        store = new_store(rolling_period=rolling_period, min_rolling_periods=min_periods, band=band)
+        store.on_historical(df_price)
+        pd.testing.assert_frame_equal(engine.store(name).snapshot.report_content, store.snapshot.report_content,
+                                      check_exact=True)
+
+
+
+@pytest.mark.parametrize('missing', [False, True])
+def test_added_ticker_matches_full_build(df_price, missing):
+    # an added ticker gets the rows and incremental state a rebuild would give it (a rebuild if it has bars
+    # without a price)
+    if missing:
+        df_price = df_price.copy()
+        df_price.iloc[150:160, 2] = np.nan
+    configs = {'momentum': ('24h', 15, 1), 'wide': ('24h', 15, 2), 'fast': ('2h', 5, 1)}
+    engine = server.strategy_engine(server.genReport(), configs)
+    engine.on_historical(df_price[['AAPL', 'MSFT']].iloc[:500])
+    for df_bar in bar_frames(df_price[['AAPL', 'MSFT']].iloc[500:700]):
+        engine.on_realtime(df_bar)
+    generation = engine.store().generation
+    engine.on_add('TOST', df_price.iloc[:700])
+    assert (engine.store().generation == generation) != missing
+    for df_bar in bar_frames(df_price.iloc[700:]):
+        engine.on_realtime(df_bar)
+
+    full = server.strategy_engine(server.genReport(), configs)
+    full.on_historical(df_price)
+    for name in configs:
+        snapshot, expected = engine.store(name).snapshot, full.store(name).snapshot
+        pd.testing.assert_frame_equal(snapshot.report_content, expected.report_content, check_exact=True)
+        np.testing.assert_array_equal(snapshot.report_offsets, expected.report_offsets)
+        totals, _, _ = snapshot.pnl_index.range(df_price.index[0], df_price.index[-1])
+        expected_totals, _, _ = expected.pnl_index.range(df_price.index[0], df_price.index[-1])
+        for field, values in expected_totals.items():
+            np.testing.assert_allclose(totals[field], values, rtol=1e-9)
+
+def test_sharded_matches_serial():
+    df_price = price_frame(tickers=['T{}'.format(i) for i in range(8)], days=3)
+    shards = server.strategy_shards(2)
+    try:
+        sharded = server.trading_strategy(shards).run(df_price)
+    finally:
+        shards.executor.shutdown()
+    serial = server.trading_strategy().run(df_price)
+
+    for df_sharded, df_serial in zip(sharded, serial):
+        pd.testing.assert_frame_equal(df_sharded, df_serial, check_exact=True)
+
+
+def test_report_built_on_demand_outside_the_locks(df_price):
+    controller = server.controller(list(df_price.columns), 5)
+    controller.database.listeners.remove(controller.strategy_engine)  # the reports are left to ensure_report
+    controller.database.session = source1_stub(df_price.iloc[:400])
+    controller.database.quote_fetcher = source2_stub(df_price.iloc[400:])
+    controller.database.fetch_price_historical()
+    report_store = controller.report_store
+    prepare = controller.strategy_engine.prepare
+    locks = []
+
+    def prepare_during_a_bar(df_price_raw):
+        # a bar comes in during the first build: it is built again from the price database with the bar
+        locks.append((controller.database.lock.locked(), controller.database.listener_lock.locked()))
+        engine = prepare(df_price_raw)
+        if len(locks) == 1:
+            controller.database.append_realtime_price()
+        return engine
+
+    controller.strategy_engine.prepare = prepare_during_a_bar
+    rows = controller.query_data(df_price.index[400])
+
+    assert locks == [(False, False), (False, False)]
+    assert controller.report_store is report_store and report_store.snapshot.report_times[-1] == df_price.index[400]
+    assert rows == loaded_controller(df_price.iloc[:401], n_historical=401).query_data(df_price.index[400])
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import server
+from conftest import price_frame, source1_stub
+
+
+def report_rows(df_price):
+    store = server.report_store(server.trading_strategy(), server.genReport())
+    store.on_historical(df_price)
+
+    return store.snapshot.report_content
+
+
+def test_appends_only_new_rows(tmp_path):
+    df_report = report_rows(price_frame(days=3))
+    half = df_report['datetime'].values[len(df_report) // 2]
+    writer = server.report_writer(tmp_path, 'both')
+    writer.save(df_report[df_report['datetime'] <= half], generation=1)
+    writer.save(df_report, generation=1)
+
+    df_csv = pd.read_csv(tmp_path / 'report.csv')
+    assert len(df_csv) == len(df_report)
+    df_binary = server.report_writer.load_binary(tmp_path / 'report_bin')
+    pd.testing.assert_frame_equal(df_binary.assign(ticker=df_binary['ticker'].astype(object)), df_report)
+
+
+def test_rewrite_keeps_mapped_files_readable(tmp_path):
+    df_report = report_rows(price_frame(days=3))
+    writer = server.report_writer(tmp_path, 'binary')
+    writer.save(df_report, generation=1)
+    df_mapped = server.report_writer.load_binary(tmp_path / 'report_bin')
+
+    # a rebuilt report with fewer rows must not truncate the files mapped above
+    writer.save(df_report.iloc[:10], generation=2)
+    assert df_mapped['pnl'].sum() == df_report['pnl'].sum()
+    assert len(server.report_writer.load_binary(tmp_path / 'report_bin')) == 10
+
+
+def test_wide_layout_adds_columns_of_new_tickers(tmp_path):
+    df_price = price_frame(tickers=('AAPL', 'MSFT', 'TOST'), days=3)
+    df_report = report_rows(df_price)
+    half = df_report['datetime'].values[len(df_report) // 2]
+    writer = server.report_writer(tmp_path, 'csv', 'wide')
+    df_first = df_report[(df_report['datetime'] <= half) & (df_report['ticker'] != 'TOST')]
+    writer.save(df_first, generation=1)
+    writer.save(df_report, generation=1)
+
+    df_csv = pd.read_csv(tmp_path / 'report.csv', header=[0, 1], index_col=0)
+    assert list(df_csv['price'].columns) == ['AAPL', 'MSFT', 'TOST']
+    assert len(df_csv) == df_report['datetime'].nunique()
+    n_first = df_first['datetime'].nunique()
+    assert df_csv['price']['TOST'].iloc[:n_first].isna().all()
+    np.testing.assert_array_equal(df_csv['price']['TOST'].iloc[n_first:].values,
+                                  df_report[(df_report['datetime'] > half) & (df_report['ticker'] == 'TOST')]['price'])
+
+
+def test_saved_snapshot_matches_full_run(tmp_path):
+    df_price = price_frame(days=4)
+    cwd = os.getcwd()
+    for directory, latest in (('snapshot', True), ('full', False)):
+        (tmp_path / directory).mkdir()
+        os.chdir(tmp_path / directory)
+        try:
+            controller = server.controller(list(df_price.columns), 5)
+            controller.database.session = source1_stub(df_price)
+            controller.database.fetch_price_historical()
+            controller.generate_report(latest=latest, save=True)
+        finally:
+            os.chdir(cwd)
+
+    assert (tmp_path / 'snapshot' / 'report.csv').read_bytes() == (tmp_path / 'full' / 'report.csv').read_bytes()
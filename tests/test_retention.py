@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+from conftest import price_frame, source1_stub, source2_stub
+
+
+def run_server(directory, df_price, n_historical, **retention):
+    """
+    load the first bars as the historical price, append the others as real-time bars and save the report in
+    directory
+
+    :return: controller
+    """
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        controller = server.controller(list(df_price.columns), 5, **retention)
+        controller.database.session = source1_stub(df_price.iloc[:n_historical])
+        controller.database.quote_fetcher = source2_stub(df_price.iloc[n_historical:])
+        controller.database.fetch_price_historical()
+        for _ in range(len(df_price) - n_historical):
+            controller.database.append_realtime_price()
+        controller.generate_report(latest=True, save=True)
+    finally:
+        os.chdir(cwd)
+
+    return controller
+
+
+@pytest.mark.parametrize('report_layout', ['long', 'wide'])
+def test_report_csv_keeps_every_row(tmp_path, report_layout):
+    df_price = price_frame(days=8)
+    (tmp_path / 'full').mkdir()
+    (tmp_path / 'retained').mkdir()
+    full = run_server(tmp_path / 'full', df_price, 400, report_layout=report_layout)
+    retained = run_server(tmp_path / 'retained', df_price, 400, report_layout=report_layout, retention_hot=26,
+                          retention_warm=12, warm_sampling=60)
+
+    # memory is bounded, the report on disk is not
+    assert retained.report_store.snapshot.size < full.report_store.snapshot.size / 2
+    # saved bar by bar before every compaction, or at once from the full report: same file
+    assert (tmp_path / 'retained' / 'report.csv').read_bytes() == (tmp_path / 'full' / 'report.csv').read_bytes()
+    if report_layout == 'wide':
+        df_retained = pd.read_csv(tmp_path / 'retained' / 'report.csv', header=[0, 1], index_col=0)
+        assert len(df_retained) == len(full.report_store.snapshot.report_times)
+    else:
+        df_retained = pd.read_csv(tmp_path / 'retained' / 'report.csv')
+        assert len(df_retained) == full.report_store.snapshot.size
+
+    if report_layout == 'long':
+        pnl = df_retained.groupby('ticker')['pnl'].sum()
+        expected = full.report_store.snapshot.report_content.groupby('ticker')['pnl'].sum()
+        np.testing.assert_allclose(pnl[expected.index].values, expected.values, atol=1e-6)
+        # range queries reaching back to the evicted rows include their totals
+        _, totals, first_time, last_time = retained.query_range(df_price.index[0], df_price.index[-1])
+        _, expected_totals, expected_first, expected_last = full.query_range(df_price.index[0], df_price.index[-1])
+        assert (first_time, last_time) == (expected_first, expected_last)
+        for field, values in expected_totals.items():
+            np.testing.assert_allclose(totals[field], values, rtol=1e-9, atol=1e-9)
+        _, totals, first_time, _ = retained.query_range(retained.report_store.evicted_until, df_price.index[-1])
+        assert first_time == expected_first
+        np.testing.assert_allclose(totals['pnl'], expected_totals['pnl'], rtol=1e-9, atol=1e-9)
+
+
+def test_delete_under_retention_keeps_saved_rows(tmp_path):
+    df_price = price_frame(days=8)
+    controller = run_server(tmp_path, df_price, 400, retention_hot=26, retention_warm=12, warm_sampling=60)
+    rows = len(pd.read_csv(tmp_path / 'report.csv'))
+
+    controller.delete_ticker('MSFT')
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        controller.generate_report(latest=True, save=True)
+    finally:
+        os.chdir(cwd)
+
+    # the compacted report is not written over the saved rows
+    assert len(pd.read_csv(tmp_path / 'report.csv')) == rows
+
+
+def test_add_under_retention_keeps_other_rows(tmp_path):
+    # the added ticker's rows are computed from its own bars, the other tickers' rows are left as they are: same
+    # report as a server that had the ticker from the start
+    df_price = price_frame(tickers=('AAPL', 'MSFT', 'TOST', 'NVDA'), days=8)
+    retention = {'retention_hot': 26, 'retention_warm': 12, 'warm_sampling': 60}
+    expected = run_server(tmp_path, df_price.iloc[:1000], 400, **retention).report_store
+
+    controller = server.controller(['AAPL', 'MSFT', 'TOST'], 5, **retention)
+    controller.database.session = source1_stub(df_price.iloc[:400])
+    controller.database.quote_fetcher = source2_stub(df_price.iloc[400:])
+    controller.database.fetch_price_historical()
+    for _ in range(500):
+        controller.database.append_realtime_price()
+    store = controller.report_store
+    assert store.evicted_until is not None
+    df_before = store.snapshot.report_content
+
+    controller.database.session = source1_stub(df_price.iloc[:900])
+    controller.add_ticker('NVDA')
+    df_after = store.snapshot.report_content
+    pd.testing.assert_frame_equal(df_after[df_after['ticker'] != 'NVDA'].reset_index(drop=True), df_before,
+                                  check_exact=True)
+    for _ in range(100):
+        controller.database.append_realtime_price()
+
+    pd.testing.assert_frame_equal(store.snapshot.report_content, expected.snapshot.report_content, check_exact=True)
+    totals, _, _ = store.snapshot.pnl_index.range(df_price.index[0], df_price.index[-1])
+    expected_totals, _, _ = expected.snapshot.pnl_index.range(df_price.index[0], df_price.index[-1])
+    for field, values in expected_totals.items():
+        np.testing.assert_allclose(totals[field], values, rtol=1e-9, atol=1e-9)
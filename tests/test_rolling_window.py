@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+from conftest import price_frame
+
+
+def stream(df_price, rolling_period, min_periods):
+    """
+    rolling mean and std of every bar from rolling_window
+    """
+
+    window = server.rolling_window(len(df_price.columns), rolling_period, min_periods)
+    stats = [window.update(time, row) for time, row in zip(df_price.index, df_price.values)]
+
+    return np.array([mean for mean, _ in stats]), np.array([std for _, std in stats])
+
+
+@pytest.mark.parametrize('rolling_period, min_periods', [('24h', 15), ('2h', 1), ('30min', 3)])
+def test_matches_pandas_rolling(rolling_period, min_periods):
+    df_price = price_frame(days=4)
+    mean, std = stream(df_price, rolling_period, min_periods)
+
+    rolling = df_price.rolling(rolling_period, min_periods=min_periods)
+    np.testing.assert_array_equal(mean, rolling.mean().values)
+    np.testing.assert_array_equal(std, rolling.std().values)
+
+
+def test_matches_pandas_rolling_special_values():
+    # constant stretches, negative prices, missing prices and a gap longer than the window (accumulators reset)
+    df_price = price_frame(days=2)
+    df_price.iloc[50:110, 0] = 42.5
+    df_price.iloc[:, 1] -= 150
+    df_price.iloc[150:160, 2] = np.nan
+    df_price.index = df_price.index.where(df_price.index < df_price.index[250], df_price.index + pd.Timedelta('3D'))
+    mean, std = stream(df_price, '24h', 15)
+
+    rolling = df_price.rolling('24h', min_periods=15)
+    np.testing.assert_array_equal(mean, rolling.mean().values)
+    np.testing.assert_array_equal(std, rolling.std().values)
+
+
+def test_drop_keeps_other_tickers():
+    df_price = price_frame(tickers=('A', 'B', 'C'), days=2)
+    window = server.rolling_window(3, '24h', 15)
+    for time, row in zip(df_price.index[:300], df_price.values[:300]):
+        window.update(time, row)
+    window.drop([0, 2])
+    stats = [window.update(time, row[[0, 2]]) for time, row in zip(df_price.index[300:], df_price.values[300:])]
+
+    rolling = df_price[['A', 'C']].rolling('24h', min_periods=15)
+    np.testing.assert_array_equal(np.array([mean for mean, _ in stats]), rolling.mean().values[300:])
+    np.testing.assert_array_equal(np.array([std for _, std in stats]), rolling.std().values[300:])
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+from conftest import price_frame
+
+
+class stand_in:
+    """
+    local stand-in for Source 1 (csv history under /query) and Source 2 (json quotes under /quote)
+
+    # NOPE is not a ticker, DOWN answers with a server error and SLOW quotes take "slow" seconds. Every request
+    # waits "delay" seconds, the arrival times and the requests in flight are recorded
+    """
+
+    def __init__(self, df_price, delay=0.0, slow=3.0):
+        self.df_price = df_price
+        self.quotes = {}  # ticker: (time, price) of its quote
+        self.delay = delay
+        self.slow = slow
+        self.arrivals = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                self.answer(handler)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def answer(self, handler):
+        url = urlparse(handler.path)
+        ticker = parse_qs(url.query)['symbol'][0]
+        with self.lock:
+            self.arrivals.append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay + (self.slow if ticker == 'SLOW' else 0))
+            status, body, content_type = 200, b'{"Error Message": "Invalid API call"}', 'application/json'
+            if ticker == 'DOWN':
+                status, body, content_type = 500, b'internal error', 'text/plain'
+            elif url.path.strip('/') == 'query' and ticker in self.df_price.columns:
+                df = pd.DataFrame({'time': self.df_price.index.strftime('%Y-%m-%d %H:%M:%S'), 'open': 1, 'high': 1,
+                                   'low': 1, 'close': self.df_price[ticker].values, 'volume': 100})
+                body, content_type = df.iloc[::-1].to_csv(index=False).encode(), 'text/csv'
+            elif url.path.strip('/') == 'quote' and ticker in self.quotes:
+                quote_time, price = self.quotes[ticker]
+                body = json.dumps({'c': price, 't': int(quote_time.timestamp())}).encode()
+            handler.send_response(status)
+            handler.send_header('Content-Type', content_type)
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        except ConnectionError:  # the client gave up waiting (quote timeout)
+            pass
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def source():
+    source = stand_in(price_frame(days=2))
+    yield source
+    source.close()
+
+
+def test_backfill_isolates_failed_tickers(source):
+    db = server.database(['AAPL', 'NOPE', 'MSFT', 'DOWN'], 5, source1_url=source.url + '/query')
+    db.fetch_price_historical()
+
+    assert db.tickers == ['AAPL', 'MSFT']
+    assert db.failed_tickers == {'NOPE': 'invalid ticker', 'DOWN': 'database error (source 1)!'}
+    pd.testing.assert_frame_equal(db.get_price(False), source.df_price[['AAPL', 'MSFT']], check_names=False,
+                                  check_freq=False)
+
+
+def test_backfill_of_invalid_tickers_only_fails(source):
+    db = server.database(['NOPE'], 5, source1_url=source.url + '/query')
+
+    with pytest.raises(Exception, match='invalid ticker'):
+        db.fetch_price_historical()
+
+
+def test_backfill_downloads_concurrently(source):
+    source.delay = 0.2
+    tickers = ['AAPL', 'MSFT', 'TOST'] * 2
+    db = server.database(tickers, 5, fetch_workers=3, source1_url=source.url + '/query')
+    db.fetch_ticker_source1 = lambda ticker: server.database.fetch_source1(ticker, 5, 'key', db.session,
+                                                                           db.source1_url)
+    start = time.monotonic()
+    fetched, failed = db.fetch_source1_concurrent(tickers)
+
+    assert source.max_in_flight == 3
+    assert time.monotonic() - start < 0.2 * len(tickers)
+    assert failed == {} and sorted(fetched) == ['AAPL', 'MSFT', 'TOST']
+
+
+def test_rate_limit_spreads_the_calls(source):
+    db = server.database(['AAPL', 'MSFT', 'TOST', 'NOPE', 'DOWN'], 5, source1_rate_limit=600,
+                         source1_url=source.url + '/query')
+    db.fetch_price_historical()
+
+    # 600 calls per minute: one every 0.1 s, whatever the number of fetch workers
+    gaps = np.diff(sorted(source.arrivals))
+    assert len(gaps) == 4 and gaps.min() > 0.08
+
+
+def test_rate_limiter_is_shared_by_threads():
+    limiter = server.rate_limiter(1200)
+    calls = []
+    threads = [threading.Thread(target=lambda: (limiter.wait(), calls.append(time.monotonic()))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert np.diff(sorted(calls)).min() > 0.04
+    assert server.rate_limiter(None).interval == 0
+
+
+def test_slow_quotes_are_left_out_of_the_tick(source):
+    quote_time = pd.Timestamp('2023-01-04 20:05').to_pydatetime()
+    source.quotes = {'AAPL': (quote_time, 101.5), 'MSFT': (quote_time, 201.25), 'SLOW': (quote_time, 1.0)}
+    source.delay = 0.1
+    fetcher = server.quote_fetcher('key', workers=4, timeout=0.5, url=source.url)
+    start = time.monotonic()
+    fetched, failed = fetcher.fetch(['AAPL', 'MSFT', 'SLOW', 'NOPE'])
+
+    assert time.monotonic() - start < source.slow
+    assert sorted(fetched) == ['AAPL', 'MSFT']
+    assert fetched['AAPL'].to_dict('list') == {'time': [quote_time], 'AAPL': [101.5]}
+    # left out by the tick's wait or by the request's own read timeout, whichever comes first
+    assert 'timed out' in failed['SLOW'] and 'NOPE' in failed
+    assert source.max_in_flight > 1
+
+
+def test_realtime_bar_is_one_aligned_row(source):
+    db = server.database(['AAPL', 'MSFT', 'TOST'], 5, source1_url=source.url + '/query', quote_timeout=2,
+                         source2_url=source.url)
+    db.fetch_price_historical()
+    latest = db.latest_time
+    source.quotes = {'AAPL': ((latest + pd.Timedelta(minutes=5)).to_pydatetime(), 101.5),
+                     'MSFT': ((latest + pd.Timedelta(minutes=4)).to_pydatetime(), 201.25)}
+    db.append_realtime_price()
+
+    df_price = db.get_price(True)
+    assert df_price.index[-1] == latest + pd.Timedelta(minutes=5)
+    # MSFT's slightly older quote is part of the bar, TOST without a quote keeps its previous price
+    assert df_price.iloc[-1].tolist() == [101.5, 201.25, df_price['TOST'].iloc[-2]]
@@ -0,0 +1,62 @@
+import socket
+
+import pytest
+
+import server
+from conftest import frame_client, loaded_controller, price_frame, serve
+
+
+def test_slow_subscriber_gets_the_newest_pushes():
+    client_subscription = server.subscription(None, max_pending=2, max_dropped=3)
+    for frame in (b'1', b'2', b'3'):
+        assert client_subscription.offer(frame)
+
+    assert client_subscription.dropped == 1
+    assert client_subscription.take() == [b'2', b'3']
+
+
+def test_subscriber_falling_behind_is_unsubscribed():
+    hub = server.subscription_hub(None, server.client_parser())
+    client_subscription = server.subscription(None, max_pending=2, max_dropped=3)
+    hub.add(client_subscription)
+    for i in range(5):
+        hub.publish('2023-01-03-12:00', {'AAPL': 'AAPL   1.0,1,0.0'})
+        assert hub.subscriptions == [client_subscription]
+
+    # the 4th dropped push closes the subscription and the hub forgets it
+    hub.publish('2023-01-03-12:00', {'AAPL': 'AAPL   1.0,1,0.0'})
+    assert client_subscription.closed and client_subscription.dropped == 4
+    assert hub.subscriptions == []
+    assert not client_subscription.offer(b'late')
+    assert client_subscription.take() == []
+
+
+@pytest.mark.parametrize('mode', ['thread', 'asyncio'])
+def test_subscribers_get_the_rows_of_new_bars(mode):
+    controller = loaded_controller(price_frame(days=3))
+    communication, port = serve(controller, mode)
+    client = frame_client(port)
+    try:
+        client.send('subscribe AAPL TOST', 1)
+        assert client.receive() == {'id': 1, 'result': 'subscribed to AAPL, TOST'}
+        client.send('subscribe NOPE', 2)
+        assert client.receive() == {'id': 2, 'error': 'ticker not found: NOPE'}
+
+        for _ in range(2):
+            controller.database.append_realtime_price()
+            df_rows = controller.report_store.latest_rows
+            push = client.receive()
+            assert push['push'] == 'bar'
+            assert push['datetime'] == df_rows['datetime'].iloc[0].strftime('%Y-%m-%d-%H:%M')
+            assert push['rows'] == ['{}   {},{},{}'.format(row.ticker, row.price, row.signal, row.pnl)
+                                    for row in df_rows.itertuples() if row.ticker in ('AAPL', 'TOST')]
+
+        client.send('unsubscribe', 3)
+        assert client.receive() == {'id': 3, 'result': 'unsubscribed'}
+        assert communication.subscription_hub.subscriptions == []
+        controller.database.append_realtime_price()
+        client.sock.settimeout(0.5)
+        with pytest.raises(socket.timeout):
+            client.receive()
+    finally:
+        client.close()